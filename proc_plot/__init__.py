@@ -10,18 +10,57 @@ from .pp import add_grouping_rule, \
                 remove_grouping_rules, \
                 print_grouping_rules, \
                 load_grouping_template, \
-                set_dataframe, show, \
+                set_dataframe, set_long_dataframe, show, \
+                compression_report, \
+                set_source, open_csv, open_excel, open_historian, \
+                define_tag, \
                 set_legend_fontsize, \
-                set_legend_loc
+                set_legend_loc, \
+                set_max_points, \
+                set_active_tolerance, \
+                start_trace, stop_trace, \
+                set_render_backend, \
+                loop_health, loop_kpis, set_kpi_options, \
+                set_overview_visible, \
+                show_histogram, show_density, show_heatmap, \
+                set_events, set_event_filter, find_correlated, \
+                set_dataframe_async, find_condition_async, run_in_thread
+from .remote import show_remote
 
 __all__ = ['add_grouping_rule',
            'remove_grouping_rules',
            'print_grouping_rules',
            'load_grouping_template',
            'set_dataframe',
+           'set_long_dataframe',
+           'compression_report',
+           'set_source',
+           'open_csv',
+           'open_excel',
+           'open_historian',
+           'define_tag',
            'show',
            'set_legend_fontsize',
-           'set_legend_loc']
+           'set_legend_loc',
+           'set_max_points',
+           'set_active_tolerance',
+           'start_trace',
+           'stop_trace',
+           'set_render_backend',
+           'loop_health',
+           'loop_kpis',
+           'set_kpi_options',
+           'set_overview_visible',
+           'show_histogram',
+           'show_density',
+           'show_heatmap',
+           'set_events',
+           'set_event_filter',
+           'find_correlated',
+           'set_dataframe_async',
+           'find_condition_async',
+           'run_in_thread',
+           'show_remote']
 
 
 #show = proc_plot.pp.show
@@ -0,0 +1,542 @@
+'''
+Rendering backends.
+
+PlotManager does not draw anything itself, it talks to a RenderBackend that
+manages the axes, lines, cursor and layout.  MatplotlibBackend is the default.
+PyqtgraphBackend uses pyqtgraph (if it is installed) which renders dense lines
+much faster than matplotlib's Agg and stays responsive with tens of millions
+of points.
+
+Axes and lines are handles that only the backend understands (for
+MatplotlibBackend they are matplotlib Axes and Line2D objects).
+'''
+
+from PyQt5 import QtCore
+from PyQt5.QtCore import QObject
+from PyQt5.QtWidgets import (
+        QWidget,
+        QVBoxLayout,
+        QHBoxLayout,
+        QPushButton,)
+
+import matplotlib
+import matplotlib.colors
+import matplotlib.dates
+import matplotlib.gridspec
+import numpy
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.widgets import MultiCursor
+
+try:
+    import pyqtgraph
+except ImportError:
+    pyqtgraph = None
+
+
+class RenderBackend(QObject):
+    '''
+    Interface to the library that draws the plots.
+
+    Attributes:
+    -----------
+    widget : QWidget
+        widget that shows the plots
+    decimates : bool
+        True if the backend decimates lines itself, then PlotManager passes
+        all the data
+
+    Signals:
+    --------
+    home_zoom : QtCore.Signal()
+        the user wants to zoom out to all data
+    xlim_changed : QtCore.Signal()
+        the xlim of an axes changed
+    mouse_moved : QtCore.Signal(float)
+        the mouse moved over an axes, x position in data units
+    '''
+
+    home_zoom = QtCore.Signal()
+    xlim_changed = QtCore.Signal()
+    mouse_moved = QtCore.Signal(float)
+
+    name = None
+    decimates = False
+
+    def __init__(self,parent=None):
+        QObject.__init__(self,parent)
+        self.widget = None
+
+    # --- axes and layout --------------------------------------------------
+    def add_axes(self,label,sharex=None):
+        '''
+        Add axes below the existing axes.  Returns the axes.
+        '''
+        raise NotImplementedError
+
+    def remove_axes(self,ax):
+        '''
+        Remove axes, the other axes fill the space.
+        '''
+        raise NotImplementedError
+
+    def clear(self):
+        '''
+        Remove all axes.
+        '''
+        raise NotImplementedError
+
+    def clear_axes(self,ax):
+        '''
+        Remove all lines from the axes.
+        '''
+        raise NotImplementedError
+
+    def set_datetime(self,ax,tz=None):
+        '''
+        Show x values (matplotlib date numbers) as dates.
+        '''
+        raise NotImplementedError
+
+    def tight_layout(self):
+        pass
+
+    # --- lines -------------------------------------------------------------
+    def plot(self,ax,x,y,color=None,label=None,linestyle='-',linewidth=None,
+             scalex=True):
+        '''
+        Plot a line.  Returns the line.
+        '''
+        raise NotImplementedError
+
+    def set_line_data(self,line,x,y):
+        raise NotImplementedError
+
+    def line_color(self,line):
+        '''
+        matplotlib color of the line
+        '''
+        raise NotImplementedError
+
+    def legend(self,ax,loc,fontsize):
+        raise NotImplementedError
+
+    # --- events ------------------------------------------------------------
+    def set_events(self,ax,handle,x0,x1,color):
+        '''
+        Draw events over the full height of the axes: lines where x0 == x1
+        and spans from x0 to x1 for the others.  They replace the events
+        drawn before (handle, None if there are none).  Returns a handle.
+        Backends that can't draw events return None.
+        '''
+        return None
+
+    # --- limits ------------------------------------------------------------
+    def get_xlim(self,ax):
+        raise NotImplementedError
+
+    def set_xlim(self,ax,xmin,xmax):
+        raise NotImplementedError
+
+    def get_ylim(self,ax):
+        raise NotImplementedError
+
+    def set_ylim(self,ax,ymin,ymax):
+        raise NotImplementedError
+
+    def autoscale_x(self,ax):
+        '''
+        Set the xlim to fit the data on the axes.
+        '''
+        raise NotImplementedError
+
+    # --- cursor and navigation ---------------------------------------------
+    def set_cursor(self,axes):
+        '''
+        Show a vertical cursor over all the axes in the list.
+        '''
+        raise NotImplementedError
+
+    def reset_navigation(self):
+        '''
+        Forget the zoom history.
+        '''
+        pass
+
+    def draw(self,idle=False):
+        '''
+        Redraw the plots.  If idle, the plots are redrawn when Qt is idle.
+        '''
+        raise NotImplementedError
+
+
+class MatplotlibBackend(RenderBackend):
+    '''
+    Render with matplotlib in a PlotWindow.
+    '''
+
+    name = 'matplotlib'
+
+    def __init__(self,window,parent=None):
+        '''
+        Parameters:
+        -----------
+        window : PlotWindow
+            window with a matplotlib figure, canvas and toolbar
+        '''
+        RenderBackend.__init__(self,parent)
+        self.widget = window
+        self.fig = window.fig
+        self.canvas = window.canvas
+        self.toolbar = window.toolbar
+        window.home_zoom_signal.connect(self.home_zoom)
+        self.canvas.mpl_connect('motion_notify_event',self._mouse_moved)
+
+        self._axes = []
+        self.cur = None
+
+    def _mouse_moved(self,event):
+        if event.inaxes in self._axes and event.xdata is not None:
+            self.mouse_moved.emit(event.xdata)
+
+    def _xlim_changed(self,ax):
+        self.xlim_changed.emit()
+
+    def _set_positions(self):
+        nplots = len(self._axes)
+        if nplots == 0:
+            return
+        gs = matplotlib.gridspec.GridSpec(nplots,1)
+        for i in range(nplots):
+            self._axes[i].set_position( gs[i].get_position(self.fig) )
+            self._axes[i].set_subplotspec( gs[i] )
+
+    def add_axes(self,label,sharex=None):
+        nplots = len(self._axes)
+
+        # resize existing axes
+        gs = matplotlib.gridspec.GridSpec(nplots+1,1)
+        for i in range(nplots):
+            self._axes[i].set_position( gs[i].get_position(self.fig) )
+            self._axes[i].set_subplotspec( gs[i] )
+
+        ax = self.fig.add_subplot(
+            nplots+1,1,nplots+1,
+            label=label,
+            sharex=sharex
+        )
+        ax.callbacks.connect('xlim_changed',self._xlim_changed)
+
+        for a in self._axes:
+            a.tick_params(labelbottom=False)
+
+        self._axes.append(ax)
+        return ax
+
+    def remove_axes(self,ax):
+        ax.remove()
+        self._axes.remove(ax)
+        self._set_positions()
+        if len(self._axes) > 0:
+            self._axes[-1].tick_params(labelbottom=True)
+
+    def clear(self):
+        self._axes.clear()
+        self.cur = None
+        self.fig.clear()
+
+    def clear_axes(self,ax):
+        ax.clear()
+        # clearing the axes removes the callbacks
+        ax.callbacks.connect('xlim_changed',self._xlim_changed)
+
+    def set_datetime(self,ax,tz=None):
+        ax.xaxis_date(tz)
+
+    def tight_layout(self):
+        self.fig.tight_layout()
+
+    def plot(self,ax,x,y,color=None,label=None,linestyle='-',linewidth=None,
+             scalex=True):
+        line, = ax.plot(x,y,
+                        color=color,
+                        label=label,
+                        linestyle=linestyle,
+                        linewidth=linewidth,
+                        scalex=scalex)
+        return line
+
+    def set_line_data(self,line,x,y):
+        line.set_data(x,y)
+
+    def line_color(self,line):
+        return line.get_color()
+
+    def legend(self,ax,loc,fontsize):
+        ax.legend(loc=loc,fontsize=fontsize)
+
+    def set_events(self,ax,handle,x0,x1,color):
+        # one collection for all the lines and one for all the spans, x in
+        # data units and y in axes units
+        if handle is None:
+            trans = ax.get_xaxis_transform()
+            lines = LineCollection([],colors=color,linewidths=0.8,alpha=0.7,
+                                   transform=trans,zorder=1)
+            spans = PolyCollection([],facecolors=color,edgecolors='none',
+                                   alpha=0.2,transform=trans,zorder=0)
+            ax.add_collection(lines,autolim=False)
+            ax.add_collection(spans,autolim=False)
+            handle = (lines,spans)
+        lines,spans = handle
+        point = x0 == x1
+        x = x0[point]
+        segments = numpy.empty((len(x),2,2))
+        segments[:,:,0] = x[:,None]
+        segments[:,:,1] = (0,1)
+        lines.set_segments(segments)
+        a, b = x0[~point], x1[~point]
+        verts = numpy.empty((len(a),4,2))
+        verts[:,:,0] = numpy.stack((a,a,b,b),axis=1)
+        verts[:,:,1] = (0,1,1,0)
+        spans.set_verts(verts)
+        return handle
+
+    def get_xlim(self,ax):
+        return ax.get_xlim()
+
+    def set_xlim(self,ax,xmin,xmax):
+        ax.set_xlim(xmin,xmax)
+
+    def get_ylim(self,ax):
+        return ax.get_ylim()
+
+    def set_ylim(self,ax,ymin,ymax):
+        ax.set_ylim(ymin,ymax)
+
+    def autoscale_x(self,ax):
+        ax.autoscale(axis='x',tight=True)
+
+    def set_cursor(self,axes):
+        if len(axes) == 0:
+            self.cur = None
+            return
+
+        # Multicursor screws with ylims, save all the ylims and restore them
+        # later
+        ylims = [ a.get_ylim() for a in axes ]
+
+        try:
+            self.cur = MultiCursor(axes,lw=1,color='red')
+        except TypeError:
+            # matplotlib < 3.11 takes the (unused) canvas first
+            self.cur = MultiCursor(None,axes,lw=1,color='red')
+
+        for a,yl in zip(axes,ylims):
+            a.set_ylim(yl)
+
+    def reset_navigation(self):
+        self.toolbar._nav_stack.clear()
+
+    def draw(self,idle=False):
+        if idle:
+            self.canvas.draw_idle()
+        else:
+            self.canvas.draw()
+
+
+if pyqtgraph is not None:
+    class _DateAxisItem(pyqtgraph.AxisItem):
+        '''
+        Axis that shows matplotlib date numbers as dates.
+        '''
+        def __init__(self,tz=None,**kwargs):
+            pyqtgraph.AxisItem.__init__(self,**kwargs)
+            self.tz = tz
+
+        def tickStrings(self,values,scale,spacing):
+            if spacing >= 1:
+                fmt = '%Y-%m-%d'
+            elif spacing >= 1/24.0:
+                fmt = '%m-%d %H:%M'
+            elif spacing >= 1/1440.0:
+                fmt = '%H:%M'
+            else:
+                fmt = '%H:%M:%S'
+            strings = []
+            for v in values:
+                try:
+                    d = matplotlib.dates.num2date(v,tz=self.tz)
+                    strings.append(d.strftime(fmt))
+                except (ValueError,OverflowError):
+                    strings.append('')
+            return strings
+
+
+class PyqtgraphBackend(RenderBackend):
+    '''
+    Render with pyqtgraph.  Lines are drawn with Qt's software rasteriser
+    (no GPU is needed) and pyqtgraph decimates them to the screen resolution
+    (peak downsampling) and clips them to the view, so PlotManager passes all
+    the data.
+    '''
+
+    name = 'pyqtgraph'
+    decimates = True
+
+    def __init__(self,parent=None):
+        if pyqtgraph is None:
+            raise ImportError("Install pyqtgraph to use the pyqtgraph backend: "
+                              "'pip install pyqtgraph'")
+        RenderBackend.__init__(self,parent)
+        pyqtgraph.setConfigOptions(antialias=False,
+                                   background='w',
+                                   foreground='k')
+
+        self.widget = QWidget()
+        self.layout_widget = pyqtgraph.GraphicsLayoutWidget()
+        home_button = QPushButton('Home')
+        home_button.clicked.connect(self.home_zoom)
+
+        buttons = QHBoxLayout()
+        buttons.addWidget(home_button)
+        buttons.addStretch(1)
+        layout = QVBoxLayout()
+        layout.addLayout(buttons)
+        layout.addWidget(self.layout_widget)
+        self.widget.setLayout(layout)
+
+        self._axes = []
+        self._cursor_lines = {} # axes: InfiniteLine
+        self._colors = {} # line: matplotlib color
+        self.layout_widget.scene().sigMouseMoved.connect(self._mouse_moved)
+
+    def _relayout(self):
+        self.layout_widget.ci.clear()
+        for i,ax in enumerate(self._axes):
+            self.layout_widget.ci.addItem(ax,row=i,col=0)
+            ax.getAxis('bottom').setStyle(showValues=(i == len(self._axes)-1))
+
+    def add_axes(self,label,sharex=None):
+        ax = pyqtgraph.PlotItem(name=label)
+        ax.showGrid(x=True,y=True,alpha=0.3)
+        ax.addLegend(offset=(5,5))
+        ax.setClipToView(True)
+        ax.setDownsampling(auto=True,mode='peak')
+        if sharex is not None:
+            ax.setXLink(sharex)
+        ax.sigXRangeChanged.connect(self._xlim_changed)
+        ax._ncolor = 0 # for the default color cycle
+
+        self._axes.append(ax)
+        self._relayout()
+        return ax
+
+    def _xlim_changed(self,*args):
+        self.xlim_changed.emit()
+
+    def remove_axes(self,ax):
+        self._axes.remove(ax)
+        self._cursor_lines.pop(ax,None)
+        self._relayout()
+
+    def clear(self):
+        self._axes.clear()
+        self._cursor_lines.clear()
+        self._colors.clear()
+        self.layout_widget.ci.clear()
+
+    def clear_axes(self,ax):
+        for item in ax.listDataItems():
+            self._colors.pop(item,None)
+        ax.clear()
+        ax._ncolor = 0
+        if ax in self._cursor_lines:
+            ax.addItem(self._cursor_lines[ax],ignoreBounds=True)
+
+    def set_datetime(self,ax,tz=None):
+        ax.setAxisItems({'bottom' : _DateAxisItem(tz,orientation='bottom')})
+        self._relayout()
+
+    def plot(self,ax,x,y,color=None,label=None,linestyle='-',linewidth=None,
+             scalex=True):
+        if color is None:
+            color = 'C{}'.format(ax._ncolor % 10)
+            ax._ncolor += 1
+        rgba = [ int(255*c) for c in matplotlib.colors.to_rgba(color) ]
+        style = QtCore.Qt.SolidLine if linestyle in ('-',None) \
+                else QtCore.Qt.DashLine
+        pen = pyqtgraph.mkPen(color=rgba,width=linewidth or 1,style=style)
+        line = ax.plot(x,y,pen=pen,name=label,connect='finite')
+        self._colors[line] = color
+        return line
+
+    def set_line_data(self,line,x,y):
+        line.setData(x,y)
+
+    def line_color(self,line):
+        return self._colors.get(line)
+
+    def legend(self,ax,loc,fontsize):
+        # the legend is updated when lines are added
+        pass
+
+    def set_events(self,ax,handle,x0,x1,color):
+        # PlotManager draws at most a few hundred events per axes
+        for item in handle or []:
+            ax.removeItem(item)
+        rgba = [ int(255*c) for c in matplotlib.colors.to_rgba(color) ]
+        items = []
+        for a,b in zip(x0,x1):
+            if a == b:
+                item = pyqtgraph.InfiniteLine(a,angle=90,movable=False,
+                                              pen=pyqtgraph.mkPen(rgba[:3]+[180]))
+            else:
+                item = pyqtgraph.LinearRegionItem((a,b),movable=False,
+                                                  brush=rgba[:3]+[50],
+                                                  pen=pyqtgraph.mkPen(None))
+            ax.addItem(item,ignoreBounds=True)
+            items.append(item)
+        return items
+
+    def get_xlim(self,ax):
+        return tuple(ax.viewRange()[0])
+
+    def set_xlim(self,ax,xmin,xmax):
+        ax.setXRange(xmin,xmax,padding=0)
+
+    def get_ylim(self,ax):
+        return tuple(ax.viewRange()[1])
+
+    def set_ylim(self,ax,ymin,ymax):
+        ax.setYRange(ymin,ymax,padding=0)
+
+    def autoscale_x(self,ax):
+        ax.enableAutoRange(axis='x')
+
+    def set_cursor(self,axes):
+        for ax,line in self._cursor_lines.items():
+            ax.removeItem(line)
+        self._cursor_lines.clear()
+        for ax in axes:
+            line = pyqtgraph.InfiniteLine(angle=90,movable=False,pen='r')
+            ax.addItem(line,ignoreBounds=True)
+            self._cursor_lines[ax] = line
+
+    def _mouse_moved(self,pos):
+        for ax in self._cursor_lines:
+            if ax.sceneBoundingRect().contains(pos):
+                x = ax.vb.mapSceneToView(pos).x()
+                for line in self._cursor_lines.values():
+                    line.setPos(x)
+                self.mouse_moved.emit(x)
+                break
+
+    def draw(self,idle=False):
+        # pyqtgraph redraws itself when items change
+        self.layout_widget.update()
+
+
+# Available backends: name: class
+backends = {
+    MatplotlibBackend.name : MatplotlibBackend,
+    PyqtgraphBackend.name : PyqtgraphBackend,
+}
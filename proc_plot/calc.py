@@ -0,0 +1,1195 @@
+'''
+Vectorised calculations on tag data (numpy arrays).
+
+All functions work on whole arrays and run in O(n), they do not loop over
+samples in Python.
+'''
+
+import numpy
+import pandas
+
+
+def window_samples(window,x,unit=86400.0):
+    '''
+    Convert a rolling window to a number of samples.
+
+    Parameters:
+    -----------
+    window : int or str or pandas.Timedelta
+        number of samples, or a time span (e.g. '5min') that is converted to
+        samples with the median sample interval of x
+    x : numpy.ndarray
+        time of the samples
+    unit : float, optional
+        seconds per unit of x, the default is for matplotlib date numbers
+        (days).  None if x is not time.
+
+    Returns:
+    --------
+    int
+    '''
+    if isinstance(window,(int,numpy.integer)):
+        n = int(window)
+    elif isinstance(window,str) and window.strip().isdigit():
+        n = int(window)
+    else:
+        if unit is None:
+            raise ValueError('Time span windows need a datetime index')
+        if len(x) < 2:
+            return 1
+        dt = numpy.median(numpy.diff(x))*unit
+        if not dt > 0:
+            raise ValueError('Cannot calculate the sample interval')
+        n = int(round(pandas.Timedelta(window).total_seconds() / dt))
+    if n < 1:
+        raise ValueError('Window must be at least one sample')
+    return n
+
+
+def hold(x,y,xnew):
+    '''
+    Values of y (sampled at x) at the times xnew with a zero-order hold: the
+    value at a time is the last sample at or before it.  NaN before the first
+    sample.
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        time of the samples (sorted)
+    y : numpy.ndarray
+        values
+    xnew : numpy.ndarray
+        times to get values at
+
+    Returns:
+    --------
+    numpy.ndarray
+    '''
+    xnew = numpy.asarray(xnew,dtype=float)
+    if len(y) == 0:
+        return numpy.full(xnew.shape,numpy.nan)
+    i = numpy.searchsorted(x,xnew,'right') - 1
+    ynew = numpy.asarray(y,dtype=float)[numpy.maximum(i,0)]
+    ynew[i < 0] = numpy.nan
+    return ynew
+
+
+def interp(x,y,xnew):
+    '''
+    Values of y (sampled at x) at the times xnew, interpolated linearly
+    between the samples.  Use this instead of hold for compressed tags, their
+    samples are the corners of straight lines.  NaN before the first sample
+    and the last value after the last sample, like hold.
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        time of the samples (sorted)
+    y : numpy.ndarray
+        values
+    xnew : numpy.ndarray
+        times to get values at
+
+    Returns:
+    --------
+    numpy.ndarray
+    '''
+    xnew = numpy.asarray(xnew,dtype=float)
+    if len(y) == 0:
+        return numpy.full(xnew.shape,numpy.nan)
+    return numpy.interp(xnew,x,numpy.asarray(y,dtype=float),left=numpy.nan)
+
+
+def runs(mask):
+    '''
+    Find the runs of True in a boolean array.
+
+    Returns:
+    --------
+    starts, ends : numpy.ndarray of int
+        run k is mask[starts[k]:ends[k]]
+    '''
+    m = numpy.zeros(len(mask)+2,dtype=numpy.int8)
+    m[1:-1] = mask
+    d = numpy.diff(m)
+    return numpy.flatnonzero(d == 1), numpy.flatnonzero(d == -1)
+
+
+def _rolling_sum(a,n):
+    '''
+    Sum of trailing windows of n samples (shorter windows at the start).
+    '''
+    c = numpy.cumsum(a)
+    s = c.copy()
+    s[n:] -= c[:-n]
+    return s
+
+
+def rolling_mean(y,n):
+    '''
+    Trailing moving average over n samples, NaNs are ignored.
+    '''
+    y = numpy.asarray(y,dtype=float)
+    valid = ~numpy.isnan(y)
+    count = _rolling_sum(valid.astype(float),n)
+    total = _rolling_sum(numpy.where(valid,y,0.0),n)
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        return total / numpy.where(count > 0,count,numpy.nan)
+
+
+def rolling_std(y,n):
+    '''
+    Trailing moving standard deviation over n samples, NaNs are ignored.
+    Returns (mean, std).
+    '''
+    y = numpy.asarray(y,dtype=float)
+    valid = ~numpy.isnan(y)
+    # Remove the overall mean to limit cancellation in the sum of squares
+    offset = numpy.nanmean(y) if valid.any() else 0.0
+    d = numpy.where(valid,y-offset,0.0)
+    count = _rolling_sum(valid.astype(float),n)
+    total = _rolling_sum(d,n)
+    total2 = _rolling_sum(d*d,n)
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        count = numpy.where(count > 0,count,numpy.nan)
+        mean = total / count
+        meansq = total2 / count
+        var = meansq - mean*mean
+        # rounding errors of the running sums
+        var[var <= 1e-9*meansq] = 0.0
+    return mean + offset, numpy.sqrt(var)
+
+
+def _rolling_extreme(y,n,func,fill):
+    '''
+    van Herk/Gil-Werman running min/max: the data is split in blocks of n
+    samples, and every window is covered by the suffix of one block and the
+    prefix of the next.
+    '''
+    y = numpy.asarray(y,dtype=float)
+    nan = numpy.isnan(y)
+    npts = len(y)
+    if npts == 0:
+        return y.copy()
+
+    # pad in front for the first (short) windows, and at the back to fill the
+    # last block
+    nblocks = -(-(npts + n - 1) // n)
+    a = numpy.full(nblocks*n,fill)
+    a[n-1:n-1+npts] = numpy.where(nan,fill,y)
+    a = a.reshape(nblocks,n)
+
+    prefix = func.accumulate(a,axis=1).ravel()
+    suffix = func.accumulate(a[:,::-1],axis=1)[:,::-1].ravel()
+
+    # window that ends at sample i starts at i in the padded data
+    r = func(suffix[:npts],prefix[n-1:n-1+npts])
+    # windows with only NaNs
+    r[_rolling_sum((~nan).astype(float),n) == 0] = numpy.nan
+    return r
+
+
+def rolling_min(y,n):
+    '''
+    Trailing moving minimum over n samples, NaNs are ignored.
+    '''
+    return _rolling_extreme(y,n,numpy.minimum,numpy.inf)
+
+
+def rolling_max(y,n):
+    '''
+    Trailing moving maximum over n samples, NaNs are ignored.
+    '''
+    return _rolling_extreme(y,n,numpy.maximum,-numpy.inf)
+
+
+# Rolling statistics overlays: name: description
+ROLLING_KINDS = {
+    'mean' : 'Moving average',
+    'std' : 'Moving average +/- std',
+    'minmax' : 'Rolling min/max',
+}
+
+def rolling(y,n,kind):
+    '''
+    Calculate a rolling statistics overlay.
+
+    Parameters:
+    -----------
+    y : numpy.ndarray
+        data
+    n : int
+        window in samples
+    kind : str
+        one of ROLLING_KINDS
+
+    Returns:
+    --------
+    list of (label, numpy.ndarray)
+    '''
+    if kind == 'mean':
+        return [('mean',rolling_mean(y,n))]
+    elif kind == 'std':
+        mean,std = rolling_std(y,n)
+        return [('+std',mean+std),('-std',mean-std)]
+    elif kind == 'minmax':
+        return [('min',rolling_min(y,n)),('max',rolling_max(y,n))]
+    else:
+        raise ValueError('Unknown rolling statistic {}'.format(kind))
+
+
+def minmax_decimate(y,nbins):
+    '''
+    Select samples to plot so that the min and max of y in every bin are kept.
+    This preserves the envelope of the data (spikes are not lost) with at most
+    2*nbins+2 samples.
+
+    Parameters:
+    -----------
+    y : numpy.ndarray
+        data
+    nbins : int
+        number of bins
+
+    Returns:
+    --------
+    numpy.ndarray of int
+        sorted indices into y
+    '''
+    y = numpy.asarray(y,dtype=float)
+    npts = len(y)
+    if npts <= 2*nbins:
+        return numpy.arange(npts)
+
+    size = -(-npts // nbins)
+    nbins = -(-npts // size)
+    a = numpy.full(nbins*size,numpy.nan)
+    a[:npts] = y
+    a = a.reshape(nbins,size)
+
+    nan = numpy.isnan(a)
+    imin = numpy.argmin(numpy.where(nan,numpy.inf,a),axis=1)
+    imax = numpy.argmax(numpy.where(nan,-numpy.inf,a),axis=1)
+    offset = numpy.arange(nbins)*size
+
+    idx = numpy.concatenate(([0],imin+offset,imax+offset,[npts-1]))
+    idx = numpy.unique(idx)
+    return idx[idx < npts]
+
+
+def _fft_size(n):
+    '''
+    Smallest 2**i * 3**j * 5**k >= n, FFTs of these sizes are fast.
+    '''
+    best = 1 << (n-1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            q = -(-n // p35)
+            best = min(best,p35 << (q-1).bit_length())
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def xcorr(a,b,maxlag=None):
+    '''
+    Normalised cross-correlation of two signals with the same (uniform)
+    sampling, calculated with FFTs in O(n log n).  NaNs are replaced by the
+    mean.
+
+    corr[k] correlates a[i] with b[i+lags[k]], a peak at a positive lag means
+    that b follows a, e.g. a is an MV and b the CV it moves with dead time.
+
+    Parameters:
+    -----------
+    a, b : numpy.ndarray
+        signals of the same length
+    maxlag : int, optional
+        largest lag in samples, the default is len(a)-1
+
+    Returns:
+    --------
+    lags : numpy.ndarray of int
+        lags in samples, -maxlag to maxlag
+    corr : numpy.ndarray
+        correlation coefficient at each lag
+    '''
+    n = len(a)
+    if len(b) != n:
+        raise ValueError('Signals must have the same length')
+    if maxlag is None:
+        maxlag = n - 1
+    maxlag = min(maxlag,n-1)
+
+    def demean(y):
+        y = numpy.asarray(y,dtype=float)
+        valid = ~numpy.isnan(y)
+        return numpy.where(valid,y-numpy.mean(y[valid]),0.0) if valid.any() \
+            else numpy.zeros(n)
+    a = demean(a)
+    b = demean(b)
+
+    # zero padding to avoid wrapping around for lags up to maxlag
+    nfft = _fft_size(n + maxlag)
+    fa = numpy.fft.rfft(a,nfft)
+    fb = numpy.fft.rfft(b,nfft)
+    c = numpy.fft.irfft(numpy.conj(fa)*fb,nfft)
+
+    lags = numpy.arange(-maxlag,maxlag+1)
+    norm = numpy.sqrt(numpy.dot(a,a)*numpy.dot(b,b))
+    if norm > 0:
+        # negative lags are at the end
+        corr = numpy.concatenate((c[nfft-maxlag:],c[:maxlag+1])) / norm
+    else:
+        corr = numpy.full(len(lags),numpy.nan)
+    return lags, corr
+
+
+def column_means(x,y,edges):
+    '''
+    Mean of the samples in every column between edges, e.g. to draw a tag as
+    a row of pixels.  Columns without samples hold the last value before
+    them.
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        time of the samples (sorted)
+    y : numpy.ndarray
+        values
+    edges : numpy.ndarray
+        ncols+1 column edges (sorted)
+
+    Returns:
+    --------
+    numpy.ndarray
+        ncols means, NaN where there is no value
+    '''
+    bounds = x.searchsorted(edges,'left')
+    a, b = bounds[0], bounds[-1]
+    # a sample after the window so every column has a valid start for
+    # reduceat, empty columns are fixed below
+    s = numpy.zeros(b - a + 1)
+    valid = numpy.zeros(b - a + 1,dtype=bool)
+    valid[:-1] = ~numpy.isnan(y[a:b])
+    s[:-1][valid[:-1]] = y[a:b][valid[:-1]]
+    starts = bounds[:-1] - a
+    sums = numpy.add.reduceat(s,starts)
+    counts = numpy.add.reduceat(valid,starts,dtype=numpy.int64)
+    counts[bounds[1:] == bounds[:-1]] = 0
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        means = sums/counts
+    empty = counts == 0
+    if empty.any():
+        means[empty] = hold(x,y,edges[:-1][empty])
+    return means
+
+def bin_means(v,bounds):
+    '''
+    Mean of the rows of v between bounds, for every column, e.g. to average
+    many tags that share a time axis into the same bins.
+
+    Parameters:
+    -----------
+    v : numpy.ndarray
+        2-D, a column per tag, rows bounds[0]:bounds[-1] are used
+    bounds : numpy.ndarray
+        nbins+1 row numbers (sorted)
+
+    Returns:
+    --------
+    numpy.ndarray
+        (nbins, columns), NaN where a bin has no values
+    '''
+    a, b = bounds[0], bounds[-1]
+    nbins = len(bounds) - 1
+    means = numpy.full((nbins,v.shape[1]),numpy.nan)
+    s = v[a:b]
+    nan = numpy.isnan(s)
+    has_nan = nan.any()
+    if has_nan:
+        s = numpy.where(nan,0.0,s)
+
+    # reduceat needs starts inside the window, bins at the end without rows
+    # are left out
+    starts = bounds[:-1] - a
+    k = int(numpy.searchsorted(starts,b - a,'left'))
+    if k == 0:
+        return means
+    sums = numpy.add.reduceat(s,starts[:k],axis=0)
+    counts = numpy.diff(bounds)[:k,None] - \
+        (numpy.add.reduceat(nan,starts[:k],axis=0,dtype=numpy.int64) if has_nan else 0)
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        means[:k] = numpy.where(counts > 0,sums/counts,numpy.nan)
+    return means
+
+def standardize(a):
+    '''
+    Columns of a scaled to mean 0 and standard deviation 1.  NaNs, and
+    columns that don't change, are 0.
+    '''
+    valid = ~numpy.isnan(a)
+    n = valid.sum(axis=0)
+    d = numpy.where(valid,a,0.0)
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        mean = d.sum(axis=0)/n
+        d = numpy.where(valid,a - mean,0.0)
+        z = d/numpy.sqrt((d*d).sum(axis=0)/n)
+    z[~numpy.isfinite(z)] = 0.0
+    return z
+
+def lagged_correlation(z,ref,maxlag=0):
+    '''
+    Correlation of every column of z with ref at lags -maxlag..maxlag, as one
+    matrix product.  A positive lag means the column follows ref.
+
+    Parameters:
+    -----------
+    z : numpy.ndarray
+        (n, columns) standardized, see standardize
+    ref : numpy.ndarray
+        n standardized values
+    maxlag : int, optional
+        largest lag in samples
+
+    Returns:
+    --------
+    corr : numpy.ndarray
+        correlation of every column at the lag with the largest absolute
+        correlation
+    lag : numpy.ndarray
+        that lag, in samples
+    '''
+    n = len(ref)
+    lags = numpy.arange(-maxlag,maxlag+1)
+    # column j is ref delayed by lags[j]
+    shifted = numpy.zeros((n,len(lags)))
+    for j,l in enumerate(lags):
+        if l >= 0:
+            shifted[l:,j] = ref[:n-l]
+        else:
+            shifted[:n+l,j] = ref[-l:]
+    c = (z.T @ shifted)/n
+    k = numpy.argmax(numpy.abs(c),axis=1)
+    return c[numpy.arange(len(k)),k], lags[k]
+
+def bin_index(v,lo,hi,n):
+    '''
+    Bin of every value for n bins of equal width from lo to hi.  NaNs and
+    values outside lo..hi get bin n.
+
+    Returns:
+    --------
+    numpy.ndarray of int
+    '''
+    width = (hi - lo)/n
+    with numpy.errstate(invalid='ignore'):
+        b = numpy.floor((v - lo)/width)
+        b[v == hi] = n - 1
+        b[~((b >= 0) & (b < n))] = n
+    return b.astype(numpy.intp)
+
+
+class WindowCounts():
+    '''
+    Number of samples in every bin for a window i0:i1 of the samples, e.g.
+    the histogram of the visible samples of a tag.  The bin of every sample
+    is found once, when the window moves only the samples that enter or
+    leave the window are counted, so panning costs as much as the samples
+    that scroll in and out.
+    '''
+
+    def __init__(self,bins,nbins):
+        '''
+        Parameters:
+        -----------
+        bins : numpy.ndarray of int
+            bin of every sample, nbins for samples that are not counted
+        nbins : int
+            number of bins
+        '''
+        self.bins = bins
+        self.nbins = nbins
+        self.i0 = 0
+        self.i1 = 0
+        self.counts = numpy.zeros(nbins,dtype=numpy.int64)
+
+    def _count(self,i0,i1):
+        return numpy.bincount(self.bins[i0:i1],minlength=self.nbins+1)[:self.nbins]
+
+    def set_window(self,i0,i1):
+        '''
+        Move the window to samples i0:i1.
+
+        Returns:
+        --------
+        numpy.ndarray
+            counts of the bins, don't change it
+        '''
+        changed = abs(i0 - self.i0) + abs(i1 - self.i1)
+        if max(i0,self.i0) >= min(i1,self.i1) or changed >= i1 - i0:
+            self.counts = self._count(i0,i1)
+        else:
+            c = self.counts
+            if i0 < self.i0:
+                c += self._count(i0,self.i0)
+            elif i0 > self.i0:
+                c -= self._count(self.i0,i0)
+            if i1 > self.i1:
+                c += self._count(self.i1,i1)
+            elif i1 < self.i1:
+                c -= self._count(i1,self.i1)
+        self.i0 = i0
+        self.i1 = i1
+        return self.counts
+
+
+def _segment_end(x,y,a,end,tol):
+    '''
+    Swinging door from sample a over samples a+1..end-1.  Returns (b,closed):
+    b is the last sample that can be kept so that the line from a to b is
+    within tol of all the samples in between, closed is True if the door
+    closed before end.
+    '''
+    dx = x[a+1:end] - x[a]
+    dy = y[a+1:end] - y[a]
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+        up = numpy.minimum.accumulate((dy + tol)/dx)
+        lo = numpy.maximum.accumulate((dy - tol)/dx)
+        # samples at the same time close the door
+        shut = (lo > up) | (dx <= 0)
+        c = int(numpy.argmax(shut)) if shut.any() else len(dx)
+        if c == 0:
+            return a+1, True
+        # the line to sample k must be in the door of the samples before it
+        s = dy[:c]/dx[:c]
+        ok = numpy.ones(c,dtype=bool)
+        ok[1:] = (s[1:] >= lo[:c-1]) & (s[1:] <= up[:c-1])
+    k = c - 1 - int(numpy.argmax(ok[::-1]))
+    return a + 1 + k, c < len(dx)
+
+def swinging_door(x,y,tol,min_ratio=2.0):
+    '''
+    Swinging door compression: samples to keep so that the line through the
+    kept samples is within tol of every sample.  This is how historians
+    store data, an export that is interpolated at a fixed rate usually
+    compresses 10-50x.
+
+    Segments are found with numpy on blocks of samples after the last kept
+    sample, the block grows until the door closes.
+
+    Parameters:
+    -----------
+    x, y : numpy.ndarray
+        time (sorted) and values, without NaNs
+    tol : float
+        largest error
+    min_ratio : float, optional
+        stop and keep all the samples if the data compresses less than this
+
+    Returns:
+    --------
+    numpy.ndarray
+        indices of the samples to keep, the first and last are always kept
+    '''
+    n = len(y)
+    if n <= 2:
+        return numpy.arange(n)
+    keep = [0]
+    a = 0
+    size = 64
+    while a < n - 1:
+        while True:
+            end = min(n,a+1+size)
+            b,closed = _segment_end(x,y,a,end,tol)
+            if closed or end == n:
+                break
+            size *= 2
+        keep.append(b)
+        # the next block is about as long as this segment
+        size = max(16,2*(b - a))
+        a = b
+        if a > 1000 and len(keep)*min_ratio > a:
+            return numpy.arange(n)
+    return numpy.array(keep)
+
+def deadband(y,tol,min_ratio=2.0):
+    '''
+    Deadband compression: a sample is kept when it differs more than tol
+    from the last kept sample, with the sample before it so that lines
+    between the kept samples don't ramp over a step.  Lines through the kept
+    samples are within 2*tol of every sample.
+
+    Parameters:
+    -----------
+    y : numpy.ndarray
+        values, without NaNs
+    tol : float
+        deadband
+    min_ratio : float, optional
+        stop and keep all the samples if the data compresses less than this
+
+    Returns:
+    --------
+    numpy.ndarray
+        indices of the samples to keep, the first and last are always kept
+    '''
+    n = len(y)
+    keep = [0]
+    a = 0
+    size = 64
+    while a < n - 1:
+        end = min(n,a+1+size)
+        out = numpy.abs(y[a+1:end] - y[a]) > tol
+        if not out.any():
+            if end == n:
+                break
+            size *= 2
+            continue
+        j = a + 1 + int(numpy.argmax(out))
+        if j - 1 > a:
+            keep.append(j - 1)
+        keep.append(j)
+        size = max(16,2*(j - a))
+        a = j
+        if a > 1000 and len(keep)*min_ratio > a:
+            return numpy.arange(n)
+    if keep[-1] != n - 1:
+        keep.append(n - 1)
+    return numpy.array(keep)
+
+COMPRESSION_METHODS = ('swinging_door','deadband')
+
+def compress(x,y,tol,method='swinging_door'):
+    '''
+    Compress a tag, see swinging_door and deadband.
+
+    Returns:
+    --------
+    idx : numpy.ndarray
+        indices of the samples to keep
+    max_error : float
+        largest difference between the samples and the line through the kept
+        samples
+    '''
+    if method == 'swinging_door':
+        idx = swinging_door(x,y,tol)
+    elif method == 'deadband':
+        idx = deadband(y,tol)
+    else:
+        raise ValueError('Unknown compression method {}, use one of {}'.format(
+            method,COMPRESSION_METHODS))
+    if len(idx) == len(y) or len(y) == 0:
+        return idx, 0.0
+    return idx, float(numpy.max(numpy.abs(numpy.interp(x,x[idx],y[idx]) - y)))
+
+def _crossing_regularity(t,e,band):
+    '''
+    Regularity of the zero crossings of every row of e: the mean of the
+    intervals between crossings divided by 3 times their standard deviation.
+    A crossing is from above band to below -band (or back), so noise around
+    zero is not counted.  0 for rows with less than 3 intervals.
+    '''
+    k,n = e.shape
+    side = numpy.zeros(e.shape,dtype=numpy.int8)
+    side[e > band] = 1
+    side[e < -band] = -1
+    # samples inside the band keep the side of the last sample outside it
+    last = numpy.where(side != 0,numpy.arange(n),0)
+    numpy.maximum.accumulate(last,axis=1,out=last)
+    side = numpy.take_along_axis(side,last,axis=1)
+    del last
+    rows,cols = numpy.nonzero((side[:,1:] != side[:,:-1]) & (side[:,:-1] != 0))
+    same = rows[1:] == rows[:-1]
+    intervals = numpy.diff(t[cols])[same]
+    rows = rows[1:][same]
+
+    count = numpy.bincount(rows,minlength=k)
+    s1 = numpy.bincount(rows,intervals,minlength=k)
+    s2 = numpy.bincount(rows,intervals**2,minlength=k)
+    regularity = numpy.zeros(k)
+    enough = count >= 3
+    mean = s1[enough]/count[enough]
+    std = numpy.sqrt(numpy.maximum(s2[enough]/count[enough] - mean**2,0))
+    with numpy.errstate(divide='ignore'):
+        regularity[enough] = mean/(3*std)
+    return regularity
+
+def loop_health(t,pv,sp=None,op=None,band=3.0,op_limits=None):
+    '''
+    Health indicators of control loops, for many loops at once.  Every row
+    of pv, sp and op is a loop, all rows share the time axis t.  NaNs are
+    ignored.
+
+    Indicators:
+        iae : integral of |SP - PV| (value*seconds for time in seconds)
+        oscillation : regularity of the zero crossings of the control error
+            (of PV - mean without SP).  Above 1 is a regular oscillation
+            (Thornhill et al., 2003).
+        saturation : fraction of the time OP is at a limit
+        stiction : fraction of the OP movement while PV doesn't move (changes
+            less than 10% of its mean change), close to 1 for a sticking valve
+
+    Parameters:
+    -----------
+    t : numpy.ndarray
+        time of the samples, shape (n,)
+    pv : numpy.ndarray
+        shape (k,n)
+    sp, op : numpy.ndarray, optional
+        shape (k,n), indicators that need them are NaN without them
+    band : float, optional
+        the error must move band times its noise past zero to cross it.  The
+        noise is estimated from the median change between samples.
+    op_limits : tuple, optional
+        (low,high) limits of OP, the default is the min and max of each
+        row +- 1% of the range
+
+    Returns:
+    --------
+    dict
+        indicator name: numpy.ndarray with shape (k,)
+    '''
+    t = numpy.asarray(t,dtype=float)
+    pv = numpy.atleast_2d(pv)
+    k,n = pv.shape
+    nan = numpy.full(k,numpy.nan)
+
+    # time each sample holds
+    dt = numpy.zeros(n)
+    if n > 1:
+        dt[:-1] = numpy.diff(t)
+    total = dt.sum()
+
+    health = {}
+    with numpy.errstate(invalid='ignore',divide='ignore'):
+        if sp is not None:
+            e = numpy.atleast_2d(sp) - pv
+            health['iae'] = numpy.nansum(numpy.abs(e)*dt,axis=1)
+        else:
+            e = pv.copy()
+            health['iae'] = nan
+
+        # NaNs are in the band and don't cross zero
+        e -= numpy.nanmean(e,axis=1,keepdims=True)
+        numpy.nan_to_num(e,copy=False)
+        noise = numpy.median(numpy.abs(numpy.diff(e,axis=1)),axis=1,keepdims=True) \
+                / (0.6745*numpy.sqrt(2))
+        health['oscillation'] = _crossing_regularity(t,e,band*noise)
+        del e
+
+        if op is not None:
+            op = numpy.atleast_2d(op)
+            if op_limits is None:
+                lo = numpy.nanmin(op,axis=1,keepdims=True)
+                hi = numpy.nanmax(op,axis=1,keepdims=True)
+                tol = 0.01*(hi - lo)
+                lo, hi = lo + tol, hi - tol
+            else:
+                lo, hi = op_limits
+            at_limit = (op <= lo) | (op >= hi)
+            health['saturation'] = (at_limit*dt).sum(axis=1)/total if total > 0 else nan
+            del at_limit
+
+            dop = numpy.abs(numpy.diff(op,axis=1))
+            dpv = numpy.abs(numpy.diff(pv,axis=1))
+            tol = 0.1*numpy.nanmean(dpv,axis=1,keepdims=True)
+            moved = numpy.nansum(dop,axis=1)
+            stuck = numpy.nansum(numpy.where(dpv <= tol,dop,0.0),axis=1)
+            health['stiction'] = numpy.where(moved > 0,stuck/moved,numpy.nan)
+        else:
+            health['saturation'] = nan
+            health['stiction'] = nan
+
+    return health
+
+
+class RangeIndex():
+    '''
+    Index of a tag's data to calculate statistics of any range of samples in
+    O(log n), independent of the size of the range.
+
+    Running sums of the count, sum, sum of squares and integral give the mean,
+    std and integral of a range from two lookups.  The min and max come from
+    a pyramid of block minimums/maximums (each level combines pairs of the
+    level below), a range needs at most two blocks per level.
+
+    A linear index is for compressed tags, the samples are the corners of
+    straight lines and are not evenly spaced.  The mean and std are then
+    weighted by time, from running integrals of the lines and their squares.
+
+    Memory used is about 5 floats per sample (8 for a linear index).
+    '''
+
+    block = 16 # samples per block in the first level of the pyramid
+
+    def __init__(self,x,y,unit=None,linear=False):
+        '''
+        Parameters:
+        -----------
+        x : numpy.ndarray
+            time of samples (sorted)
+        y : numpy.ndarray
+            values
+        unit : float, optional
+            seconds per unit of x, the integral is in value*hours if it is
+            given, otherwise in value*(unit of x)
+        linear : bool, optional
+            the values change linearly between the samples, see above
+        '''
+        self.x = x
+        self.y = y
+        self.linear = linear
+        valid = ~numpy.isnan(y)
+        self.offset = float(numpy.nanmean(y)) if valid.any() else 0.0
+        d = numpy.where(valid,y-self.offset,0.0)
+
+        zero = numpy.zeros(1)
+        self._count = numpy.concatenate((zero,numpy.cumsum(valid)))
+        self._sum = numpy.concatenate((zero,numpy.cumsum(d)))
+        self._sum2 = numpy.concatenate((zero,numpy.cumsum(d*d)))
+
+        # Trapezoidal integral, intervals next to NaNs are left out
+        dx = numpy.diff(x)
+        if unit:
+            dx = dx*(unit/3600.0)
+        area = 0.5*(y[1:]+y[:-1])*dx
+        area[numpy.isnan(area)] = 0.0
+        self._integral = numpy.concatenate((zero,numpy.cumsum(area)))
+
+        if linear:
+            # integrals of d and d*d along the lines, and the time they are
+            # valid
+            dx = numpy.diff(x)
+            a, b = y[:-1] - self.offset, y[1:] - self.offset
+            ok = ~(numpy.isnan(a) | numpy.isnan(b))
+            dx = numpy.where(ok,dx,0.0)
+            a = numpy.where(ok,a,0.0)
+            b = numpy.where(ok,b,0.0)
+            self._duration = numpy.concatenate((zero,numpy.cumsum(dx)))
+            self._dint = numpy.concatenate((zero,numpy.cumsum(0.5*(a+b)*dx)))
+            self._dint2 = numpy.concatenate((zero,
+                numpy.cumsum((a*a+a*b+b*b)*dx/3.0)))
+
+        # min/max pyramid of blocks
+        nblocks = -(-len(y) // self.block)
+        a = numpy.full(nblocks*self.block,numpy.nan)
+        a[:len(y)] = y
+        a = a.reshape(nblocks,self.block)
+        self._min = [numpy.fmin.reduce(a,axis=1)]
+        self._max = [numpy.fmax.reduce(a,axis=1)]
+        while len(self._min[-1]) > 1:
+            for levels,func in ((self._min,numpy.fmin),(self._max,numpy.fmax)):
+                b = levels[-1]
+                if len(b) % 2:
+                    b = numpy.append(b,numpy.nan)
+                levels.append(func(b[0::2],b[1::2]))
+
+    def __len__(self):
+        return len(self.y)
+
+    def positions(self,xmin,xmax):
+        '''
+        Range of samples [i0,i1) with xmin <= x <= xmax
+        '''
+        return (int(self.x.searchsorted(xmin,'left')),
+                int(self.x.searchsorted(xmax,'right')))
+
+    def _extreme(self,levels,func,i0,i1):
+        # partial blocks at the ends from the data
+        b0 = -(-i0 // self.block)
+        b1 = i1 // self.block
+        if b0 >= b1:
+            return func.reduce(self.y[i0:i1]) if i1 > i0 else numpy.nan
+
+        r = func(func.reduce(self.y[i0:b0*self.block],initial=numpy.nan),
+                 func.reduce(self.y[b1*self.block:i1],initial=numpy.nan))
+
+        # full blocks from the pyramid
+        for level in levels:
+            if b0 >= b1:
+                break
+            if b0 % 2:
+                r = func(r,level[b0])
+                b0 += 1
+            if b1 % 2:
+                b1 -= 1
+                r = func(r,level[b1])
+            b0 //= 2
+            b1 //= 2
+        return float(r)
+
+    def stats(self,i0,i1):
+        '''
+        Statistics of samples [i0,i1).  The mean and std of a linear index
+        are over the time from sample i0 to sample i1-1.
+
+        Returns:
+        --------
+        dict with 'count', 'min', 'max', 'mean', 'std', 'integral'
+        '''
+        i0 = max(i0,0)
+        i1 = min(i1,len(self.y))
+        if i1 <= i0:
+            return {'count':0,'min':numpy.nan,'max':numpy.nan,
+                    'mean':numpy.nan,'std':numpy.nan,'integral':0.0}
+
+        count = self._count[i1] - self._count[i0]
+        duration = 0.0
+        if self.linear:
+            duration = self._duration[i1-1] - self._duration[i0]
+        if duration > 0:
+            s = (self._dint[i1-1] - self._dint[i0]) / duration
+            s2 = (self._dint2[i1-1] - self._dint2[i0]) / duration
+            var = s2 - s*s
+            std = numpy.sqrt(var) if var > 1e-9*s2 else 0.0
+            mean = s + self.offset
+        elif count > 0:
+            s = (self._sum[i1] - self._sum[i0]) / count
+            s2 = (self._sum2[i1] - self._sum2[i0]) / count
+            var = s2 - s*s
+            std = numpy.sqrt(var) if var > 1e-9*s2 else 0.0
+            mean = s + self.offset
+        else:
+            mean = std = numpy.nan
+
+        return {
+            'count' : int(count),
+            'min' : self._extreme(self._min,numpy.fmin,i0,i1),
+            'max' : self._extreme(self._max,numpy.fmax,i0,i1),
+            'mean' : float(mean),
+            'std' : float(std),
+            'integral' : float(self._integral[i1-1] - self._integral[i0]),
+        }
+
+    def window_stats(self,xmin,xmax):
+        '''
+        Statistics of samples with xmin <= x <= xmax, see stats.
+        '''
+        return self.stats(*self.positions(xmin,xmax))
+
+    def overview(self,max_blocks=1000):
+        '''
+        Envelope of all the data from the min/max pyramid: the min and max of
+        blocks of samples, from the first level with at most max_blocks
+        blocks.  Nothing is calculated.
+
+        Returns:
+        --------
+        x : numpy.ndarray
+            time of the first sample of every block
+        ymin, ymax : numpy.ndarray
+            min and max of every block
+        '''
+        level = 0
+        while len(self._min[level]) > max_blocks and level + 1 < len(self._min):
+            level += 1
+        # blocks past the end of the data are padding
+        x = self.x[::self.block << level]
+        n = min(len(x),len(self._min[level]))
+        return x[:n], self._min[level][:n], self._max[level][:n]
+
+
+class SpanIndex():
+    '''
+    Index of the columns of a table to find the span (max - min) of all the
+    columns over any range of rows at once, in O(log n) for the rows in full
+    blocks.  Like the min/max pyramid of RangeIndex, with the minimums and
+    maximums of all the columns in every block.  The rows of the partial
+    blocks at the ends of a range are read from the data.
+
+    The index is filled a chunk of columns at a time with add, the table
+    doesn't have to be converted to one array.  Memory used is about 4
+    floats per column per block.
+    '''
+
+    def __init__(self,nrows,ncols,block=1024):
+        '''
+        Parameters:
+        -----------
+        nrows, ncols : int
+            size of the table
+        block : int, optional
+            rows per block in the first level of the pyramid
+        '''
+        self.nrows = nrows
+        self.ncols = ncols
+        self.block = block
+        nblocks = nrows // block # only full blocks
+        self._min = [numpy.full((nblocks,ncols),numpy.nan)]
+        self._max = [numpy.full((nblocks,ncols),numpy.nan)]
+
+    def add(self,j,a):
+        '''
+        Add the columns j, j+1, ... of the table.
+
+        Parameters:
+        -----------
+        j : int
+            first column
+        a : numpy.ndarray
+            all the rows of the columns (nrows x number of columns)
+        '''
+        nblocks = len(self._min[0])
+        b = a[:nblocks*self.block].reshape(nblocks,self.block,a.shape[1])
+        self._min[0][:,j:j+a.shape[1]] = numpy.fmin.reduce(b,axis=1)
+        self._max[0][:,j:j+a.shape[1]] = numpy.fmax.reduce(b,axis=1)
+
+    def finish(self):
+        '''
+        Build the pyramid when all the columns are added.
+        '''
+        del self._min[1:], self._max[1:]
+        while len(self._min[-1]) > 1:
+            for levels,func in ((self._min,numpy.fmin),(self._max,numpy.fmax)):
+                b = levels[-1]
+                if len(b) % 2:
+                    b = numpy.vstack((b,numpy.full((1,self.ncols),numpy.nan)))
+                levels.append(func(b[0::2],b[1::2]))
+
+    def spans(self,i0,i1,read):
+        '''
+        Span (max - min) of every column over the rows [i0,i1).
+
+        Parameters:
+        -----------
+        i0, i1 : int
+            range of rows
+        read : callable
+            read(r0,r1) returns the rows [r0,r1) of all the columns as an
+            array, for the partial blocks
+
+        Returns:
+        --------
+        numpy.ndarray
+            span of every column, NaN if it has no values in the range
+        '''
+        i0 = max(i0,0)
+        i1 = min(i1,self.nrows)
+        if i1 <= i0:
+            return numpy.full(self.ncols,numpy.nan)
+        b0 = -(-i0 // self.block)
+        b1 = i1 // self.block
+        with numpy.errstate(invalid='ignore'):
+            if b0 >= b1:
+                a = read(i0,i1)
+                return numpy.fmax.reduce(a,axis=0) - numpy.fmin.reduce(a,axis=0)
+
+            lo = numpy.full(self.ncols,numpy.nan)
+            hi = numpy.full(self.ncols,numpy.nan)
+            for r0,r1 in ((i0,b0*self.block),(b1*self.block,i1)):
+                if r1 > r0:
+                    a = read(r0,r1)
+                    lo = numpy.fmin(lo,numpy.fmin.reduce(a,axis=0))
+                    hi = numpy.fmax(hi,numpy.fmax.reduce(a,axis=0))
+
+            # full blocks from the pyramid
+            for level_min,level_max in zip(self._min,self._max):
+                if b0 >= b1:
+                    break
+                if b0 % 2:
+                    lo = numpy.fmin(lo,level_min[b0])
+                    hi = numpy.fmax(hi,level_max[b0])
+                    b0 += 1
+                if b1 % 2:
+                    b1 -= 1
+                    lo = numpy.fmin(lo,level_min[b1])
+                    hi = numpy.fmax(hi,level_max[b1])
+                b0 //= 2
+                b1 //= 2
+            return hi - lo
+
+
+class KpiIndex():
+    '''
+    Index of a control loop's data to calculate KPIs of many time windows at
+    once.  Running sums of time weighted indicators give the KPIs of a window
+    from two lookups, the KPIs of all windows are calculated together.
+
+    Every sample holds until the next sample.  NaNs are left out, the KPIs
+    are over the time that the data is valid.
+
+    KPIs:
+        mae : mean absolute error |SP - PV|
+        pct_auto : % of the time in auto
+        pct_at_limit : % of the time PV is at (or past) its high or low
+            limit, e.g. the READVALUE of a ProfCon CV or MV
+    '''
+
+    kpis = ['mae','pct_auto','pct_at_limit']
+
+    def __init__(self,x,pv,sp=None,lo=None,hi=None,auto=None,tol=0.0):
+        '''
+        Parameters:
+        -----------
+        x : numpy.ndarray
+            time of the samples (sorted), all arrays have the samples at x
+        pv : numpy.ndarray
+            process value
+        sp : numpy.ndarray, optional
+            setpoint, for mae
+        lo, hi : numpy.ndarray, optional
+            low and high limits, for pct_at_limit
+        auto : numpy.ndarray, optional
+            1 in auto, 0 not in auto, NaN unknown, for pct_auto
+        tol : float, optional
+            PV is at a limit if it is within tol of the limit
+        '''
+        self.x = x
+        dt = numpy.zeros(len(x))
+        if len(x) > 1:
+            dt[:-1] = numpy.diff(x)
+
+        zero = numpy.zeros(1)
+        def running(value):
+            # running sums of value*dt and of the time value is valid
+            valid = ~numpy.isnan(value)
+            return (numpy.concatenate((zero,numpy.cumsum(numpy.where(valid,value*dt,0.0)))),
+                    numpy.concatenate((zero,numpy.cumsum(numpy.where(valid,dt,0.0)))))
+
+        self._sums = {}
+        with numpy.errstate(invalid='ignore'):
+            if sp is not None:
+                self._sums['mae'] = running(numpy.abs(sp - pv))
+            if auto is not None:
+                self._sums['pct_auto'] = running(100.0*auto)
+            if lo is not None or hi is not None:
+                at = numpy.zeros(len(x))
+                known = numpy.zeros(len(x),dtype=bool)
+                for limit,side in ((lo,-1.0),(hi,1.0)):
+                    if limit is None:
+                        continue
+                    at[side*(pv - limit) >= -tol] = 1.0
+                    known |= ~numpy.isnan(limit)
+                at[~known | numpy.isnan(pv)] = numpy.nan
+                self._sums['pct_at_limit'] = running(100.0*at)
+
+    def window_kpis(self,xmin,xmax):
+        '''
+        KPIs of the samples with xmin <= x < xmax, for many windows.
+
+        Parameters:
+        -----------
+        xmin, xmax : numpy.ndarray
+            start and end of every window
+
+        Returns:
+        --------
+        dict
+            KPI name: numpy.ndarray, a value per window.  NaN for KPIs that
+            don't have data (in the window).
+        '''
+        i0 = self.x.searchsorted(numpy.asarray(xmin,dtype=float),'left')
+        i1 = self.x.searchsorted(numpy.asarray(xmax,dtype=float),'left')
+        result = {}
+        for kpi in self.kpis:
+            if kpi not in self._sums:
+                result[kpi] = numpy.full(len(i0),numpy.nan)
+                continue
+            total,time = self._sums[kpi]
+            t = time[i1] - time[i0]
+            with numpy.errstate(invalid='ignore',divide='ignore'):
+                result[kpi] = numpy.where(t > 0,(total[i1] - total[i0])/t,numpy.nan)
+        return result
@@ -0,0 +1,135 @@
+'''
+Events on the trends: alarms, operator changes and other journal entries.
+
+A journal can have hundreds of thousands of entries, too many to draw as
+separate artists.  EventIndex keeps them in arrays sorted by start time and
+finds the events that overlap the visible range without looking at the
+others.  When there are more events in the range than can be told apart they
+are counted in columns instead, see EventIndex.cluster.
+'''
+
+import numpy
+import pandas
+
+from . import calc
+
+
+class EventIndex():
+    '''
+    Events sorted by start time.
+
+    An event is a moment (end == start) or a span.  Events that overlap
+    xmin..xmax start before xmax and end after xmin.  The running maximum of
+    the end of the sorted events only increases, so the first event that can
+    end after xmin is found with a binary search, like the last event that
+    starts before xmax.
+
+    Attributes:
+    -----------
+    start, end : numpy.ndarray
+        time of the events (sorted by start)
+    text : numpy.ndarray
+        text of the events (objects)
+    tag : numpy.ndarray
+        tagname of the events (objects), None if an event has no tag
+    '''
+
+    def __init__(self,start,end=None,text=None,tag=None):
+        '''
+        Parameters:
+        -----------
+        start : array_like
+            start time of the events, as floats in axes units
+        end : array_like, optional
+            end time of the events, NaN (or None) for moments
+        text : array_like, optional
+            text shown in the tooltip of the events
+        tag : array_like, optional
+            tagname of the events, to show events on the axes of their tags
+        '''
+        start = numpy.asarray(start,dtype=float)
+        n = len(start)
+        end = start if end is None else numpy.asarray(end,dtype=float)
+        end = numpy.where(numpy.isnan(end),start,numpy.maximum(start,end))
+        text = numpy.full(n,'',dtype=object) if text is None \
+               else numpy.asarray(text,dtype=object)
+        tag = numpy.full(n,None,dtype=object) if tag is None \
+              else numpy.array(tag,dtype=object)
+        tag[pandas.isna(tag)] = None
+
+        valid = ~numpy.isnan(start)
+        order = numpy.argsort(start[valid],kind='stable')
+        self.start = start[valid][order]
+        self.end = end[valid][order]
+        self.text = text[valid][order]
+        self.tag = tag[valid][order]
+
+        # events without a tag have code -1
+        self._tag_codes, tags = pandas.factorize(self.tag)
+        self.tags = pandas.Index(tags,dtype=object)
+        self._max_end = numpy.maximum.accumulate(self.end) if len(self.end) \
+                        else self.end
+
+    def __len__(self):
+        return len(self.start)
+
+    def query(self,xmin,xmax,tags=None,untagged=True):
+        '''
+        Events that overlap xmin..xmax.
+
+        Parameters:
+        -----------
+        xmin, xmax : float
+            time range
+        tags : collection, optional
+            only events of these tags, the default is all events
+        untagged : bool, optional
+            include events without a tag when tags are given
+
+        Returns:
+        --------
+        numpy.ndarray
+            indices of the events, sorted by start
+        '''
+        i0 = self._max_end.searchsorted(xmin,'left')
+        i1 = self.start.searchsorted(xmax,'right')
+        if i1 <= i0:
+            return numpy.arange(0)
+        idx = numpy.arange(i0,i1)[self.end[i0:i1] >= xmin]
+        if tags is not None:
+            codes = self.tags.get_indexer(list(tags))
+            # the last element is for code -1
+            keep = numpy.zeros(len(self.tags)+1,dtype=bool)
+            keep[codes[codes >= 0]] = True
+            keep[-1] = untagged
+            idx = idx[keep[self._tag_codes[idx]]]
+        return idx
+
+    def cluster(self,idx,xmin,xmax,ncols):
+        '''
+        Count events in ncols columns of xmin..xmax, by their start (events
+        that start before xmin are in the first column).
+
+        Returns:
+        --------
+        x0, x1 : numpy.ndarray
+            edges of the columns that have events
+        count : numpy.ndarray
+            number of events in the columns
+        '''
+        edges = numpy.linspace(xmin,xmax,ncols+1)
+        cols = calc.bin_index(numpy.clip(self.start[idx],xmin,xmax),xmin,xmax,ncols)
+        count = numpy.bincount(cols,minlength=ncols+1)[:ncols]
+        has = count > 0
+        return edges[:-1][has], edges[1:][has], count[has]
+
+    def label(self,i,format_time=str):
+        '''
+        Tooltip of event i.
+        '''
+        label = format_time(self.start[i])
+        if self.end[i] > self.start[i]:
+            label += ' - ' + format_time(self.end[i])
+        if self.tag[i] is not None:
+            label += ' {}:'.format(self.tag[i])
+        return label + ' ' + str(self.text[i])
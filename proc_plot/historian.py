@@ -0,0 +1,677 @@
+'''
+Plot tags straight from a historian, without exporting them first.
+
+A Connector talks to a historian: it lists the tags and fetches the samples
+of some tags over a time range.  HistorianSource uses a connector as a lazy
+source (see proc_plot.loaders) for PlotManager.set_source:
+
+  - connections are kept in a ConnectionPool and reused
+  - the tags are fetched in batches (one request per batch) and the batches
+    are fetched at the same time on the connections of the pool
+  - fetched samples are kept in a RangeCache (a SQLite file) with the time
+    ranges that were fetched per tag.  Ranges that overlap are merged, so
+    when the plot is zoomed or panned out of the loaded ranges only the gaps
+    of the visible range are fetched.  The cache is kept between sessions.
+
+    connector = proc_plot.historian.SqliteHistorian('standin.db')
+    source = proc_plot.open_historian(connector,'2020-01-01','2020-01-02',
+                                      cache='historian.cache')
+
+To use another historian, subclass Connector and implement connect,
+list_tags and fetch.
+'''
+
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pandas
+import matplotlib.dates
+
+
+class Connector():
+    '''
+    Base class of historian connectors.  Subclasses implement connect,
+    list_tags and fetch.  The methods get a connection of the pool, they are
+    called from several threads at the same time (with other connections).
+
+    Attributes:
+    -----------
+    tz : datetime.tzinfo
+        time zone of the timestamps of the historian, None if they have no
+        time zone
+    batch_size : int
+        maximum number of tags per fetch request
+    '''
+
+    tz = None
+    batch_size = 100
+
+    def connect(self):
+        '''
+        Open a new connection.
+        '''
+        raise NotImplementedError
+
+    def close(self,conn):
+        '''
+        Close a connection.
+        '''
+        conn.close()
+
+    def list_tags(self,conn):
+        '''
+        Return the tagnames of the historian.
+        '''
+        raise NotImplementedError
+
+    def fetch(self,conn,tags,start,end):
+        '''
+        Fetch the samples of tags from start to end (both included).
+
+        Parameters:
+        -----------
+        conn
+            connection from connect
+        tags : list
+            tagnames, at most batch_size
+        start, end : pandas.Timestamp
+            time range, in the time zone tz
+
+        Returns:
+        --------
+        dict
+            tagname: pandas.Series of the values with the timestamps as
+            index, tags without samples can be left out
+        '''
+        raise NotImplementedError
+
+    def now(self):
+        '''
+        Current time of the historian, data after it is not cached as
+        complete.
+        '''
+        return pandas.Timestamp.now(tz=self.tz)
+
+    def key(self):
+        '''
+        Identifies the data of the historian in the cache.  A cache that was
+        made with another key is cleared.
+        '''
+        return type(self).__name__
+
+
+class ConnectionPool():
+    '''
+    At most size connections of a connector.  Connections are opened when
+    they are needed and reused, a connection that raised an exception is
+    closed instead.
+    '''
+
+    def __init__(self,connector,size=4):
+        self.connector = connector
+        self.size = size
+        self.opened = 0 # number of connections that were opened
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        '''
+        Context manager that gets a connection, waits if all size
+        connections are in use.
+        '''
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.connector.connect()
+                with self._lock:
+                    self.opened += 1
+            try:
+                yield conn
+            except BaseException:
+                self.connector.close(conn)
+                raise
+            self._idle.put(conn)
+
+    def close(self):
+        '''
+        Close the idle connections.
+        '''
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self.connector.close(conn)
+
+
+def merge_intervals(ranges):
+    '''
+    Merge ranges that overlap or touch.
+
+    Parameters:
+    -----------
+    ranges : list
+        (start,end) of ranges, in any order
+
+    Returns:
+    --------
+    list
+        (start,end) of the merged ranges, sorted
+    '''
+    merged = []
+    for a,b in sorted(ranges):
+        if merged and a <= merged[-1][1]:
+            merged[-1] = (merged[-1][0],max(merged[-1][1],b))
+        else:
+            merged.append((a,b))
+    return merged
+
+def missing_intervals(ranges,start,end):
+    '''
+    Parts of start..end that are not in ranges.
+
+    Parameters:
+    -----------
+    ranges : list
+        (start,end) of the ranges that are loaded, sorted and not
+        overlapping
+    start, end : float
+        range that is needed
+
+    Returns:
+    --------
+    list
+        (start,end) of the gaps
+    '''
+    gaps = []
+    t = start
+    for a,b in ranges:
+        if b < t:
+            continue
+        if a > end:
+            break
+        if a > t:
+            gaps.append((t,a))
+        t = max(t,b)
+    if t < end:
+        gaps.append((t,end))
+    return gaps
+
+
+class RangeCache():
+    '''
+    Samples of tags and the time ranges they were fetched for, in SQLite.
+
+    Every row is a range of a tag with its samples (x and y as float64
+    blobs).  A range that overlaps or touches the ranges of the tag is merged
+    with them into one row, so a tag has as many rows as there are separate
+    loaded ranges and a read doesn't have to join many small pieces.
+    '''
+
+    def __init__(self,path=None,key=''):
+        '''
+        Parameters:
+        -----------
+        path : str, optional
+            SQLite file, the default is a cache in memory
+        key : str, optional
+            see Connector.key, the cache is cleared if it was made with
+            another key
+        '''
+        self.path = path
+        self._db = sqlite3.connect(path or ':memory:',check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS ranges '
+                             '(tag TEXT, x0 REAL, x1 REAL, x BLOB, y BLOB)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS ranges_tag '
+                             'ON ranges (tag, x0)')
+            row = self._db.execute('SELECT key FROM meta').fetchone()
+            if row is None or row[0] != key:
+                self._db.execute('DELETE FROM meta')
+                self._db.execute('DELETE FROM ranges')
+                self._db.execute('INSERT INTO meta VALUES (?)',(key,))
+
+    def ranges(self,tag):
+        '''
+        (start,end) of the loaded ranges of tag, sorted.
+        '''
+        with self._lock:
+            return self._db.execute(
+                'SELECT x0, x1 FROM ranges WHERE tag = ? ORDER BY x0',
+                (tag,)).fetchall()
+
+    def missing(self,tag,start,end):
+        '''
+        Gaps of start..end that are not loaded for tag, see
+        missing_intervals.
+        '''
+        return missing_intervals(self.ranges(tag),start,end)
+
+    def add(self,items):
+        '''
+        Store fetched samples, in one transaction.
+
+        Parameters:
+        -----------
+        items : iterable
+            (tag,start,end,x,y): the samples x,y (x sorted) of tag that were
+            fetched for start..end
+        '''
+        with self._lock, self._db:
+            for tag,start,end,x,y in items:
+                if end < start:
+                    continue
+                rows = self._db.execute(
+                    'SELECT rowid, x0, x1, x, y FROM ranges '
+                    'WHERE tag = ? AND x1 >= ? AND x0 <= ?',
+                    (tag,start,end)).fetchall()
+                xs = [ numpy.frombuffer(r[3]) for r in rows ] + [ x ]
+                ys = [ numpy.frombuffer(r[4]) for r in rows ] + [ y ]
+                x = numpy.concatenate(xs)
+                y = numpy.concatenate(ys)
+                # the samples that were fetched last are kept when the ranges
+                # have the same times
+                order = numpy.argsort(x,kind='stable')
+                x = x[order]
+                y = y[order]
+                keep = numpy.append(x[1:] != x[:-1],True)
+                x = numpy.ascontiguousarray(x[keep],dtype=float)
+                y = numpy.ascontiguousarray(y[keep],dtype=float)
+
+                start = min([start] + [ r[1] for r in rows ])
+                end = max([end] + [ r[2] for r in rows ])
+                self._db.executemany('DELETE FROM ranges WHERE rowid = ?',
+                                     [ (r[0],) for r in rows ])
+                self._db.execute('INSERT INTO ranges VALUES (?,?,?,?,?)',
+                                 (tag,start,end,x.tobytes(),y.tobytes()))
+
+    def read(self,tag,start,end):
+        '''
+        Samples of tag from start to end that are in the cache.
+
+        Returns:
+        --------
+        x, y : numpy.ndarray
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT x, y FROM ranges WHERE tag = ? AND x1 >= ? AND x0 <= ? '
+                'ORDER BY x0',(tag,start,end)).fetchall()
+        x = numpy.concatenate([numpy.arange(0,dtype=float)] +
+                              [ numpy.frombuffer(r[0]) for r in rows ])
+        y = numpy.concatenate([numpy.arange(0,dtype=float)] +
+                              [ numpy.frombuffer(r[1]) for r in rows ])
+        i0 = x.searchsorted(start,'left')
+        i1 = x.searchsorted(end,'right')
+        return x[i0:i1], y[i0:i1]
+
+    def clear(self):
+        '''
+        Remove everything from the cache.
+        '''
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM ranges')
+
+    def close(self):
+        self._db.close()
+
+
+class HistorianSource():
+    '''
+    Tags of a historian as a lazy source, see the module docstring and
+    proc_plot.loaders.Source.
+
+    The source has a view, the time range (matplotlib date numbers) that is
+    loaded for a tag when it is read.  fetch moves the view, PlotManager
+    calls it (on a worker thread) for the plotted tags when the plot is
+    zoomed or panned.  Every tag has its own loaded ranges, a tag that is
+    read the first time is only fetched for the view.  The ranges of a tag
+    are not joined: panning far away loads only the visible range, and the
+    data of a tag has a NaN between its ranges.  At most max_ranges ranges,
+    the ones closest to the view, are kept per tag, the others stay in the
+    cache.
+
+    Attributes:
+    -----------
+    connector : Connector
+    tags : list
+        tagnames
+    datetime : bool
+        always True
+    tz : datetime.tzinfo
+        time zone of the connector
+    pool : ConnectionPool
+    cache : RangeCache
+    view : tuple
+        (start,end) that is loaded when a tag is read
+    max_ranges : int
+        maximum number of separate loaded ranges per tag
+    '''
+
+    datetime = True
+
+    def __init__(self,connector,start=None,end=None,cache=None,pool_size=4,
+                 batch_size=None,max_ranges=8):
+        '''
+        Parameters:
+        -----------
+        connector : Connector
+            historian
+        start, end : timestamp (str, datetime, pandas.Timestamp), optional
+            range to load first, the default is the last day
+        cache : str, optional
+            SQLite file to keep the fetched data in, the default is to keep
+            it in memory
+        pool_size : int, optional
+            number of connections, and of requests at the same time
+        batch_size : int, optional
+            maximum number of tags per request, the default is
+            connector.batch_size
+        max_ranges : int, optional
+            maximum number of separate loaded ranges per tag
+        '''
+        self.connector = connector
+        self.tz = connector.tz
+        self.pool = ConnectionPool(connector,pool_size)
+        self.cache = RangeCache(cache,connector.key())
+        self.batch_size = batch_size or connector.batch_size
+        self.max_ranges = max_ranges
+
+        with self.pool.connection() as conn:
+            self.tags = list(connector.list_tags(conn))
+
+        end = connector.now() if end is None else self._timestamp(end)
+        start = end - pandas.Timedelta(days=1) if start is None \
+                else self._timestamp(start)
+        self.view = (self._to_x(start),self._to_x(end))
+
+        self._data = {} # tag: (ranges,x,y) read from the cache
+        # fetch runs on a worker thread while get can be called on the GUI
+        # thread, the lock is only held to use view and _data, not while
+        # fetching
+        self._lock = threading.Lock()
+
+    def _timestamp(self,t):
+        t = pandas.Timestamp(t)
+        if self.tz is not None and t.tz is None:
+            t = t.tz_localize(self.tz)
+        return t
+
+    def _to_x(self,t):
+        return float(matplotlib.dates.date2num(t))
+
+    def _to_time(self,x):
+        t = pandas.Timestamp(matplotlib.dates.num2date(x,tz=self.tz))
+        if self.tz is None:
+            t = t.tz_localize(None)
+        return t
+
+    def _to_xy(self,series):
+        if series is None or len(series) == 0:
+            return numpy.arange(0,dtype=float), numpy.arange(0,dtype=float)
+        series = series.sort_index()
+        x = matplotlib.dates.date2num(pandas.DatetimeIndex(series.index))
+        y = pandas.to_numeric(series,errors='coerce').to_numpy(dtype=float)
+        return numpy.asarray(x,dtype=float), y
+
+    def _request(self,tags,x0,x1):
+        with self.pool.connection() as conn:
+            return self.connector.fetch(conn,tags,self._to_time(x0),
+                                        self._to_time(x1))
+
+    def _ranges(self,tag,view):
+        # the loaded ranges of tag with view added, the ranges furthest from
+        # view are dropped
+        old = self._data.get(tag)
+        ranges = merge_intervals((list(old[0]) if old else []) + [view])
+        if len(ranges) > self.max_ranges:
+            distance = lambda r: max(r[0] - view[1],view[0] - r[1],0)
+            ranges = sorted(sorted(ranges,key=distance)[:self.max_ranges])
+        return tuple(ranges)
+
+    def load(self,tags):
+        '''
+        Load the view for tags, the parts that are not in the cache are
+        fetched.  Tags with the same gaps are fetched in batches, the batches
+        are fetched at the same time.
+
+        Returns:
+        --------
+        list
+            tags that have new data since they were read last
+        '''
+        with self._lock:
+            view = self.view
+        return self._load(tags,view)
+
+    def _load(self,tags,view):
+        with self._lock:
+            todo = [ (tag,self._ranges(tag,view)) for tag in tags ]
+            todo = [ (tag,ranges) for tag,ranges in todo
+                     if tag not in self._data or self._data[tag][0] != ranges ]
+        if not todo:
+            return []
+
+        gaps = {} # (x0,x1): tags
+        for tag,ranges in todo:
+            for gap in self.cache.missing(tag,*view):
+                gaps.setdefault(gap,[]).append(tag)
+        requests = [ (ts[i:i+self.batch_size],x0,x1)
+                     for (x0,x1),ts in gaps.items()
+                     for i in range(0,len(ts),self.batch_size) ]
+
+        # data after now can still change
+        now = self._to_x(self.connector.now())
+        def store(result,batch,x0,x1):
+            self.cache.add( (tag,x0,min(x1,now),*self._to_xy(result.get(tag)))
+                            for tag in batch )
+
+        if len(requests) == 1:
+            store(self._request(*requests[0]),*requests[0])
+        elif requests:
+            with ThreadPoolExecutor(min(self.pool.size,len(requests))) as pool:
+                futures = [ pool.submit(self._request,*r) for r in requests ]
+                # the cache is written on this thread
+                for future,r in zip(futures,requests):
+                    store(future.result(),*r)
+
+        read = [ (tag,ranges,*self._read(tag,ranges)) for tag,ranges in todo ]
+        changed = []
+        with self._lock:
+            for tag,ranges,x,y in read:
+                old = self._data.get(tag)
+                self._data[tag] = (ranges,x,y)
+                if old is None or len(old[1]) != len(x):
+                    changed.append(tag)
+        return changed
+
+    def is_loaded(self,tag):
+        '''
+        True if the data of tag that was read last has the view.
+        '''
+        with self._lock:
+            old = self._data.get(tag)
+            return old is not None and not missing_intervals(old[0],*self.view)
+
+    def _read(self,tag,ranges):
+        # the ranges from the cache, with a NaN between them so that the gap
+        # is not drawn as a line
+        xs = []
+        ys = []
+        for i,(start,end) in enumerate(ranges):
+            if i > 0:
+                xs.append([0.5*(ranges[i-1][1] + start)])
+                ys.append([numpy.nan])
+            x,y = self.cache.read(tag,start,end)
+            xs.append(x)
+            ys.append(y)
+        return numpy.concatenate(xs), numpy.concatenate(ys)
+
+    def fetch(self,tags,xmin,xmax):
+        '''
+        Move the view to xmin..xmax and load it for tags.  Only the parts of
+        xmin..xmax that are not in the cache are fetched.
+
+        Returns:
+        --------
+        list
+            tags that have new data, see load
+        '''
+        with self._lock:
+            self.view = (xmin,xmax)
+        return self._load(tags,(xmin,xmax))
+
+    def get(self,tag):
+        '''
+        Get the data of a tag in its loaded ranges, the view is fetched if
+        the tag doesn't have it yet.
+
+        Returns:
+        --------
+        x : numpy.ndarray
+            time axis (matplotlib date numbers)
+        y : numpy.ndarray
+            values
+        '''
+        if not self.is_loaded(tag):
+            self.load([tag])
+        with self._lock:
+            return self._data[tag][1:]
+
+    def dataframe(self,tags,start=None,end=None):
+        '''
+        Get the data of tags as a dataframe, the tags have their own time
+        axes so it has NaN where a tag has no sample.
+
+        Parameters:
+        -----------
+        tags : list
+            tagnames
+        start, end : timestamp, optional
+            move the view to this range first
+        '''
+        if start is not None or end is not None:
+            xmin = self.view[0] if start is None \
+                   else self._to_x(self._timestamp(start))
+            xmax = self.view[1] if end is None \
+                   else self._to_x(self._timestamp(end))
+            self.fetch(tags,xmin,xmax)
+        else:
+            self.load(tags)
+        data = {}
+        for tag in tags:
+            with self._lock:
+                x,y = self._data[tag][1:]
+            index = pandas.DatetimeIndex(matplotlib.dates.num2date(x,tz=self.tz))
+            if self.tz is None:
+                index = index.tz_localize(None)
+            data[tag] = pandas.Series(y,index=index)
+        return pandas.DataFrame(data)
+
+    def code(self):
+        '''
+        Python code that reads the loaded tags into a dataframe called df.
+        '''
+        return ("# source = proc_plot.historian.HistorianSource({!r},...)\n"
+                "df = source.dataframe({!r})\n").format(
+                    self.connector,list(self._data))
+
+    def close(self):
+        '''
+        Close the connections and the cache.
+        '''
+        self.pool.close()
+        self.cache.close()
+
+
+class SqliteHistorian(Connector):
+    '''
+    Stand-in historian in a SQLite file, to test without a historian.  The
+    samples are in a table samples (tag, time, value) with the time in
+    seconds since 1970 (UTC), make one with SqliteHistorian.write.
+    '''
+
+    def __init__(self,path,batch_size=100,delay=0.0):
+        '''
+        Parameters:
+        -----------
+        path : str
+            SQLite file
+        batch_size : int, optional
+            maximum number of tags per request
+        delay : float, optional
+            seconds every request waits, like the round trip to a historian
+        '''
+        self.path = path
+        self.batch_size = batch_size
+        self.delay = delay
+
+    def __repr__(self):
+        return 'SqliteHistorian({!r})'.format(self.path)
+
+    @staticmethod
+    def write(path,df):
+        '''
+        Write data to a stand-in file, the samples of tags that are in the
+        file already are replaced.
+
+        Parameters:
+        -----------
+        path : str
+            SQLite file
+        df : pandas.DataFrame or dict
+            data with a datetime index, or a dict of Series.  NaN values are
+            left out.
+        '''
+        series = df if isinstance(df,dict) else { t:df[t] for t in df }
+        with contextlib.closing(sqlite3.connect(path)) as db, db:
+            db.execute('CREATE TABLE IF NOT EXISTS samples '
+                       '(tag TEXT, time REAL, value REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS samples_tag '
+                       'ON samples (tag, time)')
+            for tag,s in series.items():
+                s = pandas.to_numeric(s,errors='coerce').dropna()
+                index = pandas.DatetimeIndex(s.index)
+                if index.tz is not None:
+                    index = index.tz_convert(None)
+                t = (index - pandas.Timestamp(0)) / pandas.Timedelta(seconds=1)
+                db.execute('DELETE FROM samples WHERE tag = ?',(str(tag),))
+                db.executemany('INSERT INTO samples VALUES (?,?,?)',
+                    zip([str(tag)]*len(s),t.to_numpy(dtype=float).tolist(),
+                        s.to_numpy(dtype=float).tolist()))
+
+    def connect(self):
+        return sqlite3.connect(self.path,check_same_thread=False)
+
+    def list_tags(self,conn):
+        return [ r[0] for r in
+                 conn.execute('SELECT DISTINCT tag FROM samples ORDER BY tag') ]
+
+    def fetch(self,conn,tags,start,end):
+        if self.delay:
+            time.sleep(self.delay)
+        df = pandas.read_sql_query(
+            'SELECT tag, time, value FROM samples WHERE tag IN ({}) '
+            'AND time BETWEEN ? AND ? ORDER BY tag, time'.format(
+                ','.join('?'*len(tags))),
+            conn,params=list(tags) + [start.timestamp(),end.timestamp()])
+        df['time'] = pandas.to_datetime(df['time'],unit='s')
+        return { tag:g.set_index('time')['value']
+                 for tag,g in df.groupby('tag',sort=False) }
+
+    def now(self):
+        return pandas.Timestamp.now(tz='UTC').tz_localize(None)
+
+    def key(self):
+        return 'sqlite:' + os.path.abspath(self.path)
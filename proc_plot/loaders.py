@@ -0,0 +1,287 @@
+'''
+Lazy loaders for large historian exports.
+
+Reading a large export with pandas parses every column of every row before
+anything can be plotted.  A source only reads the header when it is opened,
+so the tag list can be shown immediately.  The data of a tag is read when it
+is plotted: csv files are streamed in chunks and only the columns that are
+needed are parsed.  Timestamps are parsed once.  Columns that have been read
+are saved in a cache directory next to the file (numpy .npy files) and the
+next time the file is opened they are memory mapped from the cache.
+
+    source = proc_plot.open_csv('export.csv')
+'''
+
+import json
+import os
+
+import numpy
+import pandas
+import matplotlib.dates
+
+
+class Source():
+    '''
+    Base class of lazy data sources.  Subclasses implement _read_header and
+    _read_columns.
+
+    Attributes:
+    -----------
+    path : str
+        file
+    tags : list
+        tagnames (columns other than the index)
+    datetime : bool
+        the index is a datetime, x is in matplotlib date numbers
+    tz : datetime.tzinfo
+        time zone of the index, None if it has no time zone
+    '''
+
+    def __init__(self,path,index_col=0,cache=True,date_format=None):
+        '''
+        Parameters:
+        -----------
+        path : str
+            file to read
+        index_col : int or str, optional
+            column with the timestamps
+        cache : bool or str, optional
+            cache columns that have been read, in path + '.ppcache' or in the
+            given directory
+        date_format : str, optional
+            format of the timestamps, e.g. '%Y-%m-%d %H:%M:%S', the default is
+            to infer it from the first timestamp
+        '''
+        self.path = path
+        self.date_format = date_format
+
+        self._columns = list(self._read_header())
+        if isinstance(index_col,str):
+            index_col = self._columns.index(index_col)
+        self._index_pos = index_col
+        self.tags = [ c for i,c in enumerate(self._columns) if i != index_col ]
+
+        # Check the first rows to see if the index is a datetime
+        sample = next(self._read_columns([index_col],nrows=100)).iloc[:,0]
+        try:
+            index = pandas.DatetimeIndex(
+                pandas.to_datetime(sample.astype(str),format=date_format))
+            self.datetime = True
+            self.tz = index.tz
+        except (ValueError,TypeError):
+            self.datetime = False
+            self.tz = None
+
+        self._x = None
+        self._data = {} # tag: values
+
+        self.cache_dir = None
+        if cache:
+            self.cache_dir = cache if isinstance(cache,str) else path + '.ppcache'
+            self._check_cache()
+
+    def _read_header(self):
+        '''
+        Return the column names.
+        '''
+        raise NotImplementedError
+
+    def _read_columns(self,positions,nrows=None):
+        '''
+        Read the columns at positions (sorted), yields dataframes with rows
+        of these columns in the order of the file.
+        '''
+        raise NotImplementedError
+
+    def code(self):
+        '''
+        Python code that reads the file into a dataframe called df.
+        '''
+        raise NotImplementedError
+
+    def _check_cache(self):
+        # The cache is only valid for the same file and index column
+        stat = os.stat(self.path)
+        meta = {
+            'size' : stat.st_size,
+            'mtime' : stat.st_mtime,
+            'index_col' : self._index_pos,
+            'columns' : [ str(c) for c in self._columns ],
+            'date_format' : self.date_format,
+        }
+        meta_path = os.path.join(self.cache_dir,'meta.json')
+        try:
+            with open(meta_path) as f:
+                if json.load(f) == meta:
+                    return
+        except (OSError,ValueError):
+            pass
+
+        os.makedirs(self.cache_dir,exist_ok=True)
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(self.cache_dir,name))
+        with open(meta_path,'w') as f:
+            json.dump(meta,f)
+
+    def _cache_file(self,pos):
+        return os.path.join(self.cache_dir,'col{}.npy'.format(pos))
+
+    def _from_cache(self,pos):
+        if self.cache_dir is None:
+            return None
+        try:
+            return numpy.load(self._cache_file(pos),mmap_mode='r')
+        except OSError:
+            return None
+
+    def _to_cache(self,pos,values):
+        if self.cache_dir is not None:
+            # write to a temporary file so that a half written file is never
+            # used
+            tmp = self._cache_file(pos) + '.tmp'
+            with open(tmp,'wb') as f:
+                numpy.save(f,values)
+            os.replace(tmp,self._cache_file(pos))
+
+    def _parse_index(self,values):
+        if self.datetime:
+            t = pandas.to_datetime(values.astype(str),format=self.date_format)
+            return matplotlib.dates.date2num(pandas.DatetimeIndex(t))
+        return pandas.to_numeric(values,errors='coerce').to_numpy(dtype=float)
+
+    def load(self,tags):
+        '''
+        Read the data of tags that are not read yet, from the cache or with
+        one pass over the file.
+        '''
+        positions = []
+        for tag in tags:
+            if tag in self._data:
+                continue
+            pos = self._columns.index(tag)
+            values = self._from_cache(pos)
+            if values is not None:
+                self._data[tag] = values
+            else:
+                positions.append(pos)
+
+        if self._x is None:
+            x = self._from_cache(self._index_pos)
+            if x is not None:
+                self._x = x
+            else:
+                positions.append(self._index_pos)
+
+        if not positions:
+            return
+
+        positions.sort()
+        chunks = { pos:[] for pos in positions }
+        for df in self._read_columns(positions):
+            for i,pos in enumerate(positions):
+                col = df.iloc[:,i]
+                if pos == self._index_pos:
+                    chunks[pos].append(self._parse_index(col))
+                else:
+                    chunks[pos].append(
+                        pandas.to_numeric(col,errors='coerce').to_numpy(dtype=float))
+
+        for pos in positions:
+            values = numpy.concatenate(chunks.pop(pos))
+            values.setflags(write=False)
+            self._to_cache(pos,values)
+            if pos == self._index_pos:
+                self._x = values
+            else:
+                self._data[self._columns[pos]] = values
+
+    def get(self,tag):
+        '''
+        Get the data of a tag, it is read if needed.
+
+        Returns:
+        --------
+        x : numpy.ndarray
+            time axis (matplotlib date numbers for a datetime index), the
+            same array for all tags
+        y : numpy.ndarray
+            values, NaN if a value is not a number
+        '''
+        self.load([tag])
+        return self._x, self._data[tag]
+
+    def dataframe(self,tags):
+        '''
+        Get the data of tags as a dataframe.
+        '''
+        self.load(tags)
+        if self.datetime:
+            index = pandas.DatetimeIndex(
+                matplotlib.dates.num2date(self._x,tz=self.tz))
+            if self.tz is None:
+                index = index.tz_localize(None)
+        else:
+            index = pandas.Index(self._x)
+        return pandas.DataFrame({ t:self._data[t] for t in tags },index=index)
+
+
+class CsvSource(Source):
+    '''
+    Lazy csv file, columns are read in chunks of rows.
+    '''
+
+    def __init__(self,path,index_col=0,cache=True,date_format=None,
+                 chunksize=1 << 18,**kwargs):
+        '''
+        See Source.  chunksize is the number of rows that are parsed at a
+        time, other keyword arguments are passed to pandas.read_csv (e.g. sep)
+        '''
+        self.chunksize = chunksize
+        self.kwargs = kwargs
+        Source.__init__(self,path,index_col,cache,date_format)
+
+    def _read_header(self):
+        return pandas.read_csv(self.path,nrows=0,**self.kwargs).columns
+
+    def _read_columns(self,positions,nrows=None):
+        if nrows is not None:
+            yield pandas.read_csv(self.path,usecols=positions,nrows=nrows,
+                                  **self.kwargs)
+            return
+        with pandas.read_csv(self.path,usecols=positions,
+                             chunksize=self.chunksize,**self.kwargs) as reader:
+            for df in reader:
+                yield df
+
+    def code(self):
+        return ("df = pandas.read_csv({!r},index_col={},parse_dates=True)\n"
+                .format(self.path,self._index_pos))
+
+
+class ExcelSource(Source):
+    '''
+    Lazy Excel file.  Excel files can't be read in chunks, but only the
+    columns that are needed are read and they are cached.
+    '''
+
+    def __init__(self,path,index_col=0,cache=True,date_format=None,
+                 sheet_name=0,**kwargs):
+        '''
+        See Source.  Other keyword arguments are passed to pandas.read_excel.
+        '''
+        self.sheet_name = sheet_name
+        self.kwargs = kwargs
+        Source.__init__(self,path,index_col,cache,date_format)
+
+    def _read_header(self):
+        return pandas.read_excel(self.path,sheet_name=self.sheet_name,
+                                 nrows=0,**self.kwargs).columns
+
+    def _read_columns(self,positions,nrows=None):
+        yield pandas.read_excel(self.path,sheet_name=self.sheet_name,
+                                usecols=positions,nrows=nrows,**self.kwargs)
+
+    def code(self):
+        return ("df = pandas.read_excel({!r},sheet_name={!r},index_col={})\n"
+                .format(self.path,self.sheet_name,self._index_pos))
@@ -2,7 +2,7 @@ DEBUG=False
 
 try:
     from PyQt5 import QtCore
-    from PyQt5.QtCore import QObject
+    from PyQt5.QtCore import QObject, QAbstractListModel
 
     from PyQt5.QtWidgets import (
             QApplication,
@@ -14,8 +14,19 @@ try:
             QHBoxLayout,
             QLabel,
             QLineEdit,
+            QCheckBox,
+            QProgressBar,
             QPushButton,
-            QScrollArea,)
+            QToolButton,
+            QMenu,
+            QInputDialog,
+            QScrollArea,
+            QListView,
+            QTableWidget,
+            QTableWidgetItem,
+            QAbstractItemView,
+            QToolTip,)
+    from PyQt5.QtGui import QCursor
 except ImportError as e:
     print("------------------------------")
     print("|           ERROR            |")
@@ -29,24 +40,267 @@ except ImportError as e:
     raise e
 
 import pandas
+import numpy
 
 import matplotlib
 import matplotlib.pyplot as plt
+import matplotlib.widgets
+import matplotlib.colors
+import matplotlib.ticker
 import sys
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavBar
-from matplotlib.widgets import MultiCursor
+from matplotlib.figure import Figure
 
 import pyperclip
 
 import re
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .tagexpr import TagExpression
+from . import calc
+from .backends import MatplotlibBackend, backends
+from .loaders import CsvSource, ExcelSource
+from .historian import HistorianSource
+from .events import EventIndex
+
+
+def _index_to_x(index):
+    '''
+    Convert a dataframe index to a float64 array: matplotlib date numbers for
+    a datetime index, the index itself if it is numeric, otherwise the
+    position.
+    '''
+    if type(index) == pandas.DatetimeIndex:
+        x = matplotlib.dates.date2num(index)
+    else:
+        try:
+            x = numpy.asarray(index,dtype=float)
+        except (TypeError,ValueError):
+            x = numpy.arange(len(index))
+    return numpy.ascontiguousarray(x,dtype=float)
+
+
+def _plottable(tag,dt):
+    '''
+    Check if a column with dtype dt can be plotted.
+    '''
+    if dt in (float,int,bool,'int64'):
+        return True
+    if DEBUG:
+        print('Tag {} is not plottable'.format(tag))
+        print('    dtype is {}'.format(dt))
+    return False
+
+
+def _sparse_xy(s,x):
+    '''
+    Get the samples of Series s that are not NaN, sorted by time.
+
+    Parameters:
+    -----------
+    s : pandas.Series
+        data
+    x : numpy.ndarray
+        s.index converted with _index_to_x
+
+    Returns:
+    --------
+    (x,y) read only float64 arrays
+    '''
+    y = s.to_numpy(dtype=float)
+    valid = ~numpy.isnan(y)
+    x = x[valid]
+    y = y[valid]
+    if len(x) > 1 and (x[1:] < x[:-1]).any():
+        order = numpy.argsort(x,kind='stable')
+        x = x[order]
+        y = y[order]
+
+    x.setflags(write=False)
+    y.setflags(write=False)
+    return x, y
+
+
+def _load_tags(data,tags,sparse,x_all=None,compress=None,method='swinging_door'):
+    '''
+    Check that tags can be plotted and make their TagInfo.  For sparse data,
+    get the samples of each tag that are not NaN, memory used is then
+    proportional to the number of samples, not to the number of rows times
+    the number of tags.  Sparse data can be compressed, see set_dataframe.
+
+    This doesn't use Qt, DataLoader runs it on a worker thread.
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame or dict
+        dataframe or dict of tagname: pandas.Series
+    tags : list
+        tags to load
+    sparse : bool
+        get the samples of sparse data
+    x_all : numpy.ndarray, optional
+        the converted index of a dataframe, for sparse data
+    compress : True or float, optional
+        compress sparse data with the tolerance of the grouping rule of a
+        tag, or this tolerance if the rule has none (True: don't compress
+        tags without a tolerance)
+    method : str, optional
+        'swinging_door' or 'deadband'
+
+    Returns:
+    --------
+    list of (tagname, TagInfo, (x,y) or None)
+    '''
+    loaded = []
+    for tag in tags:
+        s = data[tag]
+        if not _plottable(tag,s.dtype):
+            continue
+        taginfo = TagInfo(tag)
+        xy = None
+        if sparse:
+            xy = _sparse_xy(s,x_all if x_all is not None else _index_to_x(s.index))
+            if compress is not None and compress is not False:
+                xy = _compress_xy(taginfo,xy,compress,method)
+        loaded.append((tag,taginfo,xy))
+    return loaded
+
+def _compress_xy(taginfo,xy,compress,method):
+    '''
+    Compress the samples of a tag, the result is kept in taginfo.compression.
+    '''
+    tol = taginfo.tolerance
+    if tol is None and compress is not True:
+        tol = float(compress)
+    if tol is None:
+        return xy
+    x,y = xy
+    idx,max_error = calc.compress(x,y,tol,method)
+    taginfo.compression = (len(x),len(idx),max_error,tol)
+    if len(idx) == len(x):
+        return xy
+    x = x[idx]
+    y = y[idx]
+    x.setflags(write=False)
+    y.setflags(write=False)
+    return x, y
+
+
+def _split_long(tags,x,y,good=None):
+    '''
+    Split long format data (a row per sample) into the samples of each tag.
+    The rows are sorted by tag and time once, the arrays of a tag are slices
+    of the sorted arrays.
+
+    Parameters:
+    -----------
+    tags : array_like
+        tagname of every row
+    x : numpy.ndarray
+        time of every row, converted with _index_to_x
+    y : numpy.ndarray
+        value of every row (float)
+    good : numpy.ndarray, optional
+        bool, True for rows with good quality
+
+    Returns:
+    --------
+    list of (tagname, x, y, good), good is None if all the samples of the tag
+    are good.  x and y are read only.
+    '''
+    # rows without a value are not samples
+    valid = ~numpy.isnan(y)
+    if not valid.all():
+        tags = numpy.asarray(tags)[valid]
+        x = x[valid]
+        y = y[valid]
+        if good is not None:
+            good = good[valid]
+
+    codes, names = pandas.factorize(tags)
+    order = numpy.lexsort((x,codes))
+    codes = codes[order]
+    x = x[order]
+    y = y[order]
+    if good is not None:
+        good = good[order]
+        # bad samples are gaps in the plot
+        y[~good] = numpy.nan
+    x.setflags(write=False)
+    y.setflags(write=False)
+
+    # rows without a tagname have code -1 and are sorted first
+    bounds = numpy.searchsorted(codes,numpy.arange(len(names)+1))
+    split = []
+    for i,name in enumerate(names):
+        i0, i1 = bounds[i], bounds[i+1]
+        g = None
+        if good is not None and not good[i0:i1].all():
+            g = good[i0:i1]
+        split.append((name,x[i0:i1],y[i0:i1],g))
+    return split
+
+def _align(xi,yi,x,linear=False):
+    '''
+    Values of a tag (xi,yi) at the times x: the last value is held, or the
+    values are interpolated for compressed tags (linear).
+    '''
+    return calc.interp(xi,yi,x) if linear else calc.hold(xi,yi,x)
+
+def _evaluate_xy(texpr,inputs,unit=None,linear=None):
+    '''
+    Evaluate a TagExpression on the (x,y) of its inputs, returns (x,y).  This
+    doesn't use Qt or the PlotManager, it can run on a worker thread.
+
+    Parameters:
+    -----------
+    texpr : TagExpression
+        expression
+    inputs : list
+        (x,y) of every tag in texpr.inputs
+    unit : float, optional
+        seconds per unit of x, if x is time
+    linear : list, optional
+        True for every input that is compressed, see _align
+    '''
+    if linear is None:
+        linear = [False]*len(inputs)
+    x = inputs[0][0]
+    if all( xi is x for xi,yi in inputs ):
+        values = [ yi for xi,yi in inputs ]
+    else:
+        # Sparse tags are sampled at different times.  Evaluate at every
+        # sample of the inputs, holding the last value of the others
+        # (compressed inputs are interpolated).
+        x = numpy.unique(numpy.concatenate([ xi for xi,yi in inputs ]))
+        values = [ _align(xi,yi,x,lin) for (xi,yi),lin in zip(inputs,linear) ]
+
+    time = None
+    if texpr.uses_time:
+        time = (x - x[0])*unit if unit else x
+    return x, texpr.evaluate(values,time)
+
+
+def _intervals(texpr,inputs,unit=None,linear=None):
+    '''
+    Time intervals where a condition holds, see PlotManager.find_condition.
+    Like _evaluate_xy this can run on a worker thread.
+    '''
+    x,y = _evaluate_xy(texpr,inputs,unit,linear)
+    starts,ends = calc.runs((y != 0) & ~numpy.isnan(y))
+    return x[starts], x[ends-1]
+
 
 class TagInfoRule():
-    def __init__(self,expr,color=None,sub=r'\1'):
+    def __init__(self,expr,color=None,sub=r'\1',tolerance=None):
         self.expr = expr
         self.rexpr = re.compile(expr)
         self.sub = sub
         self.color = color
+        self.tolerance = tolerance
 
     def get_groupid(self,tagname):
         m = self.rexpr.match(tagname)
@@ -68,14 +322,29 @@ class PlotInfo():
     tagnames : list
         list of tagnames
     ax : matplotlib.pyplot.axis
-        the axis this plotinfo is for
+        the axis this plotinfo is for (the backend's axes handle if the
+        backend is not matplotlib)
     groupid : string
         the groupid of this plotinfo/ax
+    lines : list
+        (line, x, y) of every line on the axis, used to decimate the line
+        again when the xlim changes
+    overlays : list
+        (tagname, kind, window) of rolling statistics overlays on the axis
+    events : object
+        backend handle of the events drawn on the axis, see
+        PlotManager.set_events
+    event_marks : tuple
+        (x0, x1, labels) of the events drawn on the axis, for the tooltips
     '''
     def __init__(self,tagname,groupid,ax):
         self.tagnames = [tagname]
         self.ax = ax
         self.groupid = groupid
+        self.lines = []
+        self.overlays = []
+        self.events = None
+        self.event_marks = None
 
 class TagInfo():
     '''
@@ -91,6 +360,11 @@ class TagInfo():
         tag group id
     color : str
         color of plot
+    tolerance : float
+        compression tolerance of the tag's grouping rule, None if not set
+    compression : tuple
+        (samples, samples kept, max error, tolerance) if the tag was
+        compressed, otherwise None
 
     '''
 
@@ -116,6 +390,8 @@ class TagInfo():
 
         self.groupid = None
         self.color = None
+        self.tolerance = None
+        self.compression = None
         for rule in self.taginfo_rules:
             match, gid = rule.get_groupid(self.name)
             if match:
@@ -123,6 +399,7 @@ class TagInfo():
                     print('Rule match {} - {}'.format(tagname,rule.expr))
                 self.groupid=gid
                 self.color = rule.color
+                self.tolerance = rule.tolerance
                 break
 
 
@@ -131,63 +408,1993 @@ class TagInfo():
         return
 
 
+class DataLoader(QObject):
+    '''
+    Load the tags of a dataframe in chunks, on a worker thread.  See
+    PlotManager.set_dataframe.
+
+    Signals:
+    --------
+    tags_loaded : QtCore.Signal(object)
+        Emitted for every chunk, with a list of (tagname, TagInfo, (x,y) or
+        None), see _load_tags
+    progress : QtCore.Signal(int,int)
+        Emitted after every chunk with the number of tags done and the total
+        number of tags
+    done : QtCore.Signal()
+        Emitted when all tags are loaded or loading is cancelled
+    '''
+
+    tags_loaded = QtCore.Signal(object)
+    progress = QtCore.Signal(int,int)
+    done = QtCore.Signal()
+
+    def __init__(self,data,tags,sparse,compress=None,method='swinging_door'):
+        QObject.__init__(self)
+        self.data = data
+        self.tags = tags
+        self.sparse = sparse
+        self.compress = compress
+        self.method = method
+        self.cancelled = False
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        try:
+            x_all = None
+            if self.sparse and isinstance(self.data,pandas.DataFrame):
+                x_all = _index_to_x(self.data.index)
+
+            # about 4M values per chunk
+            nrows = len(self.data.index) if x_all is not None else 1
+            chunk = min(500,max(1,(1 << 22) // max(nrows,1)))
+            for i in range(0,len(self.tags),chunk):
+                if self.cancelled:
+                    break
+                self.tags_loaded.emit(_load_tags(
+                    self.data,self.tags[i:i+chunk],self.sparse,x_all,
+                    self.compress,self.method))
+                self.progress.emit(min(i+chunk,len(self.tags)),len(self.tags))
+        except Exception as e:
+            sys.stderr.write('Error loading data\n' + str(e) + '\n')
+
+        self.done.emit()
+
+    def cancel(self):
+        '''
+        Stop loading after the current chunk.  Tags that are already loaded
+        can still be plotted.
+        '''
+        self.cancelled = True
+
+
+class RangeFetcher(QObject):
+    '''
+    Fetch the data of tags for a time range from a source that reads time
+    ranges (historian.HistorianSource), on a worker thread.  See
+    PlotManager._fetch_range.
+
+    Signals:
+    --------
+    fetched : QtCore.Signal(object)
+        Emitted when the range is fetched, with the list of tags that have
+        new data
+    '''
+
+    fetched = QtCore.Signal(object)
+
+    def __init__(self,source,tags,xmin,xmax):
+        QObject.__init__(self)
+        self.source = source
+        self.tags = tags
+        self.xlim = (xmin,xmax)
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        changed = []
+        try:
+            changed = self.source.fetch(self.tags,*self.xlim)
+        except Exception as e:
+            sys.stderr.write('Error fetching data\n' + str(e) + '\n')
+        self.fetched.emit(changed)
+
+
+class SpanIndexBuilder(QObject):
+    '''
+    Build a calc.SpanIndex of columns of a dataframe, on a worker thread.  See
+    PlotManager.active_tags.
+
+    Signals:
+    --------
+    done : QtCore.Signal(object)
+        Emitted with the calc.SpanIndex when it is built, or None if building
+        it was cancelled or failed
+    '''
+
+    done = QtCore.Signal(object)
+
+    def __init__(self,df,columns):
+        QObject.__init__(self)
+        self.df = df
+        self.columns = columns
+        self.cancelled = False
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        index = None
+        try:
+            nrows = len(self.df.index)
+            index = calc.SpanIndex(nrows,len(self.columns))
+            # about 4M values per chunk
+            chunk = max(1,(1 << 22) // max(nrows,1))
+            for k in range(0,len(self.columns),chunk):
+                if self.cancelled:
+                    index = None
+                    break
+                tags = self.columns[k:k+chunk]
+                index.add(k,self.df.iloc[:,self.df.columns.get_indexer(tags)]
+                                .to_numpy(dtype=float))
+            else:
+                index.finish()
+        except Exception as e:
+            index = None
+            sys.stderr.write('Error indexing data\n' + str(e) + '\n')
+        self.done.emit(index)
+
+    def cancel(self):
+        '''
+        Stop building after the current chunk.
+        '''
+        self.cancelled = True
+
+
 class PlotManager(QObject):
     '''
     Class that manages all the plots.
 
-    '''
+    All drawing is done by a RenderBackend, see proc_plot.backends.
+
+    Signals:
+    --------
+    xlim_changed : QtCore.Signal(float,float)
+        Emitted when the xlim of the axes changed and the zooming/panning has
+        settled.  Lines are decimated again before this is emitted.
+    plots_changed : QtCore.Signal()
+        Emitted when tags are plotted or removed, or plots are redrawn with
+        new data.
+    cursor_moved : QtCore.Signal(float)
+        Emitted with the x position of the cursor when the mouse moves over
+        the plots, at most every 50ms.
+    tags_added : QtCore.Signal(list)
+        Emitted with tagnames that can be plotted while a dataframe is loaded
+        in the background.
+    correlated_found : QtCore.Signal(str,object)
+        Emitted with a tagname and the ranking of correlated_tags when the
+        correlated tags are found from a tag's menu.
+    active_changed : QtCore.Signal()
+        Emitted when active_tags can give a result that it could not give
+        before, because the index of the dataframe it needs is built.
+    '''
+
+    xlim_changed = QtCore.Signal(float,float)
+    plots_changed = QtCore.Signal()
+    cursor_moved = QtCore.Signal(float)
+    tags_added = QtCore.Signal(list)
+    correlated_found = QtCore.Signal(str,object)
+    active_changed = QtCore.Signal()
+
+    # Role in a control loop of a tag, by the end of the tagname after the
+    # groupid, see find_loops
+    loop_roles = {
+        '.PV' : 'pv',
+        '.MEAS' : 'pv',
+        '.SP' : 'sp',
+        '.SPT' : 'sp',
+        '.OP' : 'op',
+        '.OUT' : 'op',
+        '.READVALUE' : 'pv',
+        '.HIGHLIMIT' : 'hi',
+        '.LOWLIMIT' : 'lo',
+        '.MODE' : 'mode',
+    }
+
+    def __init__(self,parent=None,backend=None):
+        '''
+        Parameters:
+        -----------
+        parent : QObject
+            Qt parent
+        backend : RenderBackend, optional
+            backend to draw with, the default is matplotlib in a PlotWindow
+        '''
+        QObject.__init__(self,parent)
+
+        self._df = None
+        self._x = None # time axis of _df, see get_time()
+        self._values = {} # tag: values converted to float
+        self._tagdata = {} # tag: (x,y) for sparse data, _df is None
+        self._source = None # lazy loaders.Source, data is read into _tagdata
+        self._quality = {} # tag: bool mask of good samples for long data
+        self._long_columns = None # (tag,time,value) columns of long data
+        self._datetime = False # time axis is matplotlib date numbers
+        self._tz = None
+
+        self._plotinfo = [] # list of info about plot
+        self._groupid_plots = {} # dictionary of plotted groupids
+        self._taginfo = {} # dictionary of tags
+
+        self._tag_definitions = {} # derived tag name: expression
+        self._derived = {} # derived tag name: TagExpression
+        self._derived_cache = {} # derived tag name: (x,y) evaluated values
+        self._overlay_cache = {} # (tag,kind,window samples): overlay values
+        self._range_index = {} # tag: calc.RangeIndex for window statistics
+
+        # Lines with more points than this are decimated to the min/max of
+        # max_points/2 bins of the visible range.
+        self.max_points = 4000
+
+        # Tags that change less than this in the visible range are not
+        # active, see active_tags
+        self.active_tolerance = 0.0
+
+        # loop_kpis: values of the mode tag that are auto (None is not 0),
+        # PV is at a limit within limit_tolerance
+        self.auto_modes = None
+        self.limit_tolerance = 0.0
+        self._kpi_index = {} # groupid: calc.KpiIndex
+        self._kpi_cache = {} # (groupid,(start,end)): KPIs of the window
+
+        # Zooming and panning changes the xlim many times, wait for it to
+        # settle before lines are decimated again.
+        self._xlim_timer = QtCore.QTimer(self)
+        self._xlim_timer.setSingleShot(True)
+        self._xlim_timer.setInterval(100)
+        self._xlim_timer.timeout.connect(self._xlim_settled)
+
+        # The mouse moves faster than the cursor readout should update
+        self._cursor_x = None
+        self._cursor_timer = QtCore.QTimer(self)
+        self._cursor_timer.setSingleShot(True)
+        self._cursor_timer.setInterval(50)
+        self._cursor_timer.timeout.connect(self._emit_cursor)
+
+        self._analysis_windows = [] # open analysis popups
+
+        # Events (alarms, operator changes) drawn on the axes, see set_events.
+        # When more than max_events are in the visible range of an axes they
+        # are counted in columns.
+        self._events = None # events.EventIndex
+        self._event_groupids = {} # tag of events: its groupid
+        self._event_filter = None # tags of the events to show, None for all
+        self.max_events = 200
+        self.event_color = 'C4'
+        self._event_tooltip = False # a tooltip of events is shown
+
+        self._loader = None # DataLoader of a dataframe loaded in background
+        self._loader_thread = None
+        self._fetcher = None # RangeFetcher of a historian source
+        self._fetcher_thread = None
+        self._fetch_pending = None # xlim to fetch when _fetcher is done
+        self._stopped_fetchers = [] # (thread,fetcher) finishing a fetch
+        self._span_index = None # calc.SpanIndex of _df, see active_tags
+        self._span_columns = {} # tag: column of _span_index
+        self._span_builder = None # SpanIndexBuilder of _span_index
+        self._span_thread = None
+
+        self.trace = None # trace.Trace to record actions in, see start_trace
+
+        self.backend = None
+        self.set_backend(backend or MatplotlibBackend(PlotWindow()))
+
+        self.legend_loc = 'upper left'
+        self.legend_fontsize = 8
+
+    def _record(self,action,*args):
+        if self.trace is not None:
+            self.trace.record(action,*args)
+
+    def set_backend(self,backend):
+        '''
+        Set the backend that draws the plots.  All plots are cleared.
+
+        Parameters:
+        -----------
+        backend : RenderBackend
+            new backend
+        '''
+        if self.backend is not None:
+            self.clear_all_plots()
+            self.backend.home_zoom.disconnect(self.home_zoom)
+            self.backend.xlim_changed.disconnect(self._on_xlim_changed)
+            self.backend.mouse_moved.disconnect(self._on_mouse_moved)
+
+        self.backend = backend
+        # plot_window is the widget that shows the plots
+        self.plot_window = backend.widget
+        backend.home_zoom.connect(self.home_zoom)
+        backend.xlim_changed.connect(self._on_xlim_changed)
+        backend.mouse_moved.connect(self._on_mouse_moved)
+
+    def set_dataframe(self,df,sparse=False,background=False,compress=None,
+                      method='swinging_door'):
+        '''
+        Set the data to plot.
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame or dict
+            dataframe with a column per tag, or a dict of tagname:
+            pandas.Series
+        sparse : bool, optional
+            keep only the samples of each tag that are not NaN, with a time
+            axis per tag, instead of keeping the dataframe.  A dict is always
+            stored sparse.
+        background : bool, optional
+            load the tags on a worker thread and return immediately.  Tags
+            can be plotted as soon as they are loaded, see tags_added.
+        compress : True or float, optional
+            compress the samples of every tag (the data is then stored
+            sparse) so that lines through the kept samples are within a
+            tolerance of all the samples.  The tolerance is set by the
+            grouping rule of a tag (see add_grouping_rule), a float is the
+            tolerance of tags without one.  See compression_report.
+        method : str, optional
+            'swinging_door' (default) or 'deadband', see calc.swinging_door
+
+        Returns:
+        --------
+        DataLoader
+            the loader if background is True, otherwise None
+        '''
+        # package function set_dataframe checks that the index is datetime index
+
+        if method not in calc.COMPRESSION_METHODS:
+            raise ValueError('Unknown compression method {}'.format(method))
+        self._clear_data()
+        if compress is not None and compress is not False:
+            sparse = True
+
+        if isinstance(df,dict):
+            indexes = [ s.index for s in df.values() ]
+            sparse = True
+        else:
+            # Check if there are duplicated columns:
+            dupcols = df.columns[ df.columns.duplicated() ]
+            if len(dupcols) > 0:
+                sys.stderr.write('WARNING: Dataframe has duplicated columns, duplicates are being dropped.\n')
+                for c in dupcols:
+                    sys.stderr.write('  Dropping {}\n'.format(c))
+            df = df.drop(columns=dupcols)
+            indexes = [ df.index ]
+
+        is_datetime = [ type(i) == pandas.DatetimeIndex for i in indexes ]
+        if any(is_datetime) and not all(is_datetime):
+            raise ValueError('Some series have a datetime index and others not')
+        self._datetime = len(indexes) > 0 and all(is_datetime)
+        self._tz = indexes[0].tz if self._datetime else None
+
+        if not sparse:
+            self._df = df
+
+        tags = list(df)
+        if background:
+            self._loader = DataLoader(df,tags,sparse,compress,method)
+            self._loader_thread = QtCore.QThread(self)
+            self._loader.moveToThread(self._loader_thread)
+            self._loader_thread.started.connect(self._loader.run)
+            self._loader.tags_loaded.connect(self._tags_loaded)
+            self._loader.done.connect(self._loading_done)
+            self._loader_thread.start()
+            return self._loader
+
+        x_all = None
+        if sparse and isinstance(df,pandas.DataFrame):
+            # all columns share the index, convert it once
+            x_all = _index_to_x(df.index)
+        self._add_tags(_load_tags(df,tags,sparse,x_all,compress,method))
+        self._apply_definitions()
+
+    def compression_report(self):
+        '''
+        How much the tags were compressed, see set_dataframe.
+
+        Returns:
+        --------
+        pandas.DataFrame
+            index tagname, columns samples, kept, ratio (samples/kept),
+            max_error and tolerance.  Only tags that were compressed.
+        '''
+        rows = { tag : ti.compression for tag,ti in self._taginfo.items()
+                 if ti.compression is not None }
+        report = pandas.DataFrame.from_dict(rows,orient='index',
+            columns=['samples','kept','max_error','tolerance'])
+        report.insert(2,'ratio',report['samples']/report['kept'])
+        report.index.name = 'tag'
+        return report
+
+    def set_source(self,source):
+        '''
+        Set a lazy data source, see proc_plot.loaders.  All the tags of the
+        source are listed but the data of a tag is only read when it is
+        needed.
+
+        Parameters:
+        -----------
+        source : loaders.Source or historian.HistorianSource
+            source to plot
+        '''
+        self._clear_data()
+        self._source = source
+        self._datetime = source.datetime
+        self._tz = source.tz
+        # the dtype isn't known before a column is read, columns that are not
+        # numbers are read as NaN
+        self._add_tags([ (t,TagInfo(t),None) for t in source.tags ])
+        self._apply_definitions()
+
+    def set_long_dataframe(self,df,tag_col='tag',time_col='time',value_col='value',
+                           quality_col=None,good=None):
+        '''
+        Set the data to plot from a dataframe in long format: a row per sample
+        with the tagname, time, value and optionally quality.  The samples of
+        every tag are stored like sparse data (see set_dataframe), the wide
+        dataframe is never made.
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame
+            data in long format
+        tag_col : str
+            column with the tagnames
+        time_col : str or None
+            column with the time, None to use the index
+        value_col : str
+            column with the values, values that are not numbers are NaN
+        quality_col : str, optional
+            column with the quality of the samples
+        good : scalar or list, optional
+            quality values that are good, e.g. 'Good' or 192.  The default is
+            that quality values that are True (not 0) are good.
+        '''
+        self._clear_data()
+
+        t = df.index if time_col is None else df[time_col]
+        if pandas.api.types.is_datetime64_any_dtype(t):
+            t = pandas.DatetimeIndex(t)
+            self._datetime = True
+            self._tz = t.tz
+        else:
+            t = pandas.Index(t)
+        x = _index_to_x(t)
+        y = pandas.to_numeric(df[value_col],errors='coerce').to_numpy(dtype=float)
+
+        mask = None
+        if quality_col is not None:
+            q = df[quality_col]
+            if good is None:
+                mask = q.fillna(0).to_numpy(dtype=bool)
+            else:
+                mask = q.isin(good if isinstance(good,(list,tuple,set)) else [good]) \
+                        .to_numpy()
+
+        loaded = []
+        for tag,xt,yt,g in _split_long(df[tag_col].to_numpy(),x,y,mask):
+            loaded.append((tag,TagInfo(tag),(xt,yt)))
+            if g is not None:
+                self._quality[tag] = g
+        self._long_columns = (tag_col,time_col,value_col)
+        self._add_tags(loaded)
+        self._apply_definitions()
+
+    def set_arrays(self,data,datetime=False,tz=None):
+        '''
+        Set the data to plot as arrays, they are used as is (not copied).
+        See proc_plot.remote.
+
+        Parameters:
+        -----------
+        data : dict
+            tagname: (x,y) float64 arrays, x is sorted.  Tags can share x.
+        datetime : bool, optional
+            x is matplotlib date numbers
+        tz : tzinfo, optional
+            timezone of the time axis
+        '''
+        self._clear_data()
+        self._datetime = datetime
+        self._tz = tz
+        self._add_tags([ (tag,TagInfo(tag),xy) for tag,xy in data.items() ])
+        self._apply_definitions()
+
+    def get_quality(self,tag):
+        '''
+        Get the quality of the samples of a tag set with set_long_dataframe.
+
+        Returns:
+        --------
+        numpy.ndarray
+            bool, True for good samples, same length as the arrays of
+            get_xy.  None if all the samples are good (or there is no
+            quality).
+        '''
+        return self._quality.get(tag)
+
+    def _clear_data(self):
+        self._stop_loader()
+        self._stop_fetcher()
+        self._stop_span_builder()
+        self._close_analysis_windows()
+
+        # clear the _taginfo to avoid unnecesary looping in clear_all_plots
+        self._taginfo.clear()
+        self.clear_all_plots()
+
+        self._df = None
+        self._x = None
+        self._values.clear()
+        self._tagdata.clear()
+        self._source = None
+        self._quality.clear()
+        self._long_columns = None
+
+        # Derived tags are kept when the data changes, but they are
+        # evaluated again with the new data.
+        self._derived.clear()
+        self._derived_cache.clear()
+        self._overlay_cache.clear()
+        self._range_index.clear()
+        self._span_index = None
+        self._span_columns = {}
+        self.clear_kpi_cache()
+
+    def _add_tags(self,loaded):
+        '''
+        Add tags from _load_tags, returns the tagnames.
+        '''
+        for tag,taginfo,xy in loaded:
+            if xy is not None:
+                self._tagdata[tag] = xy
+            self._taginfo[tag] = taginfo
+        return [ tag for tag,taginfo,xy in loaded ]
+
+    def _apply_definitions(self):
+        '''
+        Define the derived tags for new data, returns the new tagnames.
+        '''
+        new = []
+        for name,expr in list(self._tag_definitions.items()):
+            try:
+                if self._define_tag(name,expr):
+                    new.append(name)
+            except ValueError as e:
+                sys.stderr.write('WARNING: Derived tag {} is not defined: {}\n' \
+                    .format(name,e))
+        return new
+
+    def is_loading(self):
+        '''
+        True while a dataframe is loaded in the background.
+        '''
+        return self._loader is not None
+
+    def is_fetching(self):
+        '''
+        True while data of a time range is fetched from a historian.
+        '''
+        return self._fetcher is not None
+
+    def _stop_fetcher(self):
+        self._fetch_pending = None
+        if self._fetcher is None:
+            return
+        # the fetch can't be interrupted, it finishes without waiting for
+        # it and its result is dropped
+        self._fetcher.fetched.disconnect(self._range_fetched)
+        self._fetcher_thread.finished.connect(self._fetcher_stopped)
+        self._stopped_fetchers.append((self._fetcher_thread,self._fetcher))
+        self._fetcher_thread.quit()
+        self._fetcher = None
+        self._fetcher_thread = None
+
+    @QtCore.pyqtSlot()
+    def _fetcher_stopped(self):
+        thread = self.sender()
+        self._stopped_fetchers = [ f for f in self._stopped_fetchers
+                                   if f[0] is not thread ]
+        thread.deleteLater()
+
+    def _stop_loader(self):
+        if self._loader is None:
+            return
+        self._loader.cancel()
+        self._loader_thread.quit()
+        self._loader_thread.wait()
+        self._loader = None
+        self._loader_thread = None
+
+    def _stop_span_builder(self):
+        if self._span_builder is None:
+            return
+        self._span_builder.cancel()
+        self._span_thread.quit()
+        self._span_thread.wait()
+        self._span_builder = None
+        self._span_thread = None
+
+    def _build_span_index(self,columns):
+        '''
+        Start building the calc.SpanIndex of columns of the dataframe on the
+        SpanIndexBuilder's thread, see active_tags.
+        '''
+        if self._span_builder is not None:
+            return
+        self._span_builder = SpanIndexBuilder(self._df,list(columns))
+        self._span_thread = QtCore.QThread(self)
+        self._span_builder.moveToThread(self._span_thread)
+        self._span_thread.started.connect(self._span_builder.run)
+        self._span_builder.done.connect(self._span_index_built)
+        self._span_thread.start()
+
+    @QtCore.pyqtSlot(object)
+    def _span_index_built(self,index):
+        if self.sender() is not self._span_builder:
+            return
+        columns = self._span_builder.columns
+        self._span_thread.quit()
+        self._span_thread.wait()
+        self._span_builder = None
+        self._span_thread = None
+        if index is None:
+            return
+        self._span_index = index
+        self._span_columns = { t:j for j,t in enumerate(columns) }
+        self.active_changed.emit()
+
+    @QtCore.pyqtSlot(object)
+    def _tags_loaded(self,loaded):
+        # chunks of a cancelled loader can still be queued
+        if self.sender() is not self._loader:
+            return
+        self.tags_added.emit(self._add_tags(loaded))
+
+    @QtCore.pyqtSlot()
+    def _loading_done(self):
+        if self.sender() is not self._loader:
+            return
+        self._loader_thread.quit()
+        self._loader_thread.wait()
+        self._loader = None
+        self._loader_thread = None
+
+        # derived tags need all their inputs
+        new = self._apply_definitions()
+        if new:
+            self.tags_added.emit(new)
+
+    def define_tag(self,name,expr):
+        '''
+        Define (or redefine) a derived tag.
+
+        Parameters:
+        -----------
+        name : str
+            name of the derived tag
+        expr : str
+            expression in terms of other tags
+
+        Returns:
+        --------
+        bool
+            True if this is a new tag that needs a TagTool
+        '''
+        if DEBUG:
+            print('PlotManager::define_tag({},{})'.format(name,expr))
+
+        if ( (self._df is None and not self._tagdata and self._source is None)
+             or self.is_loading() ):
+            # Evaluated when the dataframe is set
+            self._tag_definitions[name] = expr
+            return False
+
+        new = self._define_tag(name,expr)
+        self._tag_definitions[name] = expr
+        return new
+
+    def _define_tag(self,name,expr):
+        if self._df is None:
+            if name in self._tagdata or (self._source and name in self._source.tags):
+                raise ValueError('{} is a tag in the data'.format(name))
+        elif name in self._df.columns:
+            raise ValueError('{} is a column in the dataframe'.format(name))
+
+        tagnames = set(self._taginfo)
+        tagnames.discard(name)
+        texpr = TagExpression(expr,tagnames)
+
+        # Check for circular definitions
+        todo = list(texpr.inputs)
+        while todo:
+            t = todo.pop()
+            if t == name:
+                raise ValueError('Circular definition of {}'.format(name))
+            if t in self._derived:
+                todo.extend(self._derived[t].inputs)
+
+        self._derived[name] = texpr
+        changed = self._invalidate(name)
+
+        if name in self._taginfo:
+            for pi in self._plotinfo:
+                if changed.intersection(pi.tagnames):
+                    self.replot(pi,save_xlim=True)
+            self.plots_changed.emit()
+            return False
+        else:
+            self._taginfo[name] = TagInfo(name)
+            return True
+
+    def _invalidate(self,tag):
+        '''
+        Remove cached values of tag and all derived tags that depend on it.
+        Returns the set of invalidated tags.
+        '''
+        changed = {tag}
+        self._derived_cache.pop(tag,None)
+        for key in [ k for k in self._overlay_cache if k[0] == tag ]:
+            del self._overlay_cache[key]
+        self._range_index.pop(tag,None)
+        if self._kpi_index or self._kpi_cache:
+            self.clear_kpi_cache()
+        for name,texpr in self._derived.items():
+            if tag in texpr.inputs and name not in changed:
+                changed |= self._invalidate(name)
+        return changed
+
+    def get_time(self):
+        '''
+        Get the time axis of the dataframe as a float64 array (matplotlib date
+        numbers if the index is a datetime index).  The index is converted once
+        per dataframe and the array is shared by all the lines, it is read
+        only.  Sparse data has no common time axis, see get_xy.
+        '''
+        if self._x is None:
+            x = _index_to_x(self._df.index)
+            x.setflags(write=False)
+            self._x = x
+        return self._x
+
+    def _time_unit(self):
+        '''
+        Seconds per unit of the time axis, None if it is not a datetime axis.
+        '''
+        if self._datetime:
+            return 86400.0
+        return None
+
+    def get_xy(self,tag):
+        '''
+        Get the data of a tag as float64 arrays.  Derived tags are evaluated
+        the first time they are requested.
+
+        Returns:
+        --------
+        x : numpy.ndarray
+            time axis, see get_time.  Every tag has its own time axis for
+            sparse data.
+        y : numpy.ndarray
+            values
+        '''
+        if tag in self._derived:
+            return self._get_derived(tag)
+
+        try:
+            return self._tagdata[tag]
+        except KeyError:
+            pass
+
+        if self._source is not None:
+            xy = self._source.get(tag)
+            self._tagdata[tag] = xy
+            return xy
+
+        x = self.get_time()
+        try:
+            return x, self._values[tag]
+        except KeyError:
+            pass
+
+        # A float column is not copied, other columns are converted once.
+        y = self._df[tag].to_numpy(dtype=float)
+        if self._df[tag].dtype != float:
+            self._values[tag] = y
+        return x, y
+
+    def get_data(self,tag):
+        '''
+        Get the data of a tag as a pandas Series.
+        '''
+        if self._df is not None and tag not in self._derived:
+            return self._df[tag]
+
+        x,y = self.get_xy(tag)
+        if self._df is not None:
+            index = self._df.index
+        elif self._datetime:
+            index = pandas.DatetimeIndex(matplotlib.dates.num2date(x,tz=self._tz))
+            if self._tz is None:
+                index = index.tz_localize(None)
+        else:
+            index = x
+        return pandas.Series(y,index=index,name=tag)
+
+    def _get_derived(self,tag):
+        try:
+            return self._derived_cache[tag]
+        except KeyError:
+            pass
+
+        x,y = self._evaluate(self._derived[tag])
+        self._derived_cache[tag] = (x,y)
+        return x,y
+
+    def _evaluate(self,texpr):
+        '''
+        Evaluate a TagExpression, returns (x,y).
+        '''
+        inputs = [ self.get_xy(t) for t in texpr.inputs ]
+        return _evaluate_xy(texpr,inputs,self._time_unit(),
+                            [ self._is_compressed(t) for t in texpr.inputs ])
+
+    def _is_compressed(self,tag):
+        '''
+        True if the samples of tag are the corners of straight lines (see
+        set_dataframe with compress), values between them are interpolated.
+        '''
+        taginfo = self._taginfo.get(tag)
+        return taginfo is not None and taginfo.compression is not None
+
+    def get_overlay(self,tag,kind,window):
+        '''
+        Get a rolling statistics overlay of a tag.  Results are cached per
+        tag, kind and window.  Compressed tags have no overlays, the window
+        is a number of samples and their samples are not evenly spaced.
+
+        Parameters:
+        -----------
+        tag : str
+            tagname
+        kind : str
+            'mean', 'std' or 'minmax'
+        window : int or str
+            window in samples or time span e.g. '5min'
+
+        Returns:
+        --------
+        list of (label, numpy.ndarray)
+        '''
+        if self._is_compressed(tag):
+            raise ValueError('Tag {} is compressed, rolling statistics need '
+                             'evenly spaced samples'.format(tag))
+        x,y = self.get_xy(tag)
+        n = calc.window_samples(window,x,self._time_unit())
+        key = (tag,kind,n)
+        try:
+            return self._overlay_cache[key]
+        except KeyError:
+            pass
+
+        overlay = calc.rolling(y,n,kind)
+        self._overlay_cache[key] = overlay
+        return overlay
+
+    def get_range_index(self,tag):
+        '''
+        Get the calc.RangeIndex of a tag, it is built the first time it is
+        needed.
+        '''
+        try:
+            return self._range_index[tag]
+        except KeyError:
+            pass
+        index = calc.RangeIndex(*self.get_xy(tag),unit=self._time_unit(),
+                                linear=self._is_compressed(tag))
+        self._range_index[tag] = index
+        return index
+
+    def window_stats(self,xlim=None):
+        '''
+        Statistics of all plotted tags over a time range.  Each query takes
+        O(log n) with the tag's RangeIndex.
+
+        Parameters:
+        -----------
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is the visible range
+
+        Returns:
+        --------
+        pandas.DataFrame
+            index is tagnames, columns are count, min, max, mean, std and
+            integral (value*hours for a datetime index)
+        '''
+        tags = [ t for pi in self._plotinfo for t in pi.tagnames ]
+        if len(tags) == 0:
+            return pandas.DataFrame(columns=['count','min','max','mean',
+                                             'std','integral'])
+        if xlim is None:
+            xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+
+        stats = [ self.get_range_index(t).window_stats(*xlim) for t in tags ]
+        return pandas.DataFrame(stats,index=tags)
+
+    def cursor_values(self,xc,tags=None):
+        '''
+        Values of tags at a time: the last sample at or before xc, or the
+        value interpolated between the samples for compressed tags.  Each tag
+        is a binary search of its time axis, O(log n).
+
+        Parameters:
+        -----------
+        xc : float
+            time in axes units
+        tags : list, optional
+            tags to get values for, the default is all plotted tags
+
+        Returns:
+        --------
+        dict
+            tag: value (NaN if there is no sample before xc)
+        '''
+        if tags is None:
+            tags = [ t for pi in self._plotinfo for t in pi.tagnames ]
+        values = {}
+        for tag in tags:
+            x,y = self.get_xy(tag)
+            if self._is_compressed(tag):
+                values[tag] = float(calc.interp(x,y,[xc])[0])
+                continue
+            i = x.searchsorted(xc,'right') - 1
+            values[tag] = float(y[i]) if i >= 0 else numpy.nan
+        return values
+
+    def active_tags(self,xlim=None,tolerance=None):
+        '''
+        Find the tags that change (max - min > tolerance) in a time range.
+
+        Columns of the dataframe are reduced together, in chunks of columns
+        over the rows in the range.  When the range has too many values to
+        scan on every zoom, a calc.SpanIndex of the columns is used instead.
+        It is built on a worker thread the first time it is needed, until it
+        is built the columns are active and active_changed is emitted when it
+        is done.  Tags that have a RangeIndex (sparse data, or used in the
+        statistics) use it instead.  Derived tags that have not been
+        calculated, and tags that are not read from a lazy source yet, are
+        always active.
+
+        Parameters:
+        -----------
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is the visible range, or
+            all the data if nothing is plotted
+        tolerance : float, optional
+            the default is active_tolerance
+
+        Returns:
+        --------
+        set
+            active tagnames
+        '''
+        if tolerance is None:
+            tolerance = self.active_tolerance
+        if xlim is None and len(self._plotinfo) > 0:
+            xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+        if xlim is None:
+            xlim = (-numpy.inf,numpy.inf)
+
+        active = set()
+        columns = []
+        for tag in self._taginfo:
+            if tag in self._range_index:
+                s = self._range_index[tag].window_stats(*xlim)
+                if s['max'] - s['min'] > tolerance:
+                    active.add(tag)
+            elif tag in self._derived:
+                if tag not in self._derived_cache:
+                    active.add(tag)
+                    continue
+                x,y = self._derived_cache[tag]
+                i0,i1 = x.searchsorted(xlim[0],'left'), x.searchsorted(xlim[1],'right')
+                if i1 > i0 and numpy.fmax.reduce(y[i0:i1]) - numpy.fmin.reduce(y[i0:i1]) > tolerance:
+                    active.add(tag)
+            elif self._df is None:
+                if tag not in self._tagdata:
+                    # not read from the source yet
+                    active.add(tag)
+                    continue
+                x,y = self._tagdata[tag]
+                i0,i1 = x.searchsorted(xlim[0],'left'), x.searchsorted(xlim[1],'right')
+                if i1 > i0 and numpy.fmax.reduce(y[i0:i1]) - numpy.fmin.reduce(y[i0:i1]) > tolerance:
+                    active.add(tag)
+            else:
+                columns.append(tag)
+
+        if columns:
+            x = self.get_time()
+            i0,i1 = x.searchsorted(xlim[0],'left'), x.searchsorted(xlim[1],'right')
+            if (i1-i0)*len(columns) > (1 << 22):
+                columns = self._indexed_active(columns,i0,i1,tolerance,active)
+            if i1 > i0 and columns:
+                # at most about 4M values (32MB) at a time
+                chunk = max(1,(1 << 22) // (i1-i0))
+                for k in range(0,len(columns),chunk):
+                    tags = columns[k:k+chunk]
+                    a = self._df.iloc[i0:i1,self._df.columns.get_indexer(tags)] \
+                            .to_numpy(dtype=float)
+                    with numpy.errstate(invalid='ignore'):
+                        span = numpy.fmax.reduce(a,axis=0) - numpy.fmin.reduce(a,axis=0)
+                    active.update( t for t,d in zip(tags,span > tolerance) if d )
+
+        return active
+
+    def _indexed_active(self,columns,i0,i1,tolerance,active):
+        '''
+        Add the columns that change in rows [i0,i1) to active, with the
+        SpanIndex.  Returns the columns that are not in the index.
+        '''
+        missing = [ t for t in columns if t not in self._span_columns ]
+        if (i1-i0)*len(missing) > (1 << 22):
+            # not known until the index is built, it is built when the
+            # dataframe is loaded
+            if self._loader is None:
+                self._build_span_index(columns)
+            active.update(missing)
+            missing = []
+
+        if self._span_index is not None:
+            positions = self._df.columns.get_indexer(list(self._span_columns))
+            spans = self._span_index.spans(i0,i1,
+                lambda r0,r1: self._df.iloc[r0:r1,positions].to_numpy(dtype=float))
+            active.update( t for t in columns if t in self._span_columns
+                           and spans[self._span_columns[t]] > tolerance )
+        return missing
+
+    def find_condition(self,expr):
+        '''
+        Find the time intervals where a condition holds, e.g.
+        'FIC101.PV > FIC101.SP + 5'.  The condition is evaluated on all the
+        data like a derived tag, see define_tag.
+
+        Parameters:
+        -----------
+        expr : str
+            condition
+
+        Returns:
+        --------
+        start, end : numpy.ndarray
+            time of the first and last sample of each interval where the
+            condition is true, in axes units
+        '''
+        texpr = TagExpression(expr,set(self._taginfo))
+        inputs = [ self.get_xy(t) for t in texpr.inputs ]
+        return _intervals(texpr,inputs,self._time_unit(),
+                          [ self._is_compressed(t) for t in texpr.inputs ])
+
+    def zoom_to(self,xmin,xmax):
+        '''
+        Zoom all axes to a time range, with a margin of 10% on each side.
+        '''
+        if len(self._plotinfo) == 0:
+            return
+        margin = 0.1*(xmax - xmin)
+        if margin <= 0:
+            margin = 1/1440 if self._time_unit() else 1.0
+        self.backend.set_xlim(self._plotinfo[0].ax,xmin-margin,xmax+margin)
+        self.backend.draw()
+
+    def cross_correlation(self,tag1,tag2,xlim=None):
+        '''
+        Cross-correlation of two tags over a time range, e.g. to estimate the
+        dead time between an MV and a CV.  The tags' cached arrays are used
+        as is if they share the time axis, otherwise they are resampled to a
+        common time axis.  Lags up to half of the time range are calculated.
+        See calc.xcorr.
+
+        Parameters:
+        -----------
+        tag1, tag2 : str
+            tagnames, a positive lag means tag2 follows tag1
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is the visible range
+
+        Returns:
+        --------
+        lags : numpy.ndarray
+            lag, in seconds for a datetime axis
+        corr : numpy.ndarray
+            correlation coefficient at each lag
+        peak : int
+            index of the peak (largest absolute correlation)
+        '''
+        if xlim is None:
+            xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+        x1,y1 = self.get_xy(tag1)
+        x2,y2 = self.get_xy(tag2)
+
+        def window(x):
+            return x.searchsorted(xlim[0],'left'), x.searchsorted(xlim[1],'right')
+
+        i0,i1 = window(x1)
+        if x1 is x2:
+            x = x1[i0:i1]
+            a = y1[i0:i1]
+            b = y2[i0:i1]
+            if len(x) < 2:
+                raise ValueError('Not enough samples in the time range')
+            dt = numpy.median(numpy.diff(x))
+        else:
+            j0,j1 = window(x2)
+            if i1 - i0 < 2 or j1 - j0 < 2:
+                raise ValueError('Not enough samples in the time range')
+            dt = min( numpy.median(numpy.diff(x1[i0:i1])),
+                      numpy.median(numpy.diff(x2[j0:j1])) )
+            # the fastest tag's sample interval, over at most as many samples
+            # as the two tags have together
+            n = min( int((xlim[1]-xlim[0])/dt) + 1, (i1-i0) + (j1-j0) )
+            x = numpy.linspace(xlim[0],xlim[1],n)
+            dt = x[1] - x[0]
+            a = _align(x1,y1,x,self._is_compressed(tag1))
+            b = _align(x2,y2,x,self._is_compressed(tag2))
+
+        # at larger lags less than half of the samples overlap
+        lags,corr = calc.xcorr(a,b,len(a)//2)
+        unit = self._time_unit()
+        lags = lags*dt*unit if unit else lags*dt
+        peak = int(numpy.nanargmax(numpy.abs(corr)))
+        return lags, corr, peak
+
+    @QtCore.pyqtSlot(str)
+    def xcorr_dialog(self,tag):
+        '''
+        Ask for a second plotted tag and show the cross-correlation with tag
+        over the visible range.
+        '''
+        try:
+            tags = [ t for pi in self._plotinfo for t in pi.tagnames if t != tag ]
+            if len(tags) == 0:
+                QMessageBox.information(None,'Cross-correlation',
+                                        'Plot another tag to correlate with.')
+                return
+            other,ok = QInputDialog.getItem(
+                None,'Cross-correlation',
+                'Correlate {} with:'.format(tag),
+                tags,0,False)
+            if ok:
+                self.show_xcorr(tag,other)
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::xcorr_dialog\n' \
+                + str(e) + '\n')
+
+    def show_xcorr(self,tag1,tag2,xlim=None):
+        '''
+        Show the cross-correlation of two tags in a popup window, see
+        cross_correlation.
+        '''
+        lags,corr,peak = self.cross_correlation(tag1,tag2,xlim)
+
+        window = AnalysisWindow('Cross-correlation {} - {}'.format(tag1,tag2))
+        ax = window.fig.add_subplot()
+        ax.plot(lags,corr)
+        ax.axvline(lags[peak],color='r',linestyle='--',linewidth=0.8)
+        ax.set_xlabel('Lag [s]' if self._time_unit() else 'Lag')
+        ax.set_ylabel('Correlation')
+        ax.set_title('{} follows {} by {:.4g}, r = {:.3f}'.format(
+            tag2,tag1,lags[peak],corr[peak]))
+        ax.grid(True)
+        window.fig.tight_layout()
+
+        return self._show_analysis(window)
+
+    def _common_xy(self,tags):
+        '''
+        Values of tags at the same times.  Tags that don't share the time
+        axis hold their last value (or are interpolated if they are
+        compressed) at the samples of the tag with the most samples.
+
+        Returns:
+        --------
+        x : numpy.ndarray
+            time
+        values : list
+            numpy.ndarray for every tag
+        '''
+        xy = [ self.get_xy(t) for t in tags ]
+        x = max( (xi for xi,yi in xy), key=len )
+        return x, [ yi if xi is x else _align(xi,yi,x,self._is_compressed(t))
+                    for t,(xi,yi) in zip(tags,xy) ]
+
+    def show_histogram(self,tag,bins=100):
+        '''
+        Show the histogram of the visible samples of a tag in a popup window,
+        see DensityWindow.
+        '''
+        return self._show_analysis(DensityWindow(self,[tag],bins))
+
+    def show_density(self,xtag,ytag,bins=200):
+        '''
+        Show the density of ytag against xtag over the visible time range in a
+        popup window, e.g. a valve's flow against its OP.  See DensityWindow.
+        '''
+        return self._show_analysis(DensityWindow(self,[xtag,ytag],bins))
+
+    def heatmap(self,tags,xlim=None,ncols=1000):
+        '''
+        Tags as rows of an image: the mean of every tag in ncols columns of
+        the time range, scaled to 0..1 per tag over the range.
+
+        Parameters:
+        -----------
+        tags : list
+            tagnames
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is the visible range or
+            all the data
+        ncols : int, optional
+            number of columns
+
+        Returns:
+        --------
+        edges : numpy.ndarray
+            ncols+1 column edges
+        image : numpy.ndarray
+            (len(tags),ncols), NaN where a tag has no value
+        '''
+        if xlim is None:
+            xlim = self._visible_xlim()
+        edges = numpy.linspace(xlim[0],xlim[1],ncols+1)
+        image = numpy.full((len(tags),ncols),numpy.nan)
+        for i,tag in enumerate(tags):
+            x,y = self.get_xy(tag)
+            if len(x) == 0:
+                continue
+            row = calc.column_means(x,y,edges)
+            valid = ~numpy.isnan(row)
+            if not valid.any():
+                continue
+            lo, hi = row[valid].min(), row[valid].max()
+            image[i] = (row - lo)/(hi - lo) if hi > lo else numpy.where(valid,0.5,numpy.nan)
+        return edges, image
+
+    def _visible_xlim(self):
+        '''
+        The xlim of the plots, or the time range of all the tags if nothing
+        is plotted.
+        '''
+        if self._plotinfo:
+            return tuple( float(v) for v in self.backend.get_xlim(self._plotinfo[0].ax) )
+        if self._df is not None and self._source is None and len(self._df.index):
+            # all the columns share the time axis
+            x = self.get_time()
+            return (float(x[0]),float(x[-1]))
+        xs = [ self.get_xy(t)[0] for t in self._taginfo ]
+        xs = [ x for x in xs if len(x) ]
+        if not xs:
+            return (0.0,1.0)
+        return ( float(min( x[0] for x in xs )), float(max( x[-1] for x in xs )) )
+
+    def show_heatmap(self,tags):
+        '''
+        Show tags as rows of a heatmap in a popup window, see HeatmapWindow.
+        '''
+        if len(tags) == 0:
+            raise ValueError('No tags to show')
+        return self._show_analysis(HeatmapWindow(self,tags))
+
+    def _show_analysis(self,window):
+        self._analysis_windows.append(window)
+        window.destroyed.connect(
+            lambda obj=None,w=window: self._analysis_windows.remove(w))
+        window.show()
+        return window
+
+    def _close_analysis_windows(self):
+        '''
+        Close the analysis popups, they show data that is being cleared.
+        '''
+        for window in list(self._analysis_windows):
+            if isinstance(window,(DensityWindow,HeatmapWindow)):
+                # the window is deleted later, stop following the plots now
+                self.xlim_changed.disconnect(window.update_range)
+            window.close()
+
+    @QtCore.pyqtSlot(str)
+    def histogram_requested(self,tag):
+        try:
+            self.show_histogram(tag)
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::histogram_requested\n' \
+                + str(e) + '\n')
+
+    @QtCore.pyqtSlot(str)
+    def density_dialog(self,tag):
+        '''
+        Ask for a second tag and show the density of that tag against tag.
+        '''
+        try:
+            # plotted tags first
+            plotted = [ t for pi in self._plotinfo for t in pi.tagnames ]
+            tags = list(dict.fromkeys(plotted + sorted(self._taginfo)))
+            tags.remove(tag)
+            if len(tags) == 0:
+                return
+            other,ok = QInputDialog.getItem(
+                None,'XY density',
+                'Plot against {}:'.format(tag),
+                tags,0,False)
+            if ok:
+                self.show_density(tag,other)
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::density_dialog\n' \
+                + str(e) + '\n')
+
+    def find_loops(self):
+        '''
+        Find the control loops in the data: tags with the same groupid (see
+        the grouping rules) that are the PV and the SP, OP, limits or mode of
+        a loop, see loop_roles.  Tags that are not grouped are found by name,
+        e.g. the OP (the default rules only group PV and SP).
+
+        Returns:
+        --------
+        dict
+            groupid: {role:tag}, roles are 'pv' and some of 'sp', 'op',
+            'hi', 'lo' and 'mode'
+        '''
+        loops = {}
+        for tag,taginfo in self._taginfo.items():
+            gid = taginfo.groupid
+            if gid is None or not tag.startswith(gid):
+                continue
+            role = self.loop_roles.get(tag[len(gid):].upper())
+            if role is not None:
+                loops.setdefault(gid,{}).setdefault(role,tag)
+
+        for gid,roles in loops.items():
+            for suffix,role in self.loop_roles.items():
+                if role not in roles and gid + suffix in self._taginfo:
+                    roles[role] = gid + suffix
+
+        return { gid:roles for gid,roles in loops.items()
+                 if 'pv' in roles and len(roles) > 1 }
+
+    def loop_health(self,loops=None,xlim=None,workers=None):
+        '''
+        Health indicators of control loops (IAE, oscillation, saturation and
+        stiction), see calc.loop_health.
+
+        Loops that share their time axis are stacked in chunks of about 4M
+        values and the chunks are calculated on a thread pool (numpy doesn't
+        hold the GIL), so the data is not copied to other processes.
+
+        Parameters:
+        -----------
+        loops : dict, optional
+            groupid: {'pv':tag, 'sp':tag, 'op':tag}, the default is
+            find_loops()
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is all the data
+        workers : int, optional
+            number of threads, the default is the number of CPUs
+
+        Returns:
+        --------
+        pandas.DataFrame
+            index is groupids, columns are pv, sp, op, iae, oscillation,
+            saturation and stiction
+        '''
+        if loops is None:
+            loops = self.find_loops()
+        unit = self._time_unit() or 1.0
+
+        # Get the data here, get_xy is not thread safe.  chunks are keyed
+        # by the time axis and the roles of the loops.
+        groups = {}
+        for gid,roles in loops.items():
+            x,ys = self._loop_data({ r:t for r,t in roles.items()
+                                     if r in ('pv','sp','op') })
+            key = (id(x),tuple(sorted(ys)))
+            groups.setdefault(key,(x,[]))[1].append((gid,ys))
+
+        def calculate(x,chunk):
+            i0, i1 = 0, len(x)
+            if xlim is not None:
+                i0, i1 = x.searchsorted(xlim[0],'left'), x.searchsorted(xlim[1],'right')
+            t = (x[i0:i1] - x[i0])*unit if i1 > i0 else x[i0:i1]
+            stack = lambda role: numpy.stack([ ys[role][i0:i1] for gid,ys in chunk ]) \
+                if role in chunk[0][1] else None
+            health = calc.loop_health(t,stack('pv'),stack('sp'),stack('op'))
+            return [ gid for gid,ys in chunk ], health
+
+        jobs = []
+        for x,members in groups.values():
+            size = max(1,(1 << 22) // max(len(x),1))
+            for i in range(0,len(members),size):
+                jobs.append((x,members[i:i+size]))
+
+        rows = {}
+        with ThreadPoolExecutor(workers) as pool:
+            for gids,health in pool.map(lambda job: calculate(*job),jobs):
+                for i,gid in enumerate(gids):
+                    rows[gid] = { k:v[i] for k,v in health.items() }
+
+        columns = ['iae','oscillation','saturation','stiction']
+        health = pandas.DataFrame.from_dict(rows,orient='index',columns=columns)
+        tags = pandas.DataFrame.from_dict(loops,orient='index',columns=['pv','sp','op'])
+        return tags.join(health).sort_index()
+
+    def correlated_tags(self,tag,xlim=None,maxlag=0.0,top=20,npoints=2000,
+                        workers=None):
+        '''
+        Rank all the other tags by their correlation with a tag over a time
+        range, e.g. to find what else moved during an upset.
+
+        Every tag is averaged in npoints bins of the range and standardized,
+        the correlations of a chunk of tags (about 4M values) with the tag at
+        all the lags are one matrix product (see calc.lagged_correlation).
+        Chunks are calculated on a thread pool like loop_health.
+
+        Parameters:
+        -----------
+        tag : str
+            tagname
+        xlim : tuple, optional
+            (xmin,xmax) in axes units, the default is the visible range
+        maxlag : float, optional
+            largest lag to try, in seconds (x units if x is not time)
+        top : int, optional
+            number of tags to return, None for all
+        npoints : int, optional
+            number of bins
+        workers : int, optional
+            number of threads, the default is the number of CPUs
+
+        Returns:
+        --------
+        pandas.DataFrame
+            index tagnames, columns corr and lag (a positive lag means the
+            tag follows tag), sorted by the absolute correlation
+        '''
+        if xlim is None:
+            xlim = self._visible_xlim()
+        edges = numpy.linspace(xlim[0],xlim[1],npoints+1)
+        unit = self._time_unit() or 1.0
+        step = (edges[1] - edges[0])*unit
+        nlag = min(int(round(maxlag/step)) if step > 0 else 0, npoints//2)
+
+        x,y = self.get_xy(tag)
+        ref = calc.standardize(calc.column_means(x,y,edges)[:,None])[:,0]
+
+        # Columns of the dataframe are read in blocks, the other tags (sparse
+        # or derived) are read here because get_xy is not thread safe.
+        others = [ t for t in self._taginfo if t != tag ]
+        dense = []
+        if self._df is not None and self._source is None:
+            dense = [ t for t in others
+                      if t not in self._derived and t not in self._tagdata ]
+            others = [ t for t in others if t in self._derived or t in self._tagdata ]
+        others = [ (t,self.get_xy(t)) for t in others ]
+
+        def binned(block):
+            if block[0] == 'df':
+                x = self.get_time()
+                bounds = x.searchsorted(edges,'left')
+                v = self._df.iloc[bounds[0]:bounds[-1],block[1]].to_numpy(dtype=float)
+                return calc.bin_means(v,bounds - bounds[0])
+            return numpy.stack([ calc.column_means(x,y,edges)
+                                 for t,(x,y) in block[1] ],axis=1)
+
+        def calculate(job):
+            # the correlations of all the tags of a job are one matrix product
+            tags,block = job
+            z = calc.standardize(binned(block))
+            corr,lag = calc.lagged_correlation(z,ref,nlag)
+            return tags, corr, lag*step
+
+        jobs = []
+        if dense:
+            x = self.get_time()
+            rows = x.searchsorted(xlim[1],'right') - x.searchsorted(xlim[0],'left')
+            size = max(1,(1 << 22) // max(rows,npoints))
+            positions = self._df.columns.get_indexer(dense)
+            for i in range(0,len(dense),size):
+                jobs.append((dense[i:i+size],('df',positions[i:i+size])))
+        size = max(1,(1 << 22) // npoints)
+        for i in range(0,len(others),size):
+            chunk = others[i:i+size]
+            jobs.append(([ t for t,xy in chunk ],('xy',chunk)))
+
+        tags, corr, lag = [], [], []
+        with ThreadPoolExecutor(workers) as pool:
+            for t,c,l in pool.map(calculate,jobs):
+                tags += t
+                corr.append(c)
+                lag.append(l)
+        if not tags:
+            return pandas.DataFrame(columns=['corr','lag'])
+        ranking = pandas.DataFrame({'corr':numpy.concatenate(corr),
+                                    'lag':numpy.concatenate(lag)},
+                                   index=pandas.Index(tags,name='tag'))
+        order = numpy.argsort(-numpy.abs(ranking['corr'].to_numpy()),kind='stable')
+        ranking = ranking.iloc[order]
+        return ranking if top is None else ranking.iloc[:top]
+
+    @QtCore.pyqtSlot(str)
+    def correlated_dialog(self,tag):
+        '''
+        Ask for the largest lag and find the tags correlated with tag over the
+        visible range, see correlated_tags.
+        '''
+        try:
+            text,ok = QInputDialog.getText(
+                None,'Find correlated tags',
+                'Largest lag (e.g. 0, 30s or 10min):',
+                QLineEdit.Normal,'0')
+            if not ok:
+                return
+            text = text.strip() or '0'
+            try:
+                maxlag = float(text)
+            except ValueError:
+                maxlag = pandas.Timedelta(text).total_seconds()
+            QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+            try:
+                ranking = self.correlated_tags(tag,maxlag=maxlag)
+            finally:
+                QApplication.restoreOverrideCursor()
+            self.correlated_found.emit(tag,ranking)
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::correlated_dialog\n' \
+                + str(e) + '\n')
+
+    def _loop_data(self,roles):
+        '''
+        Get the data of a loop's tags, role: tag.  Returns x and role: y, tags
+        with a different time axis hold their last value (or are interpolated
+        if they are compressed) at every sample of the loop.
+        '''
+        xy = { role:self.get_xy(tag) for role,tag in roles.items() }
+        x = xy['pv'][0]
+        if any( xi is not x for xi,yi in xy.values() ):
+            x = numpy.unique(numpy.concatenate([ xi for xi,yi in xy.values() ]))
+            xy = { role:(x,_align(xi,yi,x,self._is_compressed(roles[role])))
+                   for role,(xi,yi) in xy.items() }
+        return x, { role:y for role,(xi,y) in xy.items() }
+
+    def get_kpi_index(self,gid,roles):
+        '''
+        Get the calc.KpiIndex of a loop, it is built the first time it is
+        needed.
+
+        Parameters:
+        -----------
+        gid : str
+            groupid of the loop
+        roles : dict
+            role: tag, see find_loops
+        '''
+        try:
+            return self._kpi_index[gid]
+        except KeyError:
+            pass
+
+        x,ys = self._loop_data(roles)
+        auto = None
+        if 'mode' in ys:
+            mode = ys['mode']
+            if self.auto_modes is None:
+                auto = (mode != 0).astype(float)
+            else:
+                auto = numpy.isin(mode,list(self.auto_modes)).astype(float)
+            auto[numpy.isnan(mode)] = numpy.nan
+
+        index = calc.KpiIndex(x,ys['pv'],ys.get('sp'),ys.get('lo'),ys.get('hi'),
+                              auto,self.limit_tolerance)
+        self._kpi_index[gid] = index
+        return index
+
+    def clear_kpi_cache(self):
+        '''
+        Forget the KPIs that have been calculated, e.g. after changing
+        auto_modes or limit_tolerance.
+        '''
+        self._kpi_index.clear()
+        self._kpi_cache.clear()
+
+    def _to_time(self,x):
+        # axes units to a pandas.Timestamp
+        t = pandas.Timestamp(matplotlib.dates.num2date(x,tz=self._tz))
+        return t.tz_localize(None) if self._tz is None else t
+
+    def _to_x(self,t):
+        # time as a timestamp (or number) to axes units
+        if not self._time_unit():
+            return float(t)
+        t = pandas.Timestamp(t)
+        if self._tz is not None and t.tz is None:
+            t = t.tz_localize(self._tz)
+        return float(matplotlib.dates.date2num(t))
+
+    def loop_kpis(self,windows,groupids=None):
+        '''
+        KPIs of control loops for many time windows, see calc.KpiIndex: the
+        mean absolute error, % of the time in auto and % of the time at a
+        limit.  Loops are found with find_loops.
+
+        KPIs of a window are calculated from running sums, so a window takes
+        O(log n) however long it is.  Results are cached by (groupid, window),
+        asking for windows again (e.g. for the next monthly report) doesn't
+        scan the data again.
+
+        Parameters:
+        -----------
+        windows : str or list
+            list of (start,end) timestamps (numbers if the time axis is not
+            dates), or a pandas frequency, e.g. 'D' or 'MS', to split all the
+            data in windows
+        groupids : list, optional
+            loops to calculate, the default is all loops
+
+        Returns:
+        --------
+        pandas.DataFrame
+            index is (groupid,start,end), columns are mae, pct_auto and
+            pct_at_limit
+        '''
+        loops = self.find_loops()
+        if groupids is None:
+            groupids = sorted(loops)
+        unknown = [ gid for gid in groupids if gid not in loops ]
+        if unknown:
+            raise ValueError('Not a loop: {}'.format(', '.join(map(str,unknown))))
+
+        if isinstance(windows,str):
+            if not self._time_unit():
+                raise ValueError('Windows by frequency need a datetime index')
+            xs = [ self.get_kpi_index(gid,loops[gid]).x for gid in groupids ]
+            xs = [ x for x in xs if len(x) ]
+            if not xs:
+                windows = []
+            else:
+                first = self._to_time(min( x[0] for x in xs )).floor('s')
+                last = self._to_time(max( x[-1] for x in xs )).ceil('s')
+                edges = list(pandas.date_range(first.normalize(),last,freq=windows))
+                if not edges or edges[0] > first:
+                    edges.insert(0,first)
+                # the end is exclusive, the last sample is in the last window
+                edges.append(last + pandas.Timedelta(seconds=1))
+                windows = list(zip(edges[:-1],edges[1:]))
+        windows = [ (self._to_x(w0),self._to_x(w1),w0,w1) for w0,w1 in windows ]
+
+        rows = []
+        for gid in groupids:
+            todo = [ w for w in windows if (gid,w[:2]) not in self._kpi_cache ]
+            if todo:
+                kpis = self.get_kpi_index(gid,loops[gid]).window_kpis(
+                    [ w[0] for w in todo ],[ w[1] for w in todo ])
+                for i,w in enumerate(todo):
+                    self._kpi_cache[(gid,w[:2])] = \
+                        tuple( kpis[k][i] for k in calc.KpiIndex.kpis )
+            for x0,x1,w0,w1 in windows:
+                rows.append((gid,w0,w1) + self._kpi_cache[(gid,(x0,x1))])
+
+        kpis = pandas.DataFrame(rows,columns=['groupid','start','end']+calc.KpiIndex.kpis)
+        return kpis.set_index(['groupid','start','end'])
+
+    def format_time(self,x):
+        '''
+        Format a time in axes units as a string.
+        '''
+        if self._time_unit():
+            d = matplotlib.dates.num2date(x,tz=self._tz)
+            return d.strftime('%Y-%m-%d %H:%M:%S')
+        return '{:g}'.format(x)
+
+    @QtCore.pyqtSlot(float)
+    def _on_mouse_moved(self,x):
+        self._cursor_x = x
+        if not self._cursor_timer.isActive():
+            self._cursor_timer.start()
+
+    @QtCore.pyqtSlot()
+    def _emit_cursor(self):
+        if self._cursor_x is not None and len(self._plotinfo) > 0:
+            self.cursor_moved.emit(self._cursor_x)
+            try:
+                self._show_event_tooltip(self._cursor_x)
+            except Exception as e:
+                sys.stderr.write('Error showing event tooltip\n' + str(e) + '\n')
+
+    def set_events(self,events,time='time',end=None,text='text',tag=None,color=None):
+        '''
+        Set events (alarms, operator changes, ...) to show on the plots as
+        vertical lines, or spans if they have an end.  Events with a tag are
+        shown on the axes of that tag (or its groupid), events without a tag
+        on all the axes.  Only the events in the visible range are drawn,
+        when there are more than max_events they are counted in columns.
+
+        Parameters:
+        -----------
+        events : pandas.DataFrame or None
+            a row per event, None to remove the events
+        time : str or None
+            column with the (start) time, None to use the index
+        end : str, optional
+            column with the end time of spans
+        text : str, optional
+            column with the text of the tooltip
+        tag : str, optional
+            column with the tagname of the events
+        color : str, optional
+            matplotlib color of the events
+        '''
+        if color is not None:
+            self.event_color = color
+        if events is None:
+            self._events = None
+            self._event_groupids = {}
+        else:
+            def to_x(t):
+                t = pandas.Index(t)
+                if pandas.api.types.is_datetime64_any_dtype(t):
+                    t = pandas.DatetimeIndex(t)
+                    if self._tz is not None and t.tz is None:
+                        t = t.tz_localize(self._tz)
+                return _index_to_x(t)
+
+            start = to_x(events.index if time is None else events[time])
+            self._events = EventIndex(
+                start,
+                None if end is None else to_x(events[end]),
+                None if text is None else events[text].to_numpy(dtype=object),
+                None if tag is None else events[tag].to_numpy(dtype=object))
+            self._event_groupids = { t : TagInfo(t).groupid for t in self._events.tags }
+        self._draw_events()
+        self.backend.draw(idle=True)
+
+    def set_event_filter(self,tags=None,groupids=None):
+        '''
+        Only show events of these tags or groupids (events without a tag are
+        then hidden).  Call without arguments to show all events.
+        '''
+        if tags is None and groupids is None:
+            self._event_filter = None
+        else:
+            tags = set(tags or [])
+            groupids = set(groupids or [])
+            self._event_filter = { t for t,gid in self._event_groupids.items()
+                                   if t in tags or (gid is not None and gid in groupids) }
+        self._draw_events()
+        self.backend.draw(idle=True)
+
+    def _event_tags(self,plotinfo):
+        '''
+        Tags of the events to show on an axes.
+        '''
+        tags = [ t for t,gid in self._event_groupids.items()
+                 if t in plotinfo.tagnames
+                 or (plotinfo.groupid is not None and gid == plotinfo.groupid) ]
+        if self._event_filter is not None:
+            tags = [ t for t in tags if t in self._event_filter ]
+        return tags
+
+    def _draw_events(self,plotinfos=None):
+        '''
+        Draw the events in the visible range on the axes.
+        '''
+        if plotinfos is None:
+            plotinfos = self._plotinfo
+        for pi in plotinfos:
+            if self._events is None or len(self._events) == 0:
+                if pi.events is not None:
+                    pi.events = self.backend.set_events(pi.ax,pi.events,
+                        numpy.empty(0),numpy.empty(0),self.event_color)
+                pi.event_marks = None
+                continue
+
+            xmin,xmax = self.backend.get_xlim(pi.ax)
+            idx = self._events.query(xmin,xmax,self._event_tags(pi),
+                                     untagged=self._event_filter is None)
+            if len(idx) > self.max_events:
+                x0,x1,count = self._events.cluster(idx,xmin,xmax,self.max_events//2)
+                labels = [ '{} events'.format(n) for n in count ]
+            else:
+                x0 = self._events.start[idx]
+                x1 = self._events.end[idx]
+                labels = idx
+            pi.events = self.backend.set_events(pi.ax,pi.events,x0,x1,self.event_color)
+            pi.event_marks = (x0,x1,labels)
+
+    def _show_event_tooltip(self,x):
+        '''
+        Show the events near x in a tooltip.
+        '''
+        found = []
+        for pi in self._plotinfo:
+            if pi.event_marks is None:
+                continue
+            x0,x1,labels = pi.event_marks
+            xmin,xmax = self.backend.get_xlim(pi.ax)
+            near = 0.003*(xmax - xmin)
+            for i in numpy.flatnonzero((x0 - near <= x) & (x1 + near >= x))[:10]:
+                label = labels[i]
+                if not isinstance(label,str):
+                    label = self._events.label(label,self.format_time)
+                found.append(label)
+        if found:
+            QToolTip.showText(QCursor.pos(),'\n'.join(dict.fromkeys(found)))
+            self._event_tooltip = True
+        elif self._event_tooltip:
+            QToolTip.hideText()
+            self._event_tooltip = False
+
+    def _decimated(self,x,y,xlim=None):
+        '''
+        Decimate a line for plotting.  The range in xlim is decimated to
+        max_points, the data outside xlim is decimated more coarsely so that the
+        line still covers the whole range (for autoscale and panning).  Short
+        lines are returned as is, without copies.
+        '''
+        if len(x) <= self.max_points or self.backend.decimates:
+            return x,y
+
+        nbins = self.max_points // 2
+        if xlim is None:
+            idx = calc.minmax_decimate(y,nbins)
+        else:
+            i0 = max(x.searchsorted(xlim[0],'left') - 1, 0)
+            i1 = min(x.searchsorted(xlim[1],'right') + 1, len(x))
+            coarse = max(nbins // 8, 1)
+            idx = numpy.concatenate((
+                calc.minmax_decimate(y[:i0],coarse),
+                calc.minmax_decimate(y[i0:i1],nbins) + i0,
+                calc.minmax_decimate(y[i1:],coarse) + i1,
+            ))
+        return x[idx],y[idx]
+
+    def _plot_line(self,plotinfo,x,y,xlim=None,**kwargs):
+        '''
+        Plot a (decimated) line on the axes of plotinfo.
 
-    def __init__(self,parent=None):
-        QObject.__init__(self,parent)
+        Parameters:
+        -----------
+        plotinfo : PlotInfo
+            plotinfo of axes
+        x : numpy.ndarray
+            time axis
+        y : numpy.ndarray
+            values
+        xlim : tuple, optional
+            visible range, None for all data
+        kwargs :
+            passed to the backend's plot
+        '''
+        line = self.backend.plot(plotinfo.ax,*self._decimated(x,y,xlim),**kwargs)
+        plotinfo.lines.append((line,x,y))
+        return line
 
-        self._df = None
-        self.plot_window = PlotWindow()
-        self.plot_window.home_zoom_signal.connect(self.home_zoom)
+    @QtCore.pyqtSlot()
+    def _on_xlim_changed(self):
+        self._xlim_timer.start()
 
-        self._plotinfo = [] # list of info about plot
-        self._groupid_plots = {} # dictionary of plotted groupids
-        self._taginfo = {} # dictionary of tags
+    @QtCore.pyqtSlot()
+    def _xlim_settled(self):
+        if len(self._plotinfo) == 0:
+            return
+        xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+        if DEBUG:
+            print("PlotManager::_xlim_settled({})".format(xlim))
+        self._record('xlim',*xlim)
 
-        self.cur = None
+        try:
+            self._fetch_range(xlim)
+            if not self.backend.decimates:
+                for pi in self._plotinfo:
+                    for line,x,y in pi.lines:
+                        if len(x) > self.max_points:
+                            self.backend.set_line_data(
+                                line,*self._decimated(x,y,xlim))
+            self._draw_events()
+            self.backend.draw(idle=True)
+        except Exception as e:
+            sys.stderr.write(str(e))
 
-        self.legend_loc = 'upper left'
-        self.legend_fontsize = 8
+        self.xlim_changed.emit(xlim[0],xlim[1])
 
-    def set_dataframe(self,df):
-        # package function set_dataframe checks that the index is datetime index
 
-        # clear the _taginfo to avoid unnecesary looping in clear_all_plots
-        self._taginfo.clear()
-        self.clear_all_plots()
+    def _fetch_range(self,xlim):
+        '''
+        Fetch the data of xlim for the plotted tags from a source that reads
+        time ranges (a historian), on the RangeFetcher's thread.  The axes
+        of tags that get new data are plotted again in _range_fetched.
+        '''
+        if not hasattr(self._source,'fetch'):
+            return
+        if self._fetcher is not None:
+            # only the last range is fetched when zooming goes on
+            self._fetch_pending = xlim
+            return
 
-        # Check if there are duplicated columns:
-        dupcols = df.columns[ df.columns.duplicated() ]
-        if len(dupcols) > 0:
-            sys.stderr.write('WARNING: Dataframe has duplicated columns, duplicates are being dropped.\n')
-            for c in dupcols:
-                sys.stderr.write('  Dropping {}\n'.format(c))
+        # plotted tags and the tags that plotted derived tags need
+        tags = []
+        todo = [ t for pi in self._plotinfo for t in pi.tagnames ]
+        while todo:
+            tag = todo.pop()
+            if tag in self._derived:
+                todo.extend(self._derived[tag].inputs)
+            elif tag not in tags:
+                tags.append(tag)
+        if not tags:
+            return
 
-        self._df = df.drop(columns=dupcols)
+        self._fetcher = RangeFetcher(self._source,tags,float(xlim[0]),float(xlim[1]))
+        self._fetcher_thread = QtCore.QThread(self)
+        self._fetcher.moveToThread(self._fetcher_thread)
+        self._fetcher_thread.started.connect(self._fetcher.run)
+        self._fetcher.fetched.connect(self._range_fetched)
+        self._fetcher_thread.start()
 
-        for tag in self._df:
-            # Check if we can plot the tag
-            dt = self._df[tag].dtype
-            if dt in (float,int,bool,'int64'):
-                self._taginfo[tag] = TagInfo(tag)
-            else:
-                if DEBUG:
-                    print('Tag {} is not plottable'.format(tag))
-                    print('    dtype is {}'.format(dt))
-                continue
+    @QtCore.pyqtSlot(object)
+    def _range_fetched(self,changed):
+        if self.sender() is not self._fetcher:
+            return
+        tags = self._fetcher.tags
+        self._fetcher_thread.quit()
+        self._fetcher_thread.wait()
+        self._fetcher = None
+        self._fetcher_thread = None
+        try:
+            # tags that are not plotted are read again for the new ranges
+            # when they are needed
+            stale = set(changed)
+            stale.update( t for t in self._tagdata
+                          if t not in tags and not self._source.is_loaded(t) )
+            invalid = set()
+            for tag in stale:
+                self._tagdata.pop(tag,None)
+                invalid |= self._invalidate(tag)
+            for pi in self._plotinfo:
+                if invalid.intersection(pi.tagnames):
+                    self.replot(pi,save_xlim=True)
+            if invalid:
+                self.backend.draw(idle=True)
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::_range_fetched\n' \
+                + str(e) + '\n')
 
+        if self._fetch_pending is not None:
+            xlim = self._fetch_pending
+            self._fetch_pending = None
+            self._fetch_range(xlim)
 
-    def get_tagtools(self):
+    def get_tagtools(self,tags=None):
         '''
         Get tagtools of all validated _taginfos
+
+        Parameters:
+        -----------
+        tags : list, optional
+            only get tagtools for these tags
         '''
-        tools = [ TagTool(t) for t in self._taginfo ]
+        if tags is None:
+            tags = self._taginfo
+        tools = [ TagTool(t) for t in tags ]
         for tool in tools:
             tool.add_remove_plot.connect(self.add_remove_plot)
+            tool.overlay_requested.connect(self.add_remove_overlay)
+            tool.xcorr_requested.connect(self.xcorr_dialog)
+            tool.histogram_requested.connect(self.histogram_requested)
+            tool.density_requested.connect(self.density_dialog)
+            tool.correlated_requested.connect(self.correlated_dialog)
 
         return tools
             
@@ -199,24 +2406,34 @@ class PlotManager(QObject):
         '''
         if DEBUG:
             print('PlotManager::home_clicked()')
+        self._record('home_zoom')
 
         try:
             #plt.margins(0,0.05)
             if len(self._plotinfo) > 0:
-                for pi in self._plotinfo:
-                    pi.ax.autoscale(axis='x',tight=True)
+                # The axes share x, use the time axes of the data instead of
+                # converting the index again
+                xs = [ self.get_xy(t)[0] for pi in self._plotinfo
+                                         for t in pi.tagnames ]
+                xs = [ x for x in xs if len(x) > 0 ]
+                if xs:
+                    xlim = ( float(min( x[0] for x in xs )),
+                             float(max( x[-1] for x in xs )) )
+                    self.backend.set_xlim(self._plotinfo[0].ax,*xlim)
 
+                for pi in self._plotinfo:
                     # Autoscale on y doesn't work.  I think the cursor is making
                     # trouble.  Just scale it manually.
                     #pi.ax.autoscale(axis='y',tight=False)
-                    ymin = float( self._df[ pi.tagnames ].min().min() )
-                    ymax = float( self._df[ pi.tagnames ].max().max() )
+                    ys = [ self.get_xy(t)[1] for t in pi.tagnames ]
+                    ymin = float( min( numpy.nanmin(y) for y in ys ) )
+                    ymax = float( max( numpy.nanmax(y) for y in ys ) )
                     margin = 0.05*(ymax-ymin)
                     if margin <= 0:
                         margin = 0.01
                         
-                    pi.ax.set_ylim( ymin-margin,ymax+margin)
-            self.plot_window.canvas.draw()
+                    self.backend.set_ylim(pi.ax, ymin-margin,ymax+margin)
+            self.backend.draw()
 
         except Exception as e:
             sys.stderr.write(str(e))
@@ -225,6 +2442,7 @@ class PlotManager(QObject):
     def clear_all_plots(self):
         if DEBUG:
             print('PlotManager::clear_all_plots()')
+        self._record('clear_all_plots')
 
         try:
           
@@ -242,11 +2460,13 @@ class PlotManager(QObject):
             
             self._plotinfo.clear()
             self._groupid_plots.clear()
-            self.plot_window.fig.clear()
-            self.plot_window.toolbar._nav_stack.clear()
-            self.plot_window.canvas.draw()
+            self.backend.clear()
+            self.backend.reset_navigation()
+            self.backend.draw()
         except Exception as e:
             sys.stderr.write(str(e))
+
+        self.plots_changed.emit()
             
 
   
@@ -254,6 +2474,7 @@ class PlotManager(QObject):
     def refresh(self):
         if DEBUG:
             print("PlotManager::refresh()")
+        self._record('refresh')
 
         for pi in self._plotinfo:
             try:
@@ -261,16 +2482,18 @@ class PlotManager(QObject):
             except Exception as e:
                 sys.stderr.write(str(e))
 
-        self.plot_window.toolbar._nav_stack.clear()
+        self.backend.reset_navigation()
         try:
-            self.plot_window.fig.tight_layout()
-            self.plot_window.canvas.draw()
+            self.backend.tight_layout()
+            self.backend.draw()
         except Exception as e:
             # This seems to throw an error when using jupyter notebook
             if DEBUG:
                 sys.stderr.write("Error setting tight layout")
                 sys.stderr.write(str(e))
 
+        self.plots_changed.emit()
+
     def replot(self,plotinfo,save_xlim=False):
         '''
         Replot the ax in plotinfo.  Used when adding/removing tags
@@ -278,31 +2501,57 @@ class PlotManager(QObject):
         if DEBUG:
             print("PlotManager::replot()")
 
+        xlim = None
         if save_xlim:
-            xlim = plotinfo.ax.get_xlim()
+            xlim = self.backend.get_xlim(plotinfo.ax)
 
         try:
-            plotinfo.ax.clear()
+            self.backend.clear_axes(plotinfo.ax)
         except:
             if DEBUG:
                 print("Error clearing Axis")
 
+        plotinfo.lines.clear()
+        if self._time_unit():
+            self.backend.set_datetime(plotinfo.ax,self._tz)
 
         #color = [ self._taginfo[t].color for t in plotinfo.tagnames ]
+        colors = {}
         for tagname in plotinfo.tagnames:
-            plotinfo.ax.plot(
-                self._df[tagname],
+            line = self._plot_line(
+                plotinfo,
+                *self.get_xy(tagname),
+                xlim,
                 color=self._taginfo[tagname].color,
                 label=tagname,
             )
-        plotinfo.ax.legend(loc=self.legend_loc,
-                           fontsize=self.legend_fontsize)
+            colors[tagname] = self.backend.line_color(line)
+
+        for tagname,kind,window in plotinfo.overlays:
+            x = self.get_xy(tagname)[0]
+            for label,y in self.get_overlay(tagname,kind,window):
+                self._plot_line(
+                    plotinfo,
+                    x,
+                    y,
+                    xlim,
+                    color=colors[tagname],
+                    linestyle='--',
+                    linewidth=0.8,
+                    label='{} {} ({})'.format(tagname,label,window),
+                )
+
+        self.backend.legend(plotinfo.ax,self.legend_loc,self.legend_fontsize)
 
 
         if save_xlim:
-            plotinfo.ax.set_xlim(xlim)
+            self.backend.set_xlim(plotinfo.ax,*xlim)
         else:
-            plotinfo.ax.autoscale(axis='x',tight=True)
+            self.backend.autoscale_x(plotinfo.ax)
+
+        # clearing the axes removed the events
+        plotinfo.events = None
+        self._draw_events([plotinfo])
 
 
 
@@ -329,25 +2578,31 @@ class PlotManager(QObject):
             #xlim = plotinfo.ax.get_xlim()
 
             # Get current y-lim before plotting:
-            ylim_before = plotinfo.ax.get_ylim()
-
-            plotinfo.ax.plot(
-                self._df[tag],
+            ylim_before = self.backend.get_ylim(plotinfo.ax)
+
+            x,y = self.get_xy(tag)
+            self._plot_line(
+                plotinfo,
+                x,
+                y,
+                self.backend.get_xlim(plotinfo.ax),
                 color=taginfo.color,
                 label=tag,
                 scalex=False,
             )
-            plotinfo.ax.legend(loc=self.legend_loc,
-                               fontsize=self.legend_fontsize)
+            self.backend.legend(plotinfo.ax,self.legend_loc,self.legend_fontsize)
 
             #plotinfo.ax.set_xlim(xlim)
 
             # Set the y-lim to accommodate newly plotted value
             margin = 0.05*(ylim_before[1] - ylim_before[0])
-            ymin = float( min(ylim_before[0], self._df[ tag ].min()-margin) )
-            ymax = float( max(ylim_before[1], self._df[ tag ].max()+margin) )
+            ymin = float( min(ylim_before[0], numpy.nanmin(y)-margin) )
+            ymax = float( max(ylim_before[1], numpy.nanmax(y)+margin) )
                 
-            plotinfo.ax.set_ylim( ymin,ymax)
+            self.backend.set_ylim(plotinfo.ax, ymin,ymax)
+
+            # the events of the tag
+            self._draw_events([plotinfo])
 
         else:
             nplots = len(self._plotinfo)
@@ -358,22 +2613,8 @@ class PlotManager(QObject):
             else:
                 sharex = None
 
-            # resize existing axes
-            gs = matplotlib.gridspec.GridSpec(nplots+1,1)
-            for i in range(nplots):
-                self._plotinfo[i].ax.set_position( gs[i].get_position(self.plot_window.fig) )
-                self._plotinfo[i].ax.set_subplotspec( gs[i] )
-
-
-            ax = self.plot_window.fig.add_subplot(
-                nplots+1,1,nplots+1,
-                label=groupid,
-                sharex=sharex
-            )
-
-            for pi in self._plotinfo:
-                pi.ax.tick_params(labelbottom=False)
-
+            # the backend resizes the existing axes
+            ax = self.backend.add_axes(groupid,sharex)
 
             plotinfo = PlotInfo(tag,groupid,ax)
             self._plotinfo.append(plotinfo)
@@ -384,22 +2625,8 @@ class PlotManager(QObject):
 
             self.replot(plotinfo,save_xlim=(sharex!=None))
 
-            self.plot_window.toolbar._nav_stack.clear()
-
-
-            # Multicursor screws with ylims, save all the ylims and restore them
-            # later
-            axes = [pi.ax for pi in self._plotinfo ]
-            ylims = [ a.get_ylim() for a in axes ]
-
-            self.cur = MultiCursor(
-                None,#self.plot_window.fig.canvas,
-                [ pi.ax for pi in self._plotinfo ],
-                lw=1,
-                color='red')
-
-            for a,yl in zip(axes,ylims):
-                a.set_ylim(yl)
+            self.backend.reset_navigation()
+            self.backend.set_cursor([ pi.ax for pi in self._plotinfo ])
 
 
     def remove_plot(self,tag):
@@ -413,6 +2640,7 @@ class PlotManager(QObject):
         if len(plotinfo.tagnames) > 1:
             # remove only one line
             plotinfo.tagnames.remove(tag)
+            plotinfo.overlays = [ o for o in plotinfo.overlays if o[0] != tag ]
             if DEBUG:
                 print("Removing one variable from list")
                 print("Remaining tags:")
@@ -424,34 +2652,19 @@ class PlotManager(QObject):
             # remove whole axes
             if DEBUG:
                 print("Removing axis")
-            plotinfo.ax.remove()
+            self.backend.remove_axes(plotinfo.ax)
 
             self._plotinfo.remove(plotinfo)
 
             if taginfo.groupid in self._groupid_plots:
                 del self._groupid_plots[taginfo.groupid] 
 
-            nplots = len(self._plotinfo)
-            if nplots > 0:
-                gs = matplotlib.gridspec.GridSpec(nplots,1)
-                for i in range(nplots):
-                    self._plotinfo[i].ax.set_position( gs[i].get_position(self.plot_window.fig) )
-                    self._plotinfo[i].ax.set_subplotspec( gs[i] )
-
             if len(self._plotinfo) == 0:
                 if DEBUG:
                     print("no more plots left")
-                self.plot_window.toolbar._nav_stack.clear()
-                self.cur = None
+                self.backend.reset_navigation()
             
-            else:
-                self.cur = MultiCursor(
-                    self.plot_window.fig.canvas,
-                    [ pi.ax for pi in self._plotinfo ],
-                    lw=1,
-                    color='red')
-
-                self._plotinfo[-1].ax.tick_params(labelbottom=True)
+            self.backend.set_cursor([ pi.ax for pi in self._plotinfo ])
 
 
 
@@ -473,6 +2686,7 @@ class PlotManager(QObject):
 
         if DEBUG:
             print("PlotManager::add_remove_plot({},{})".format(tag,add))
+        self._record('add_remove_plot',tag,add)
 
         try:
             if add:
@@ -480,11 +2694,55 @@ class PlotManager(QObject):
             else:
                 self.remove_plot(tag)
 
-            self.plot_window.canvas.draw()
+            self.backend.draw()
         except Exception as e:
             sys.stderr.write('Exception in QtSlot PlotManager::add_remove_plot\n' \
                 + str(e) + '\n')
 
+        self.plots_changed.emit()
+
+    @QtCore.pyqtSlot(str,str,str)
+    def add_remove_overlay(self,tag,kind,window):
+        '''
+        Add/Remove rolling statistics overlays of a plotted tag.
+
+        Parameters:
+        -----------
+        tag : str
+            plotted tag
+        kind : str
+            'mean', 'std' or 'minmax', empty string removes all overlays of
+            the tag
+        window : str
+            window in samples (e.g. '60') or a time span (e.g. '5min')
+        '''
+        if DEBUG:
+            print("PlotManager::add_remove_overlay({},{},{})".format(
+                tag,kind,window))
+        self._record('add_remove_overlay',tag,kind,window)
+
+        try:
+            plotinfo = self._taginfo[tag].plotinfo
+            if plotinfo == None:
+                sys.stderr.write("Tag {} is not plotted.\n".format(tag))
+                return
+
+            if kind:
+                if window.strip().isdigit():
+                    window = int(window)
+                # calculate now to check the window
+                self.get_overlay(tag,kind,window)
+                if (tag,kind,window) not in plotinfo.overlays:
+                    plotinfo.overlays.append((tag,kind,window))
+            else:
+                plotinfo.overlays = [ o for o in plotinfo.overlays if o[0] != tag ]
+
+            self.replot(plotinfo,save_xlim=True)
+            self.backend.draw()
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot PlotManager::add_remove_overlay\n' \
+                + str(e) + '\n')
+
 
     @QtCore.pyqtSlot()
     def showme(self):
@@ -502,14 +2760,76 @@ class PlotManager(QObject):
             # xlimit based on first axes, the rest should be the same
             # this code is only executed if there is at least one plot
                
-            if ( type(self._df.index) != pandas.DatetimeIndex):
+            sparse = self._df is None
+            if sparse:
+                # Every tag has its own samples, plot the tags one by one
+                xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+                if self._datetime:
+                    sel = "['{}':'{}']".format(*[ self.format_time(v) for v in xlim ])
+                else:
+                    sel = "[{!r}:{!r}]".format(*[ float(v) for v in xlim ])
+            elif ( type(self._df.index) != pandas.DatetimeIndex):
                 code += "df_plot = df\n"
             else:
-                xlim = self._plotinfo[0].ax.get_xlim()
-                x0 = matplotlib.dates.num2date(xlim[0]).strftime('%Y-%m-%d %H:%M')
-                x1 = matplotlib.dates.num2date(xlim[1]).strftime('%Y-%m-%d %H:%M')
+                # first and last sample in xlim
+                xlim = self.backend.get_xlim(self._plotinfo[0].ax)
+                x = self.get_time()
+                i0 = x.searchsorted(xlim[0],'left')
+                i1 = x.searchsorted(xlim[1],'right') - 1
+                i0 = min(max(i0,0),len(x)-1)
+                i1 = min(max(i1,i0),len(x)-1)
+                x0 = self._df.index[i0].strftime('%Y-%m-%d %H:%M')
+                x1 = self._df.index[i1].strftime('%Y-%m-%d %H:%M')
                 code += "df_plot = df['" + x0 + "':'" + x1 + "']\n"
 
+            # Derived tags are not in df, evaluate them (and the derived tags
+            # they depend on) first.
+            derived = []
+            def add_derived(t):
+                if t in self._derived and t not in derived:
+                    for i in self._derived[t].inputs:
+                        add_derived(i)
+                    derived.append(t)
+            for pi in self._plotinfo:
+                for t in pi.tagnames:
+                    add_derived(t)
+
+            if sparse:
+                code += 'import pandas\n'
+                if self._source is not None:
+                    code += self._source.code()
+                code += 'data = {}\n'
+                tags = [ t for pi in self._plotinfo for t in pi.tagnames ]
+                tags += [ i for t in derived for i in self._derived[t].inputs ]
+                if self._long_columns is not None:
+                    tag_col,time_col,value_col = self._long_columns
+                    if time_col is not None:
+                        code += 'df = df.set_index({!r})\n'.format(time_col)
+                for t in dict.fromkeys(tags):
+                    if t in self._derived:
+                        continue
+                    if self._long_columns is not None:
+                        code += "data['{0}'] = df.loc[df[{1!r}] == '{0}',{2!r}].dropna().sort_index()\n" \
+                            .format(t,tag_col,value_col)
+                    else:
+                        code += "data['{0}'] = df['{0}'].dropna()\n".format(t)
+
+            if derived:
+                code += 'from proc_plot.tagexpr import evaluate\n'
+                if not sparse:
+                    code += 'df_plot = df_plot.copy()\n'
+                for t in derived:
+                    if sparse:
+                        # hold the last value of every input
+                        code += "d = pandas.concat({{{}}},axis=1).ffill()\n" \
+                            .format(','.join( "'{0}':data['{0}']".format(i)
+                                              for i in self._derived[t].inputs ))
+                        code += "data['{}'] = pandas.Series(evaluate(d,{!r}),index=d.index)\n" \
+                            .format(t,self._derived[t].expr)
+                    else:
+                        code += "df_plot['{}'] = evaluate(df_plot,{!r})\n".format(
+                            t,self._derived[t].expr)
+
             code += 'fig,ax = plt.subplots(nrows={},sharex=True)\n'.format(nrows)
 
             i = 0 
@@ -518,19 +2838,41 @@ class PlotManager(QObject):
                 for tag in plotinfo.tagnames:
                     color.append( self._taginfo[tag].color )
 
-                ylim = plotinfo.ax.get_ylim()
-
-                code += 'df_plot.plot(\n' + \
-                        '    y={},\n'.format(plotinfo.tagnames) + \
-                        '    color={},\n'.format(color) + \
-                        '    ylim={},\n'.format(ylim)
+                ylim = tuple( float(v) for v in self.backend.get_ylim(plotinfo.ax) )
+                axcode = 'ax[{}]'.format(i) if nrows > 1 else 'ax'
 
-                if nrows > 1:
-                    code += '    ax=ax[{}],\n'.format(i)
+                if sparse:
+                    for tag,col in zip(plotinfo.tagnames,color):
+                        code += "data['{0}']{1}.plot(ax={2},color={3!r},label='{0}')\n" \
+                            .format(tag,sel,axcode,col)
+                    code += '{}.set_ylim{}\n'.format(axcode,ylim)
                 else:
-                    code += '    ax=ax,\n'
-                    
-                code += ')\n'
+                    sel = ''
+                    code += 'df_plot.plot(\n' + \
+                            '    y={},\n'.format(plotinfo.tagnames) + \
+                            '    color={},\n'.format(color) + \
+                            '    ylim={},\n'.format(ylim)
+
+                    if nrows > 1:
+                        code += '    ax=ax[{}],\n'.format(i)
+                    else:
+                        code += '    ax=ax,\n'
+                        
+                    code += ')\n'
+
+                for tag,kind,window in plotinfo.overlays:
+                    col = color[plotinfo.tagnames.index(tag)]
+                    code += "r = {}['{}'].rolling({!r},min_periods=1)\n" \
+                        .format('data' if sparse else 'df_plot',tag,window)
+                    if kind == 'mean':
+                        lines = ['r.mean()']
+                    elif kind == 'std':
+                        lines = ['r.mean()+r.std(ddof=0)','r.mean()-r.std(ddof=0)']
+                    else:
+                        lines = ['r.min()','r.max()']
+                    for l in lines:
+                        code += "({}){}.plot(ax={},color={!r},style='--',lw=0.8)\n" \
+                            .format(l,sel,axcode,col)
 
                 i += 1
 
@@ -604,6 +2946,558 @@ class PlotWindow(QWidget):
 
 
 
+class AnalysisWindow(QWidget):
+    '''
+    Popup window with a matplotlib figure for analysis results.  It is deleted
+    when it is closed.
+    '''
+
+    def __init__(self,title,parent=None):
+        QWidget.__init__(self,parent)
+        self.setWindowTitle(title)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        self.fig = Figure()
+        self.canvas = FigCanvas(self.fig)
+        self.toolbar = NavBar(self.canvas,self)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.toolbar)
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+
+class DensityWindow(AnalysisWindow):
+    '''
+    Popup with the histogram of a tag, or the density of one tag against
+    another (e.g. OP against flow to check a valve characteristic), of the
+    samples in the visible time range.  Millions of points are binned into
+    an image instead of scattered.
+
+    The bin of every sample is found when the window opens, when the time
+    range changes only the samples that scrolled in or out are counted, see
+    calc.WindowCounts.
+    '''
+
+    def __init__(self,plot_manager,tags,bins,parent=None):
+        '''
+        Parameters:
+        -----------
+        plot_manager : PlotManager
+            data and time range
+        tags : list
+            [tag] for a histogram, [xtag,ytag] for a density
+        bins : int
+            number of bins (per axis)
+        '''
+        if len(tags) == 1:
+            title = 'Histogram {}'.format(tags[0])
+        else:
+            title = 'Density {} - {}'.format(*tags)
+        AnalysisWindow.__init__(self,title,parent)
+        self.plot_manager = plot_manager
+        self.tags = tags
+
+        self.x, values = plot_manager._common_xy(tags)
+        self.edges = []
+        sample_bins = numpy.zeros(len(self.x),dtype=numpy.intp)
+        nbins = 1
+        for v in values:
+            lo, hi = (numpy.nanmin(v), numpy.nanmax(v)) if (~numpy.isnan(v)).any() \
+                     else (0.0,1.0)
+            if hi <= lo:
+                lo, hi = lo - 0.5, hi + 0.5
+            self.edges.append(numpy.linspace(lo,hi,bins+1))
+            b = calc.bin_index(v,lo,hi,bins)
+            # the bin of a 2-D sample is xbin*bins + ybin
+            invalid = (sample_bins == nbins) | (b == bins)
+            sample_bins = sample_bins*bins + b
+            nbins *= bins
+            sample_bins[invalid] = nbins
+        self.counts = calc.WindowCounts(sample_bins,nbins)
+
+        self.ax = self.fig.add_subplot()
+        if len(tags) == 1:
+            self.artist = self.ax.stairs(numpy.zeros(bins),self.edges[0],fill=True)
+            self.ax.set_xlabel(tags[0])
+            self.ax.set_ylabel('Samples')
+        else:
+            ex, ey = self.edges
+            self.artist = self.ax.imshow(
+                numpy.ma.masked_all((bins,bins)),origin='lower',aspect='auto',
+                extent=(ex[0],ex[-1],ey[0],ey[-1]),interpolation='nearest',
+                norm=matplotlib.colors.LogNorm(vmin=1,vmax=10))
+            self.fig.colorbar(self.artist,ax=self.ax,label='Samples')
+            self.ax.set_xlabel(tags[0])
+            self.ax.set_ylabel(tags[1])
+
+        if plot_manager._plotinfo:
+            xlim = plot_manager.backend.get_xlim(plot_manager._plotinfo[0].ax)
+        else:
+            xlim = (self.x[0],self.x[-1]) if len(self.x) else (0.0,0.0)
+        self.update_range(*xlim)
+        plot_manager.xlim_changed.connect(self.update_range)
+
+    @QtCore.pyqtSlot(float,float)
+    def update_range(self,xmin,xmax):
+        try:
+            i0 = self.x.searchsorted(xmin,'left')
+            i1 = self.x.searchsorted(xmax,'right')
+            counts = self.counts.set_window(i0,max(i0,i1))
+            if len(self.tags) == 1:
+                self.artist.set_data(values=counts)
+                self.ax.set_ylim(0,max(1,counts.max())*1.05)
+            else:
+                n = len(self.edges[0]) - 1
+                image = counts.reshape(n,n).T
+                self.artist.set_data(numpy.ma.masked_equal(image,0))
+                self.artist.set_clim(1,max(2,image.max()))
+            self.ax.set_title('{} samples'.format(int(counts.sum())))
+            self.canvas.draw_idle()
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot DensityWindow::update_range\n' \
+                + str(e) + '\n')
+
+
+class HeatmapWindow(AnalysisWindow):
+    '''
+    Popup with many tags as rows of one image, every tag scaled to its own
+    range, to see at a glance which of hundreds of tags moved during an
+    incident.  A row has the mean of the tag in every pixel column, see
+    PlotManager.heatmap.  The image is calculated again when you zoom the
+    heatmap or the plots.
+
+    Signals:
+    --------
+    tag_clicked : QtCore.Signal(str)
+        Emitted with the tagname of a row that is clicked
+    '''
+
+    tag_clicked = QtCore.Signal(str)
+
+    def __init__(self,plot_manager,tags,parent=None):
+        AnalysisWindow.__init__(self,'Heatmap of {} tags'.format(len(tags)),parent)
+        self.plot_manager = plot_manager
+        self.tags = list(tags)
+        n = len(self.tags)
+        self.resize(900,max(300,min(900,12*n + 100)))
+
+        self.ax = self.fig.add_subplot()
+        cmap = matplotlib.colormaps['viridis'].with_extremes(bad='0.85')
+        self.image = self.ax.imshow(numpy.full((max(n,1),2),numpy.nan),
+            aspect='auto',interpolation='nearest',cmap=cmap,vmin=0,vmax=1)
+        self.ax.yaxis.set_major_locator(
+            matplotlib.ticker.MaxNLocator(nbins=min(max(n,1),40),integer=True))
+        self.ax.yaxis.set_major_formatter(matplotlib.ticker.FuncFormatter(
+            lambda v,pos: self._tag_at(v) or ''))
+        self.ax.format_coord = lambda x,y: self._tag_at(y) or ''
+        if plot_manager._time_unit():
+            self.ax.xaxis_date(plot_manager._tz)
+
+        # zooming the heatmap draws it again when it settles
+        self._xlim = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(200)
+        self._timer.timeout.connect(self._ax_zoomed)
+        self.ax.callbacks.connect('xlim_changed',lambda ax: self._timer.start())
+        self.canvas.mpl_connect('button_press_event',self._clicked)
+
+        self.update_range(*plot_manager._visible_xlim())
+        plot_manager.xlim_changed.connect(self.update_range)
+
+    def _tag_at(self,y):
+        i = int(numpy.floor(y + 0.5))
+        if 0 <= i < len(self.tags):
+            return self.tags[i]
+        return None
+
+    @QtCore.pyqtSlot(float,float)
+    def update_range(self,xmin,xmax):
+        try:
+            if xmax <= xmin:
+                return
+            # a column per pixel
+            ncols = int(min(max(self.ax.get_window_extent().width,100),2000))
+            edges,image = self.plot_manager.heatmap(self.tags,(xmin,xmax),ncols)
+            self._xlim = (xmin,xmax)
+            self.image.set_data(numpy.ma.masked_invalid(image))
+            self.image.set_extent((xmin,xmax,len(self.tags)-0.5,-0.5))
+            self.ax.set_xlim(xmin,xmax)
+            self.canvas.draw_idle()
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot HeatmapWindow::update_range\n' \
+                + str(e) + '\n')
+
+    def _ax_zoomed(self):
+        xlim = self.ax.get_xlim()
+        if self._xlim is None or not numpy.allclose(xlim,self._xlim):
+            self.update_range(*xlim)
+
+    def _clicked(self,event):
+        # not while zooming or panning
+        if event.inaxes is not self.ax or self.toolbar.mode or event.ydata is None:
+            return
+        tag = self._tag_at(event.ydata)
+        if tag is not None:
+            self.tag_clicked.emit(tag)
+
+
+class OverviewStrip(QWidget):
+    '''
+    Thin strip under the plots with the envelope of every plotted tag over
+    all the data and the visible range.  Drag a range in the strip to zoom
+    all the axes to it.
+
+    The envelope comes from the min/max pyramid of the tags' RangeIndex, it
+    is drawn when tags are plotted or removed, not when zooming.  Each tag
+    is scaled to the height of the strip.
+    '''
+
+    def __init__(self,plot_manager,parent=None):
+        QWidget.__init__(self,parent)
+        self.plot_manager = plot_manager
+
+        self.fig = Figure()
+        self.fig.subplots_adjust(left=0.02,right=0.99,bottom=0.3,top=0.95)
+        self.canvas = FigCanvas(self.fig)
+        self.canvas.setFixedHeight(70)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_yticks([])
+
+        self.selector = matplotlib.widgets.SpanSelector(
+            self.ax,self.range_selected,'horizontal',useblit=True,
+            interactive=True,drag_from_anywhere=True,
+            props=dict(alpha=0.3,facecolor='gray'))
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0,0,0,0)
+        layout.addWidget(self.canvas)
+        self.setLayout(layout)
+
+        plot_manager.plots_changed.connect(self.update_overview)
+        plot_manager.xlim_changed.connect(self.update_range)
+
+    @QtCore.pyqtSlot()
+    def update_overview(self):
+        if not self.isVisible():
+            return
+        if DEBUG:
+            print("OverviewStrip::update_overview()")
+
+        pm = self.plot_manager
+        tags = [ (t,pi) for pi in pm._plotinfo for t in pi.tagnames ]
+        try:
+            self.ax.cla()
+            self.ax.set_yticks([])
+            xmin = xmax = None
+            for i,(tag,pi) in enumerate(tags):
+                x,ymin,ymax = pm.get_range_index(tag).overview()
+                if len(x) == 0:
+                    continue
+                lo, hi = numpy.nanmin(ymin), numpy.nanmax(ymax)
+                scale = (hi - lo) if hi > lo else 1.0
+                color = pm._taginfo[tag].color or 'C{}'.format(i % 10)
+                self.ax.fill_between(x,(ymin-lo)/scale,(ymax-lo)/scale,step='post',
+                                     color=color,alpha=0.5,linewidth=0)
+                xmin = x[0] if xmin is None else min(xmin,x[0])
+                last = pm.get_xy(tag)[0][-1]
+                xmax = last if xmax is None else max(xmax,last)
+
+            if xmin is not None:
+                if pm._time_unit():
+                    self.ax.xaxis_date(pm._tz)
+                if xmax > xmin:
+                    self.ax.set_xlim(xmin,xmax)
+                self.ax.set_ylim(-0.05,1.05)
+            self.canvas.draw_idle()
+        except Exception as e:
+            sys.stderr.write('Error drawing overview\n' + str(e) + '\n')
+            return
+
+        if tags:
+            self.update_range(*pm.backend.get_xlim(pm._plotinfo[0].ax))
+
+    @QtCore.pyqtSlot(float,float)
+    def update_range(self,xmin,xmax):
+        if not self.isVisible():
+            return
+        # doesn't call range_selected
+        self.selector.extents = (xmin,xmax)
+
+    def range_selected(self,xmin,xmax):
+        pm = self.plot_manager
+        if len(pm._plotinfo) == 0 or xmax <= xmin:
+            return
+        try:
+            # the detail axes are decimated for the range when the xlim
+            # settles
+            pm.backend.set_xlim(pm._plotinfo[0].ax,xmin,xmax)
+            pm.backend.draw()
+        except Exception as e:
+            sys.stderr.write('Exception in OverviewStrip::range_selected\n' \
+                + str(e) + '\n')
+
+    def showEvent(self,event):
+        QWidget.showEvent(self,event)
+        self.update_overview()
+
+
+class _NumberItem(QTableWidgetItem):
+    '''
+    Table item that shows a number formatted and sorts by the number.
+    '''
+
+    def __init__(self,value):
+        QTableWidgetItem.__init__(self,'{:.4g}'.format(value))
+        self.value = value
+        self.setTextAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignVCenter)
+
+    def __lt__(self,other):
+        if isinstance(other,_NumberItem):
+            # NaNs sort last
+            if numpy.isnan(other.value):
+                return not numpy.isnan(self.value)
+            return self.value < other.value
+        return QTableWidgetItem.__lt__(self,other)
+
+
+class LoopHealthWindow(QWidget):
+    '''
+    Popup window with a sortable table of the health of every control loop,
+    see PlotManager.loop_health.  Clicking a loop opens its axes.
+
+    Signals:
+    --------
+    loop_clicked : QtCore.Signal(list)
+        Emitted with the tags of the loop that is clicked
+    '''
+
+    loop_clicked = QtCore.Signal(list)
+
+    columns = ['oscillation','stiction','saturation','iae']
+
+    def __init__(self,health,parent=None):
+        QWidget.__init__(self,parent)
+        self.setWindowTitle('Loop health')
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.health = health
+
+        self.table = QTableWidget(len(health),len(self.columns)+1)
+        self.table.setHorizontalHeaderLabels(['loop'] + self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.horizontalHeaderItem(1).setToolTip(
+            'Regularity of the control error crossing zero, above 1 is oscillating')
+        self.table.horizontalHeaderItem(2).setToolTip(
+            'Fraction of the OP movement while the PV does not move')
+        self.table.horizontalHeaderItem(3).setToolTip(
+            'Fraction of the time the OP is at a limit')
+        self.table.horizontalHeaderItem(4).setToolTip(
+            'Integral of |SP - PV|, value*seconds')
+
+        for i,(gid,row) in enumerate(health.iterrows()):
+            self.table.setItem(i,0,QTableWidgetItem(str(gid)))
+            for j,col in enumerate(self.columns):
+                self.table.setItem(i,j+1,_NumberItem(float(row[col])))
+        self.table.setSortingEnabled(True)
+        self.table.sortItems(1,QtCore.Qt.DescendingOrder)
+        self.table.resizeColumnsToContents()
+        self.table.cellClicked.connect(self.cell_clicked)
+
+        layout = QVBoxLayout()
+        layout.addWidget(QLabel('{} loops'.format(len(health))))
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+        self.resize(500,600)
+
+    @QtCore.pyqtSlot(int,int)
+    def cell_clicked(self,row,col):
+        try:
+            gid = self.table.item(row,0).text()
+            loop = self.health.loc[gid]
+            self.loop_clicked.emit([ loop[r] for r in ('pv','sp','op')
+                                     if isinstance(loop[r],str) ])
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot LoopHealthWindow::cell_clicked\n' \
+                + str(e) + '\n')
+
+
+class StatsPanel(QWidget):
+    '''
+    Table with the value at the cursor and statistics over the visible time
+    range of every plotted tag.  Statistics are updated when the plots change
+    and when zooming/panning settles, values when the cursor moves.
+    '''
+
+    columns = ['cursor','min','max','mean','std','integral']
+
+    def __init__(self,plot_manager,parent=None):
+        QWidget.__init__(self,parent)
+        self.plot_manager = plot_manager
+        self._tags = [] # tag in each row
+
+        self.cursor_label = QLabel()
+        self.table = QTableWidget(0,len(self.columns))
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeaderItem(self.columns.index('integral')) \
+            .setToolTip('Trapezoidal integral, value*hours for dates')
+        self.table.horizontalHeaderItem(self.columns.index('cursor')) \
+            .setToolTip('Last value at or before the cursor')
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0,0,0,0)
+        layout.addWidget(self.cursor_label)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+        plot_manager.plots_changed.connect(self.update_stats)
+        plot_manager.xlim_changed.connect(
+            lambda xmin,xmax: self.update_stats())
+        plot_manager.cursor_moved.connect(self.update_cursor)
+
+    def _set_item(self,row,col,value):
+        item = QTableWidgetItem('{:.4g}'.format(value))
+        item.setTextAlignment(QtCore.Qt.AlignRight|QtCore.Qt.AlignVCenter)
+        self.table.setItem(row,col,item)
+
+    @QtCore.pyqtSlot(float)
+    def update_cursor(self,x):
+        if not self.isVisible():
+            return
+
+        try:
+            values = self.plot_manager.cursor_values(x,self._tags)
+            self.cursor_label.setText(self.plot_manager.format_time(x))
+        except Exception as e:
+            sys.stderr.write('Error getting cursor values\n' + str(e) + '\n')
+            return
+
+        col = self.columns.index('cursor')
+        for i,tag in enumerate(self._tags):
+            self._set_item(i,col,values[tag])
+
+    @QtCore.pyqtSlot()
+    def update_stats(self):
+        if not self.isVisible():
+            return
+        if DEBUG:
+            print("StatsPanel::update_stats()")
+
+        try:
+            stats = self.plot_manager.window_stats()
+        except Exception as e:
+            sys.stderr.write('Error calculating statistics\n' + str(e) + '\n')
+            return
+
+        self._tags = list(stats.index)
+        self.table.setRowCount(len(stats))
+        self.table.setVerticalHeaderLabels([ str(t) for t in stats.index ])
+        for i,(tag,row) in enumerate(stats.iterrows()):
+            for j,col in enumerate(self.columns):
+                if col in row:
+                    self._set_item(i,j,row[col])
+        self.table.resizeColumnsToContents()
+
+    def showEvent(self,event):
+        QWidget.showEvent(self,event)
+        self.update_stats()
+
+
+class IntervalModel(QAbstractListModel):
+    '''
+    List of time intervals for a QListView.  Rows are only formatted when
+    they are shown, the list can have many thousands of intervals.
+    '''
+
+    def __init__(self,plot_manager,parent=None):
+        QAbstractListModel.__init__(self,parent)
+        self.plot_manager = plot_manager
+        self.start = numpy.empty(0)
+        self.end = numpy.empty(0)
+
+    def set_intervals(self,start,end):
+        self.beginResetModel()
+        self.start = start
+        self.end = end
+        self.endResetModel()
+
+    def rowCount(self,parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.start)
+
+    def data(self,index,role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        x0 = self.start[index.row()]
+        x1 = self.end[index.row()]
+        unit = self.plot_manager._time_unit()
+        if unit:
+            duration = str(pandas.Timedelta(seconds=round((x1-x0)*unit)))
+        else:
+            duration = '{:g}'.format(x1-x0)
+        return '{}  ({})'.format(self.plot_manager.format_time(x0),duration)
+
+
+class SearchPanel(QWidget):
+    '''
+    Find the time intervals where a condition holds.  Clicking an interval
+    zooms all axes to it.
+    '''
+
+    def __init__(self,plot_manager,parent=None):
+        QWidget.__init__(self,parent)
+        self.plot_manager = plot_manager
+
+        self.condition_textbox = QLineEdit()
+        self.condition_textbox.setPlaceholderText('e.g. FIC101.PV > FIC101.SP + 5')
+        self.condition_textbox.returnPressed.connect(self.search)
+
+        self.result_label = QLabel()
+
+        self.model = IntervalModel(plot_manager,self)
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setModel(self.model)
+        self.list_view.clicked.connect(self.interval_clicked)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0,0,0,0)
+        layout.addWidget(self.condition_textbox)
+        layout.addWidget(self.result_label)
+        layout.addWidget(self.list_view)
+        self.setLayout(layout)
+
+    @QtCore.pyqtSlot()
+    def search(self):
+        expr = self.condition_textbox.text().strip()
+        if not expr:
+            return
+        if DEBUG:
+            print("SearchPanel::search({})".format(expr))
+
+        try:
+            start,end = self.plot_manager.find_condition(expr)
+        except Exception as e:
+            self.model.set_intervals(numpy.empty(0),numpy.empty(0))
+            self.result_label.setText(str(e))
+            return
+
+        self.model.set_intervals(start,end)
+        self.result_label.setText('{} intervals'.format(len(start)))
+
+    @QtCore.pyqtSlot(QtCore.QModelIndex)
+    def interval_clicked(self,index):
+        try:
+            self.plot_manager.zoom_to(self.model.start[index.row()],
+                                      self.model.end[index.row()])
+        except Exception as e:
+            sys.stderr.write('Exception in QtSlot SearchPanel::interval_clicked\n' \
+                + str(e) + '\n')
+
+
 class ToolPanel(QWidget):
     '''
     Widget that contains all the plotting tools.
@@ -613,15 +3507,32 @@ class ToolPanel(QWidget):
     --------
     showme_clicked
         Show Me button clicked
+    stats_toggled : QtCore.Signal(bool)
+        Stats button toggled
+    search_toggled : QtCore.Signal(bool)
+        Search button toggled
+    active_toggled : QtCore.Signal(bool)
+        Active only checkbox toggled
+    loops_clicked
+        Loops button clicked
+    heatmap_clicked
+        Heatmap button clicked
     '''
 
     showme_clicked = QtCore.Signal()
     clear_click_signal = QtCore.Signal()
     refresh_click_signal = QtCore.Signal()
+    stats_toggled = QtCore.Signal(bool)
+    search_toggled = QtCore.Signal(bool)
+    active_toggled = QtCore.Signal(bool)
+    loops_clicked = QtCore.Signal()
+    heatmap_clicked = QtCore.Signal()
 
     def __init__(self,parent=None):
         QWidget.__init__(self,parent)
         self._tools = []
+        self._active = None # tags to show when filtering active tags
+        self.trace = None # trace.Trace to record actions in
 
         showme_button = QPushButton('Show Me')
         showme_button.clicked.connect(self.showme_clicked)
@@ -632,9 +3543,46 @@ class ToolPanel(QWidget):
         refresh_button = QPushButton("Refresh")
         refresh_button.clicked.connect(self.refresh_click_signal)
 
+        self.stats_button = QPushButton("Stats")
+        self.stats_button.setCheckable(True)
+        self.stats_button.toggled.connect(self.stats_toggled)
+
+        self.search_button = QPushButton("Search")
+        self.search_button.setCheckable(True)
+        self.search_button.toggled.connect(self.search_toggled)
+
+        loops_button = QPushButton("Loops")
+        loops_button.setToolTip('Health of all the control loops')
+        loops_button.clicked.connect(self.loops_clicked)
+
+        heatmap_button = QPushButton("Heatmap")
+        heatmap_button.setToolTip('All the tags in the list as rows of one image')
+        heatmap_button.clicked.connect(self.heatmap_clicked)
+
         self.filter_textbox = QLineEdit()
         self.filter_textbox.textChanged.connect(self.filter_changed)
 
+        # tags ranked by find_correlated are shown first
+        self._ranked = None
+        self.ranked_label = QLabel()
+        self.ranked_label.setWordWrap(True)
+        self.ranked_label.hide()
+        self.show_all_button = QPushButton("Show all tags")
+        self.show_all_button.hide()
+        self.show_all_button.clicked.connect(lambda: self.set_ranked_tags(None))
+
+        self.active_checkbox = QCheckBox('Active only')
+        self.active_checkbox.setToolTip('Hide tags that do not change in the visible range')
+        self.active_checkbox.toggled.connect(self.active_clicked)
+
+        # progress of loading a dataframe in the background
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        self.cancel_button = QPushButton("Cancel loading")
+        self.cancel_button.hide()
+        self.cancel_button.clicked.connect(self.cancel_clicked)
+        self._loader = None
+
 
         # scroll_area is the scroll area that
         # will contain all the tools
@@ -665,7 +3613,16 @@ class ToolPanel(QWidget):
         main_layout.setSpacing(0)
         main_layout.addWidget(showme_button)
         main_layout.addWidget(clear_button)
+        main_layout.addWidget(self.stats_button)
+        main_layout.addWidget(self.search_button)
+        main_layout.addWidget(loops_button)
+        main_layout.addWidget(heatmap_button)
         main_layout.addWidget(self.filter_textbox)
+        main_layout.addWidget(self.active_checkbox)
+        main_layout.addWidget(self.ranked_label)
+        main_layout.addWidget(self.show_all_button)
+        main_layout.addWidget(self.progress_bar)
+        main_layout.addWidget(self.cancel_button)
         main_layout.addWidget(scroll_area)
         main_layout.addWidget(refresh_button)
         self.setLayout(main_layout)
@@ -684,16 +3641,132 @@ class ToolPanel(QWidget):
                 tool.setParent(None)
             except IndexError:
                 break
+        self._ranked = None
+        self.ranked_label.hide()
+        self.show_all_button.hide()
+
+    def plot_tag(self,tag,add=True):
+        '''
+        Plot or remove a tag with the button of its tool, like the user does.
+        Returns False if the tag has no tool.
+        '''
+        for tool in self._tools:
+            if tool.name == tag:
+                if tool.plot_button.isChecked() != add:
+                    tool.plot_button.setChecked(add)
+                return True
+        return False
+
+
+    def shown_tags(self):
+        '''
+        Tags in the list in the order they are shown, the tags hidden by the
+        filter are left out.
+        '''
+        tools = [ self.tool_layout.itemAt(i).widget()
+                  for i in range(self.tool_layout.count()) ]
+        return [ tool.name for tool in tools if not tool.isHidden() ]
+
+    def set_ranked_tags(self,tags,title=None,tips=None):
+        '''
+        Only show these tags (and plotted tags), in this order at the top of
+        the list.  None shows all the tags in their own order again.
+
+        Parameters:
+        -----------
+        tags : list or None
+            tagnames
+        title : str, optional
+            shown above the list
+        tips : dict, optional
+            tagname: tooltip
+        '''
+        tools = { tool.name : tool for tool in self._tools }
+        if self._ranked is not None:
+            # back to the original order
+            ranked = [ (i,tool) for i,tool in enumerate(self._tools)
+                       if tool.name in self._ranked ]
+            for i,tool in ranked:
+                self.tool_layout.removeWidget(tool)
+            for i,tool in ranked:
+                self.tool_layout.insertWidget(i,tool)
+                tool.plot_button.setToolTip('')
+        self._ranked = None
+        if tags is not None:
+            tags = [ t for t in tags if t in tools ]
+            self._ranked = set(tags)
+            for i,t in enumerate(tags):
+                self.tool_layout.insertWidget(i,tools[t])
+                if tips and t in tips:
+                    tools[t].plot_button.setToolTip(tips[t])
+        self.ranked_label.setText(title or '')
+        self.ranked_label.setVisible(tags is not None and bool(title))
+        self.show_all_button.setVisible(tags is not None)
+        self.filter_changed(self.filter_textbox.text())
 
+    @QtCore.pyqtSlot(bool)
+    def active_clicked(self,checked):
+        if self.trace is not None:
+            self.trace.record('active',checked)
+        self.active_toggled.emit(checked)
 
     @QtCore.pyqtSlot(str)
     def filter_changed(self,filter_text):
+        if self.trace is not None and self.sender() is self.filter_textbox:
+            self.trace.record('filter',filter_text)
+        filter_text = filter_text.lower()
         for tool in self._tools:
-            if filter_text.lower() in tool.name.lower():
+            # plotted tags are always shown so that they can be removed
+            active = ( self._active is None or tool.name in self._active
+                       or tool.plot_button.isChecked() )
+            if self._ranked is not None and tool.name not in self._ranked:
+                active = active and tool.plot_button.isChecked()
+            if active and filter_text in tool.name.lower():
                 tool.show()
             else:
                 tool.hide()
 
+    def show_progress(self,loader):
+        '''
+        Show the progress of a DataLoader until it is done.
+        '''
+        self.progress_bar.setRange(0,max(len(loader.tags),1))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.cancel_button.show()
+
+        # the loader lives on the worker thread, these are queued to the GUI
+        # thread
+        self._loader = loader
+        loader.progress.connect(self._loader_progress)
+        loader.done.connect(self._loader_done)
+
+    @QtCore.pyqtSlot(int,int)
+    def _loader_progress(self,done,total):
+        if self.sender() is self._loader:
+            self.progress_bar.setValue(done)
+
+    @QtCore.pyqtSlot()
+    def _loader_done(self):
+        if self.sender() is self._loader:
+            self._loader = None
+            self.progress_bar.hide()
+            self.cancel_button.hide()
+
+    @QtCore.pyqtSlot()
+    def cancel_clicked(self):
+        # called directly, the worker thread is busy until it is done
+        if self._loader is not None:
+            self._loader.cancel()
+
+    def set_active_tags(self,tags):
+        '''
+        Only show tools of these tags (and plotted tags).  None shows all
+        tools.
+        '''
+        self._active = tags
+        self.filter_changed(self.filter_textbox.text())
+
     @QtCore.pyqtSlot()
     def clear_clicked(self):
         if DEBUG:
@@ -728,9 +3801,27 @@ class TagTool(QWidget):
     --------
     add_remove_plot : QtCore.Signal(str,bool)
         Signal to add/remove a plot from a plot window.
+    overlay_requested : QtCore.Signal(str,str,str)
+        Signal to add (tag, kind, window) or remove (tag, '', '') rolling
+        statistics overlays.
+    xcorr_requested : QtCore.Signal(str)
+        Signal to show the cross-correlation of the tag with another tag.
+    histogram_requested : QtCore.Signal(str)
+        Signal to show the histogram of the tag.
+    density_requested : QtCore.Signal(str)
+        Signal to show the density of another tag against the tag.
+    correlated_requested : QtCore.Signal(str)
+        Signal to find the tags that are correlated with the tag.
     '''
 
     add_remove_plot = QtCore.Signal(str,bool)
+    overlay_requested = QtCore.Signal(str,str,str)
+    xcorr_requested = QtCore.Signal(str)
+    histogram_requested = QtCore.Signal(str)
+    density_requested = QtCore.Signal(str)
+    correlated_requested = QtCore.Signal(str)
+
+    _last_window = '5min'
 
     def __init__(self,name):
         '''
@@ -751,10 +3842,15 @@ class TagTool(QWidget):
         self.plot_button.setCheckable(True)
         self.plot_button.toggled.connect(self.plot_clicked)
 
+        self.options_button = QToolButton()
+        self.options_button.setArrowType(QtCore.Qt.DownArrow)
+        self.options_button.clicked.connect(self.options_clicked)
+
         layout = QHBoxLayout()
         layout.setContentsMargins(0,0,0,0)
         layout.setSpacing(0)
         layout.addWidget(self.plot_button,1)
+        layout.addWidget(self.options_button,0)
 
         self.setLayout(layout)
 
@@ -763,12 +3859,58 @@ class TagTool(QWidget):
     def plot_clicked(self,is_clicked):
         self.add_remove_plot.emit(self.name,is_clicked)
 
+    def options_menu(self):
+        '''
+        Menu with options for this tag.  The menu is only created when it is
+        needed, there could be thousands of tools.
+        '''
+        menu = QMenu(self)
+        for kind,text in calc.ROLLING_KINDS.items():
+            action = menu.addAction(text + '...')
+            action.triggered.connect(
+                lambda checked=False,kind=kind,text=text:
+                    self.overlay_clicked(kind,text)
+            )
+        menu.addAction('Remove overlays').triggered.connect(
+            lambda checked=False: self.overlay_requested.emit(self.name,'',''))
+        menu.addSeparator()
+        menu.addAction('Cross-correlation...').triggered.connect(
+            lambda checked=False: self.xcorr_requested.emit(self.name))
+        menu.addAction('Histogram').triggered.connect(
+            lambda checked=False: self.histogram_requested.emit(self.name))
+        menu.addAction('XY density...').triggered.connect(
+            lambda checked=False: self.density_requested.emit(self.name))
+        menu.addAction('Find correlated tags...').triggered.connect(
+            lambda checked=False: self.correlated_requested.emit(self.name))
+        return menu
+
+    @QtCore.pyqtSlot()
+    def options_clicked(self):
+        menu = self.options_menu()
+        menu.exec_(self.options_button.mapToGlobal(
+            self.options_button.rect().bottomLeft()))
+
+    def overlay_clicked(self,kind,text):
+        window,ok = QInputDialog.getText(
+            self,text,
+            'Window (samples, or time span e.g. 5min):',
+            QLineEdit.Normal,
+            self._last_window)
+        if not ok or not window.strip():
+            return
+        self._last_window = window.strip()
+
+        # overlays are plotted on the tag's axes, plot the tag first
+        if not self.plot_button.isChecked():
+            self.plot_button.setChecked(True)
+        self.overlay_requested.emit(self.name,kind,self._last_window)
+
     def reset(self):
         self.blockSignals(True)
         self.plot_button.setChecked(False)
         self.blockSignals(False)
 
-def add_grouping_rule(expr,color=None,sub=r'\1',top=True):
+def add_grouping_rule(expr,color=None,sub=r'\1',top=True,tolerance=None):
     '''
     Add a rule to group trends.
 
@@ -851,16 +3993,19 @@ def add_grouping_rule(expr,color=None,sub=r'\1',top=True):
     top : bool, optional
         Set to false to add rule to bottom of rule list.  Default is to add
         rules to bottom of rule list, the first rule that evaluates is used.
+    tolerance : float, optional
+        compression tolerance of the tags that match, in engineering units,
+        see set_dataframe(compress=True)
 
     '''
 
     if top:
         TagInfo.taginfo_rules.insert(0,
-            TagInfoRule(expr,color,sub)
+            TagInfoRule(expr,color,sub,tolerance)
         )
     else:
         TagInfo.taginfo_rules.append(
-            TagInfoRule(expr,color,sub)
+            TagInfoRule(expr,color,sub,tolerance)
         )
 
 def remove_grouping_rules(index=None):
@@ -889,7 +4034,7 @@ def print_grouping_rules():
     '''
     Print all grouping rules.
     '''
-    print("{:<3} {:<60} {:^10} {}".format("","expr","color","sub"))
+    print("{:<3} {:<60} {:^10} {:<10} {}".format("","expr","color","sub","tolerance"))
     print("{:->80}".format(''))
     for i in range(len(TagInfo.taginfo_rules)):
         rule = TagInfo.taginfo_rules[i]
@@ -901,8 +4046,9 @@ def print_grouping_rules():
             col = 'None'
         else:
             col = rule.color
-        print("{:<3} {:<60} {:^10} {}"\
-            .format(i, rule.expr, col, sub )
+        tol = 'None' if rule.tolerance is None else rule.tolerance
+        print("{:<3} {:<60} {:^10} {:<10} {}"\
+            .format(i, rule.expr, col, sub, tol )
         )
 
 def load_grouping_template(template):
@@ -1015,16 +4161,496 @@ def set_legend_loc(loc):
     '''
     plot_manager.legend_loc = loc
 
-def set_dataframe(df):
+def set_max_points(n):
+    '''
+    Set the maximum number of points that is plotted per line.  Lines with
+    more points are decimated to the minimum and maximum of n/2 bins of the
+    visible range, and decimated again when you zoom or pan.
+
+    Parameters:
+    -----------
+    n : int
+        maximum number of points per line
+    '''
+    plot_manager.max_points = int(n)
+    plot_manager.refresh()
+
+def start_trace():
+    '''
+    Start recording a trace of what you do: tags that are added and removed,
+    zooming and panning, Home, Clear, Refresh and filtering the tag list.
+    Use stop_trace to stop recording and save the trace.
+
+    A trace can be replayed to measure how long each step takes, see
+    proc_plot.trace.
+    '''
+    # imported here so that python -m proc_plot.trace doesn't import it twice
+    from .trace import Trace
+
+    trace = Trace()
+    plot_manager.trace = trace
+    tool_panel.trace = trace
+
+def stop_trace(path=None):
+    '''
+    Stop recording a trace.
+
+    Parameters:
+    -----------
+    path : str, optional
+        save the trace to this (json) file
+
+    Returns:
+    --------
+    proc_plot.trace.Trace
+        the trace, None if no trace was recorded
+    '''
+    trace = plot_manager.trace
+    plot_manager.trace = None
+    tool_panel.trace = None
+    if trace is not None and path is not None:
+        trace.save(path)
+    return trace
+
+def set_active_tolerance(tolerance):
+    '''
+    Set the tolerance of the "Active only" filter of the tag list.  Tags with
+    max - min <= tolerance in the visible range are hidden when the filter is
+    on.  The default is 0, only tags that are constant are hidden.
+
+    Parameters:
+    -----------
+    tolerance : float
+        tolerance in the units of the tags
+    '''
+    plot_manager.active_tolerance = float(tolerance)
+    _update_active_filter()
+
+def _update_active_filter(*args):
+    # Called when the checkbox is toggled and when the visible range changes
+    try:
+        if tool_panel.active_checkbox.isChecked():
+            tool_panel.set_active_tags(plot_manager.active_tags())
+        elif tool_panel._active is not None:
+            tool_panel.set_active_tags(None)
+    except Exception as e:
+        sys.stderr.write('Error filtering active tags\n' + str(e) + '\n')
+
+def loop_health(xlim=None,show=True):
+    '''
+    Scan all the control loops and show how healthy they are: how much they
+    oscillate, whether the valve sticks, how long the OP is at a limit and
+    the IAE.  Loops are found with the grouping rules, see
+    PlotManager.find_loops and PlotManager.loop_health.
+
+    Parameters:
+    -----------
+    xlim : tuple, optional
+        (xmin,xmax) time range, the default is all the data
+    show : bool, optional
+        show the result in a window, click a loop to plot it
+
+    Returns:
+    --------
+    pandas.DataFrame
+        a row per loop
+    '''
+    if xlim is not None and plot_manager._time_unit():
+        xlim = tuple( matplotlib.dates.date2num(pandas.Timestamp(x)) for x in xlim )
+    health = plot_manager.loop_health(xlim=xlim)
+
+    if show:
+        window = LoopHealthWindow(health)
+        window.loop_clicked.connect(_open_loop)
+        plot_manager._analysis_windows.append(window)
+        window.destroyed.connect(
+            lambda obj=None,w=window: plot_manager._analysis_windows.remove(w))
+        window.show()
+    return health
+
+def show_histogram(tag,bins=100):
+    '''
+    Show the histogram of the samples of a tag in the visible time range.
+    The histogram follows the plots when you zoom or pan.
+
+    Parameters:
+    -----------
+    tag : str
+        tagname
+    bins : int, optional
+        number of bins between the smallest and largest value of the tag
+    '''
+    return plot_manager.show_histogram(tag,bins)
+
+def show_density(xtag,ytag,bins=200):
+    '''
+    Show one tag against another (e.g. the flow against the OP of a valve) as
+    a density image of the samples in the visible time range, which works for
+    millions of samples.  The image follows the plots when you zoom or pan.
+
+    Parameters:
+    -----------
+    xtag, ytag : str
+        tagnames on the x and y axis
+    bins : int, optional
+        number of bins on each axis
+    '''
+    return plot_manager.show_density(xtag,ytag,bins)
+
+def loop_kpis(windows,groupids=None):
+    r'''
+    KPIs of control loops for many time windows: the mean absolute error
+    (SP - PV), % of the time in auto (with a .MODE tag) and % of the time at a
+    limit (e.g. ProfCon .READVALUE with .HIGHLIMIT and .LOWLIMIT).  Loops are
+    found with the grouping rules, add a rule to group ProfCon tags, e.g.
+
+        add_grouping_rule(r'(.*)\.READVALUE$')
+
+    KPIs are cached by (loop, window), asking for the same windows again is
+    immediate.  See set_kpi_options and PlotManager.loop_kpis.
+
+    Parameters:
+    -----------
+    windows : str or list
+        list of (start,end) timestamps, or a pandas frequency to split all
+        the data, e.g. 'D' for days or 'MS' for months
+    groupids : list, optional
+        loops to report, the default is all loops
+
+    Returns:
+    --------
+    pandas.DataFrame
+        index is (groupid,start,end), columns are mae, pct_auto and
+        pct_at_limit
+    '''
+    return plot_manager.loop_kpis(windows,groupids)
+
+def set_kpi_options(auto_modes=None,limit_tolerance=0.0):
+    '''
+    Set how loop_kpis calculates % in auto and % at a limit.
+
+    Parameters:
+    -----------
+    auto_modes : list, optional
+        values of the mode tag that are auto (or cascade), the default is
+        that values that are not 0 are auto
+    limit_tolerance : float, optional
+        the PV is at a limit if it is within limit_tolerance of the limit
+    '''
+    plot_manager.auto_modes = auto_modes
+    plot_manager.limit_tolerance = float(limit_tolerance)
+    plot_manager.clear_kpi_cache()
+
+def _open_loop(tags):
+    # Replace the plots with the loop's
+    try:
+        for tool in tool_panel._tools:
+            tool.reset()
+        plot_manager.clear_all_plots()
+        for tag in tags:
+            if not tool_panel.plot_tag(tag):
+                plot_manager.add_remove_plot(tag,True)
+    except Exception as e:
+        sys.stderr.write('Error opening loop\n' + str(e) + '\n')
+
+def show_heatmap(tags=None):
+    '''
+    Show many tags at once as rows of an image, each tag scaled to its own
+    range and time on the x axis, to scan hundreds of tags for the ones that
+    moved.  Click a row to plot that tag.
+
+    Parameters:
+    -----------
+    tags : list, optional
+        tagnames, the default is the tags in the tag list (with the filter
+        applied)
+    '''
+    if tags is None:
+        tags = tool_panel.shown_tags()
+    window = plot_manager.show_heatmap(tags)
+    window.tag_clicked.connect(_plot_clicked_tag)
+    return window
+
+def _heatmap_clicked():
+    try:
+        show_heatmap()
+    except Exception as e:
+        sys.stderr.write('Error showing heatmap\n' + str(e) + '\n')
+
+def _plot_clicked_tag(tag):
+    try:
+        if not tool_panel.plot_tag(tag):
+            plot_manager.add_remove_plot(tag,True)
+    except Exception as e:
+        sys.stderr.write('Error plotting tag\n' + str(e) + '\n')
+
+def set_events(events,time='time',end=None,text='text',tag=None,color=None):
+    '''
+    Show events from an alarm or operator journal on the trends, as vertical
+    lines (or spans if events have an end) with a tooltip.  Journals with
+    hundreds of thousands of events are fine: only the events in the visible
+    range are drawn and they are counted in columns when there are too many
+    to tell apart.
+
+    Events with a tag are shown on the axes where that tag (or a tag with
+    the same groupid) is plotted, events without a tag on all the axes.
+
+        proc_plot.set_events(alarms,time='Time',text='Message',tag='Tag')
+
+    Parameters:
+    -----------
+    events : pandas.DataFrame or None
+        a row per event, None to remove the events
+    time : str or None
+        column with the (start) time, None to use the index
+    end : str, optional
+        column with the end time, e.g. when an alarm returned to normal
+    text : str, optional
+        column with the text to show
+    tag : str, optional
+        column with the tagname of an event
+    color : str, optional
+        matplotlib color of the events
+    '''
+    plot_manager.set_events(events,time,end,text,tag,color)
+
+def set_event_filter(tags=None,groupids=None):
+    '''
+    Only show the events of some tags or groupids, see set_events.  Call
+    without arguments to show all the events again.
+
+    Parameters:
+    -----------
+    tags : list, optional
+        tagnames
+    groupids : list, optional
+        groupids, e.g. ['FIC101'] for the events of all the FIC101 tags
+    '''
+    plot_manager.set_event_filter(tags,groupids)
+
+def find_correlated(tag,maxlag=0.0,top=20,xlim=None,show=True):
+    '''
+    Rank all the other tags by their correlation with a tag over the visible
+    time range (or xlim), e.g. to find what else moved during an upset.  This
+    is fast enough for tens of thousands of tags, see
+    PlotManager.correlated_tags.  The tag menu has "Find correlated tags..."
+    too.
+
+    Parameters:
+    -----------
+    tag : str
+        tagname
+    maxlag : float or str, optional
+        largest lag to try, in seconds or a time span e.g. '10min'
+    top : int, optional
+        number of tags to return
+    xlim : tuple, optional
+        (start,end) time range, the default is the visible range
+    show : bool, optional
+        show only the top tags in the tag list, ranked
+
+    Returns:
+    --------
+    pandas.DataFrame
+        index tagnames, columns corr and lag (in seconds, a positive lag means
+        the tag follows tag)
+    '''
+    if isinstance(maxlag,str):
+        maxlag = pandas.Timedelta(maxlag).total_seconds()
+    if xlim is not None and plot_manager._time_unit():
+        xlim = tuple( matplotlib.dates.date2num(pandas.Timestamp(x)) for x in xlim )
+    ranking = plot_manager.correlated_tags(tag,xlim,maxlag,top)
+    if show:
+        _show_correlated(tag,ranking)
+    return ranking
+
+def _show_correlated(tag,ranking):
+    try:
+        tips = { t : 'r = {:.3f}, lag {:g}'.format(r['corr'],r['lag'])
+                 for t,r in ranking.iterrows() }
+        tool_panel.set_ranked_tags(list(ranking.index),
+                                   'Correlated with {}:'.format(tag),tips)
+    except Exception as e:
+        sys.stderr.write('Error showing correlated tags\n' + str(e) + '\n')
+
+def set_overview_visible(visible=True):
+    '''
+    Show or hide the overview strip under the plots.  The strip shows all
+    the data of the plotted tags, drag a range in it to zoom to the range.
+
+    Parameters:
+    -----------
+    visible : bool
+        show the strip
+    '''
+    overview_strip.setVisible(visible)
+
+def set_render_backend(name):
+    '''
+    Set the library that draws the plots.  All plots are cleared.
+
+    'matplotlib' is the default.  'pyqtgraph' draws dense trends much faster
+    (pyqtgraph must be installed).  Show Me shows matplotlib code for both.
+
+    Parameters:
+    -----------
+    name : str
+        'matplotlib' or 'pyqtgraph'
+    '''
+    if name not in backends:
+        raise ValueError('Unknown backend {}, use one of {}'.format(
+            name,list(backends)))
+    if plot_manager.backend.name == name:
+        return
+
+    if name == 'matplotlib':
+        backend = MatplotlibBackend(PlotWindow())
+    else:
+        backend = backends[name]()
+
+    # set_backend clears the plots, the tools must not stay checked
+    for tool in tool_panel._tools:
+        tool.reset()
+    old_widget = plot_manager.plot_window
+    plot_manager.set_backend(backend)
+    main_window.layout().replaceWidget(old_widget,plot_manager.plot_window)
+    old_widget.setParent(None)
+
+def set_source(source):
+    '''
+    Set a lazy data source to use for plotting instead of a dataframe.  See
+    proc_plot.loaders, and open_csv, open_excel and open_historian.
+
+    Parameters:
+    -----------
+    source : proc_plot.loaders.Source or proc_plot.historian.HistorianSource
+        source to plot
+    '''
+    global _isInit
+
+    if _isInit:
+        tool_panel.remove_tagtools()
+
+    plot_manager.set_source(source)
+    tool_panel.add_tagtools( plot_manager.get_tagtools() )
+
+    _isInit = True
+
+def open_csv(path,**kwargs):
+    '''
+    Plot a (large) csv export without reading it all.
+
+    Only the header is read when the file is opened, so the tag list is shown
+    immediately.  The data of a tag is read when it is plotted, the file is
+    read in chunks and only the columns that are needed are parsed.  Columns
+    that have been read are cached in path + '.ppcache' and are loaded from
+    the cache the next time the file is opened (if the file did not change).
+
+    Parameters:
+    -----------
+    path : str
+        csv file, the first column has the timestamps
+    kwargs
+        see proc_plot.loaders.CsvSource, e.g. index_col, cache, date_format,
+        chunksize and pandas.read_csv arguments like sep
+
+    Returns:
+    --------
+    proc_plot.loaders.CsvSource
+    '''
+    source = CsvSource(path,**kwargs)
+    set_source(source)
+    return source
+
+def open_excel(path,**kwargs):
+    '''
+    Plot an Excel export without reading it all.  Like open_csv, but Excel
+    files can't be read in chunks: only the columns that are plotted are
+    read, and they are cached.
+
+    Parameters:
+    -----------
+    path : str
+        Excel file, the first column has the timestamps
+    kwargs
+        see proc_plot.loaders.ExcelSource, e.g. sheet_name
+
+    Returns:
+    --------
+    proc_plot.loaders.ExcelSource
+    '''
+    source = ExcelSource(path,**kwargs)
+    set_source(source)
+    return source
+
+def open_historian(connector,start=None,end=None,cache=None,**kwargs):
+    '''
+    Plot tags straight from a historian.
+
+    The tag list comes from the historian, the data of a tag is fetched when
+    it is plotted.  Zooming or panning out of the loaded ranges fetches only
+    the part of the visible range that is not loaded yet, for the plotted
+    tags, in the background.  Tags are fetched in batches on a pool of
+    connections, see proc_plot.historian.
+
+    Parameters:
+    -----------
+    connector : proc_plot.historian.Connector
+        historian, e.g. proc_plot.historian.SqliteHistorian
+    start, end : timestamp (str, datetime, pandas.Timestamp), optional
+        range to load first, the default is the last day
+    cache : str, optional
+        SQLite file to keep the fetched data in between sessions
+    kwargs
+        see proc_plot.historian.HistorianSource, e.g. pool_size and
+        batch_size
+
+    Returns:
+    --------
+    proc_plot.historian.HistorianSource
+    '''
+    source = HistorianSource(connector,start,end,cache,**kwargs)
+    set_source(source)
+    return source
+
+def set_dataframe(df,sparse=False,background=False,compress=None,method='swinging_door'):
     '''
     Set the dataframe to use for plotting.
 
     The dataframe must be set before the tool will work.
 
+    Historian data often mixes fast tags with tags that are only recorded
+    when they change, in a wide dataframe the slow tags are mostly NaN.  Use
+    sparse=True, or pass a dict of Series, to keep only the real samples of
+    each tag.  Every tag is plotted against its own time axis and derived
+    tags hold the last value of each input.
+
     Parameters:
     -----------
-    df : pandas.core.frame.DataFrame
-        Dataframe to plot
+    df : pandas.core.frame.DataFrame or dict
+        Dataframe to plot, or a dict of tagname: pandas.Series
+    sparse : bool, optional
+        Keep only the samples that are not NaN of each column
+    background : bool, optional
+        Load the tags on a worker thread and return immediately.  The tag list
+        fills in while the tags are loaded (progress is shown in the window,
+        with a button to cancel) and tags can be plotted as soon as they are
+        in the list.  Needs a running Qt event loop, e.g. after show() or
+        with %matplotlib qt5.
+    compress : True or float, optional
+        Compress every tag like a historian does, keeping only the samples
+        needed to draw it within a tolerance.  Data exported from a
+        historian at a fixed rate is mostly interpolated and compresses well.
+        The tolerance of a tag is set with add_grouping_rule(...,tolerance=),
+        a float is the tolerance of tags without one.  Use
+        compression_report() to see the ratio and the largest error.
+    method : str, optional
+        'swinging_door' (default) or 'deadband'
+
+    Returns:
+    --------
+    DataLoader
+        if background is True, use loader.cancel() to stop loading
     '''
     global _isInit
     global _df
@@ -1035,32 +4661,142 @@ def set_dataframe(df):
 
     # Check if dataframe has datetime index, this is not required but a
     # worthwhile error check
-    if type(df.index) != pandas.DatetimeIndex:
+    if isinstance(df,dict):
+        indexes = [ s.index for s in df.values() ]
+    else:
+        indexes = [ df.index ]
+    if any( type(i) != pandas.DatetimeIndex for i in indexes ):
         sys.stderr.write("WARNING: Dataframe does not have a datetime index\n")
 
     if _isInit:
         tool_panel.remove_tagtools()
 
-    plot_manager.set_dataframe(df)
+    if background:
+        loader = plot_manager.set_dataframe(df,sparse,True,compress,method)
+        tool_panel.show_progress(loader)
+        _isInit = True
+        return loader
+
+    plot_manager.set_dataframe(df,sparse,False,compress,method)
+    tool_panel.add_tagtools( plot_manager.get_tagtools() )
+
+    _isInit = True
+
+def compression_report():
+    '''
+    How much the tags were compressed by set_dataframe(compress=...).
+
+    Returns:
+    --------
+    pandas.DataFrame
+        a row per compressed tag with the number of samples, the samples
+        kept, the ratio, the largest error and the tolerance
+    '''
+    return plot_manager.compression_report()
+
+
+def set_long_dataframe(df,tag='tag',time='time',value='value',quality=None,good=None):
+    '''
+    Set a dataframe in long format to use for plotting: a row per sample
+    with the tagname, time, value and (optionally) quality, like most
+    historian exports.  The rows are sorted by tag and time once and the
+    samples of every tag are kept like sparse data (see set_dataframe), the
+    wide dataframe is not made.  Samples with bad quality are shown as gaps.
+
+    Parameters:
+    -----------
+    df : pandas.core.frame.DataFrame
+        Dataframe in long format
+    tag : str, optional
+        Column with the tagnames
+    time : str or None, optional
+        Column with the timestamps, None to use the index
+    value : str, optional
+        Column with the values
+    quality : str, optional
+        Column with the quality of the samples
+    good : scalar or list, optional
+        Quality values that are good, e.g. 'Good' or 192.  By default quality
+        values that are True (not 0) are good.
+    '''
+    global _isInit
+
+    if _isInit:
+        tool_panel.remove_tagtools()
+
+    plot_manager.set_long_dataframe(df,tag,time,value,quality,good)
     tool_panel.add_tagtools( plot_manager.get_tagtools() )
 
     _isInit = True
 
 
-def show():
+def define_tag(name,expr):
+    '''
+    Define a derived tag that is calculated from other tags.
+
+    The derived tag is added to the tag list and is grouped by the grouping
+    rules like any other tag.  It is only calculated when it is plotted, and
+    it is calculated again when the dataframe is set again or when a tag it
+    depends on is redefined.
+
+    Tagnames in the expression can be used as is (e.g. FIC101.PV) unless they
+    contain characters other than letters, digits, '_', '.' and ':', then they
+    must be quoted with backticks (e.g. `FIC 101`).  Use 't' for time in
+    seconds.  Functions that can be used:
+        abs, sqrt, exp, log, log10, sin, cos, where, minimum, maximum, clip,
+        diff (first difference)
+
+    If numexpr is installed it is used to evaluate the expression, otherwise
+    numpy is used.
+
+    Examples:
+    ---------
+    define_tag('FIC101.ERR','FIC101.SP - FIC101.PV')
+    define_tag('FIC101.ROC','diff(FIC101.OP)/diff(t)')
+    define_tag('RATIO','FIC101.PV / maximum(FIC102.PV,1)')
+
+    Parameters:
+    -----------
+    name : str
+        name of derived tag
+    expr : str
+        expression to calculate the tag
+    '''
+    global _isInit
+
+    new = plot_manager.define_tag(name,expr)
+    if _isInit and new:
+        tool_panel.add_tagtools( plot_manager.get_tagtools([name]) )
+
+
+def show(block=True):
     '''
     Show the plot window.
+
+    Parameters:
+    -----------
+    block : bool, optional
+        False to return immediately and keep the window responsive from the
+        asyncio event loop that is running, e.g. in a Jupyter notebook.
+        Other cells can run (and await set_dataframe_async,
+        find_condition_async or run_in_thread) while the window is open.  The
+        window can be shown before the data is set, the tag list fills in
+        when it is loaded.
     '''
     global main_window
     global _isInit
 
-    if not _isInit:
+    if not _isInit and block:
         sys.stderr.write('Dataframe is not initialised, use set_dataframe to'
                         +' initialise dataframe\n')
         return
 
     main_window.show()
 
+    if not block:
+        _start_pump()
+        return
+
     if DEBUG:
         print("Showing main window")
 
@@ -1082,7 +4818,84 @@ def show():
 
 
 
+async def _pump_qt(interval):
+    '''
+    Process Qt events from the asyncio event loop while the window is shown.
+    '''
+    global _pump_task
+    try:
+        while main_window.isVisible():
+            app.processEvents()
+            await asyncio.sleep(interval)
+    finally:
+        _pump_task = None
+
+def _start_pump():
+    global _pump_task
+
+    # a Qt backend in interactive mode already runs the Qt event loop
+    if ( (plt.get_backend().lower() in ['qt5agg','qtagg'] ) and
+        plt.isinteractive() ):
+        return
+    if _pump_task is not None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        sys.stderr.write('WARNING: No asyncio event loop is running, the window'
+                        +' only responds while Python waits for input\n')
+        return
+    _pump_task = loop.create_task(_pump_qt(0.02))
+
+async def run_in_thread(func,*args,**kwargs):
+    '''
+    Run a function on a worker thread and wait for it without blocking the
+    event loop (or the window, see show(block=False)), e.g.
+
+        idx = await proc_plot.run_in_thread(calc.minmax_decimate,y,2000)
+
+    Use it for calculations on numpy arrays, not for functions that change
+    the plots.
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None,functools.partial(func,*args,**kwargs))
+
+async def set_dataframe_async(df,sparse=False):
+    '''
+    Set the dataframe to plot and wait until it is loaded without blocking
+    the event loop: the tags are loaded on a worker thread (see set_dataframe
+    with background=True) and the window stays responsive.
+
+        await proc_plot.set_dataframe_async(df)
+    '''
+    set_dataframe(df,sparse,background=True)
+    while plot_manager.is_loading():
+        # the loader's signals are queued to this thread
+        app.processEvents()
+        await asyncio.sleep(0.02)
+
+async def find_condition_async(expr):
+    '''
+    Find the time intervals where a condition holds, like the Search panel,
+    e.g. await proc_plot.find_condition_async('FIC101.PV > FIC101.SP + 5').
+    The condition is evaluated on a worker thread.
+
+    Returns:
+    --------
+    start, end : numpy.ndarray
+        time of the first and last sample of each interval, in axes units
+        (matplotlib date numbers for a datetime index)
+    '''
+    # the data is read here, evaluating it is thread safe
+    texpr = TagExpression(expr,set(plot_manager._taginfo))
+    inputs = [ plot_manager.get_xy(t) for t in texpr.inputs ]
+    linear = [ plot_manager._is_compressed(t) for t in texpr.inputs ]
+    return await run_in_thread(_intervals,texpr,inputs,plot_manager._time_unit(),
+                               linear)
+
+
 _isInit = False # has the window been initialised with a dataframe?
+_pump_task = None # asyncio task that processes Qt events, see show
 
 
 
@@ -1104,9 +4917,36 @@ tool_panel.showme_clicked.connect(plot_manager.showme)
 tool_panel.clear_click_signal.connect(plot_manager.clear_all_plots)
 tool_panel.refresh_click_signal.connect(plot_manager.refresh)
 
+stats_panel = StatsPanel(plot_manager,main_window)
+stats_panel.hide()
+tool_panel.stats_toggled.connect(stats_panel.setVisible)
+
+search_panel = SearchPanel(plot_manager,main_window)
+search_panel.hide()
+tool_panel.search_toggled.connect(search_panel.setVisible)
+
+tool_panel.active_toggled.connect(_update_active_filter)
+tool_panel.loops_clicked.connect(lambda: loop_health())
+tool_panel.heatmap_clicked.connect(_heatmap_clicked)
+plot_manager.correlated_found.connect(_show_correlated)
+
+plot_manager.tags_added.connect(
+    lambda tags: tool_panel.add_tagtools(plot_manager.get_tagtools(tags)))
+plot_manager.xlim_changed.connect(_update_active_filter)
+plot_manager.active_changed.connect(_update_active_filter)
+
+overview_strip = OverviewStrip(plot_manager,main_window)
+
+plot_layout = QVBoxLayout()
+plot_layout.setSpacing(0)
+plot_layout.addWidget(plot_manager.plot_window,1)
+plot_layout.addWidget(overview_strip,0)
+
 layout = QHBoxLayout()
 layout.addWidget(tool_panel,0)
-layout.addWidget(plot_manager.plot_window,1)
+layout.addLayout(plot_layout,1)
+layout.addWidget(stats_panel,0)
+layout.addWidget(search_panel,0)
 main_window.setLayout(layout)
 #del layout
 
@@ -0,0 +1,388 @@
+'''
+Show proc_plot in a separate process.
+
+show() runs the Qt event loop, which blocks a notebook kernel, and even with
+%matplotlib qt5 redrawing large plots freezes the kernel because the plots are
+drawn on its thread.  A RemoteViewer runs the window in its own process
+instead.  The data is copied once into shared memory and the viewer uses the
+shared arrays as is, commands (plot tags, zoom, grouping rules) are sent over
+a pipe, so the kernel and the window don't wait for each other:
+
+    viewer = proc_plot.show_remote(df)
+    viewer.plot_tags(['FIC101.PV','FIC101.OP'])
+    viewer.set_xlim('2020-01-01 06:00','2020-01-01 12:00')
+
+In a script (not a notebook) the viewer must be started under
+if __name__ == '__main__': because the viewer process imports the script.
+'''
+
+import multiprocessing
+import sys
+import weakref
+from multiprocessing import shared_memory
+
+import numpy
+import pandas
+import matplotlib.dates
+
+from . import pp
+from .pp import _index_to_x, _load_tags, _plottable
+from .trace import _set_plot, _set_xlim, _clear
+
+
+def _attach(name):
+    # The viewer doesn't own the block, RemoteViewer unlinks it
+    try:
+        return shared_memory.SharedMemory(name,track=False)
+    except TypeError:
+        # Python < 3.13
+        return shared_memory.SharedMemory(name)
+
+def _release(process,conn,blocks):
+    if process.is_alive():
+        try:
+            conn.send(('close',()))
+        except (OSError,ValueError):
+            pass
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+    conn.close()
+    for shm in blocks:
+        shm.close()
+        shm.unlink()
+
+
+class RemoteViewer():
+    '''
+    A proc_plot window in a separate process, see the module docstring.
+
+    Commands are sent to the viewer and are done when the viewer gets to
+    them, they don't wait for the viewer (except state).
+    '''
+
+    def __init__(self,df,sparse=False):
+        '''
+        Copy the data to shared memory and start the viewer.
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame or dict
+            data, see proc_plot.set_dataframe
+        sparse : bool, optional
+            keep only the samples of each tag that are not NaN
+        '''
+        if isinstance(df,dict):
+            indexes = [ s.index for s in df.values() ]
+            sparse = True
+        else:
+            df = df.loc[:,~df.columns.duplicated()]
+            indexes = [ df.index ]
+        is_datetime = [ type(i) == pandas.DatetimeIndex for i in indexes ]
+        if any(is_datetime) and not all(is_datetime):
+            raise ValueError('Some series have a datetime index and others not')
+        datetime = len(indexes) > 0 and all(is_datetime)
+        tz = indexes[0].tz if datetime else None
+
+        # All the x arrays are in one block and all the y arrays in another,
+        # the viewer gets the (start,stop) of every array.
+        if sparse:
+            loaded = _load_tags(df,list(df),True,
+                None if isinstance(df,dict) else _index_to_x(df.index))
+            tags = [ tag for tag,taginfo,xy in loaded ]
+            xs = [ xy[0] for tag,taginfo,xy in loaded ]
+            ys = [ xy[1] for tag,taginfo,xy in loaded ]
+            bounds = numpy.cumsum([0] + [ len(x) for x in xs ])
+            xslices = [ (int(bounds[i]),int(bounds[i+1])) for i in range(len(tags)) ]
+            yslices = xslices
+        else:
+            tags = [ t for t in df if _plottable(t,df[t].dtype) ]
+            xs = [ _index_to_x(df.index) ]
+            ys = [ df[t] for t in tags ]
+            n = len(df.index)
+            xslices = [ (0,n) ]*len(tags)
+            yslices = [ (i*n,(i+1)*n) for i in range(len(tags)) ]
+
+        self._blocks = []
+        xblock = self._copy(xs)
+        yblock = self._copy(ys)
+
+        self.tags = tags
+        self.datetime = datetime
+        meta = {
+            'tags' : tags,
+            'x' : xblock,
+            'y' : yblock,
+            'xslices' : xslices,
+            'yslices' : yslices,
+            'datetime' : datetime,
+            'tz' : tz,
+            'rules' : [ (r.expr,r.color,r.sub,r.tolerance) for r in pp.TagInfo.taginfo_rules ],
+            'definitions' : dict(pp.plot_manager._tag_definitions),
+        }
+
+        # fork would copy the QApplication of this process
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(target=_viewer_main,args=(child_conn,meta),
+                                    daemon=True)
+        self._process.start()
+        child_conn.close()
+
+        self._finalizer = weakref.finalize(self,_release,self._process,
+                                           self._conn,self._blocks)
+
+    def _copy(self,arrays):
+        '''
+        Copy arrays into a new shared memory block, returns (name,length).
+        '''
+        n = sum( len(a) for a in arrays )
+        shm = shared_memory.SharedMemory(create=True,size=max(8*n,8))
+        self._blocks.append(shm)
+        buf = numpy.ndarray(n,dtype=float,buffer=shm.buf)
+        i = 0
+        for a in arrays:
+            buf[i:i+len(a)] = a.to_numpy(dtype=float) if isinstance(a,pandas.Series) else a
+            i += len(a)
+        del buf
+        return shm.name, n
+
+    def _send(self,cmd,*args):
+        if not self._process.is_alive():
+            raise RuntimeError('The viewer is closed')
+        self._conn.send((cmd,args))
+
+    def _to_x(self,t):
+        if self.datetime:
+            return float(matplotlib.dates.date2num(pandas.Timestamp(t)))
+        return float(t)
+
+    def is_alive(self):
+        '''
+        True until the window is closed.
+        '''
+        return self._process.is_alive()
+
+    def plot_tags(self,tags,add=True):
+        '''
+        Plot (or remove) tags.
+
+        Parameters:
+        -----------
+        tags : str or list
+            tagnames
+        add : bool, optional
+            False to remove the tags
+        '''
+        if isinstance(tags,str):
+            tags = [tags]
+        self._send('plot_tags',list(tags),add)
+
+    def clear(self):
+        '''
+        Remove all the plots.
+        '''
+        self._send('clear')
+
+    def set_xlim(self,xmin,xmax):
+        '''
+        Zoom to a time range.
+
+        Parameters:
+        -----------
+        xmin, xmax : timestamp (str, datetime, pandas.Timestamp) or float
+            range to show
+        '''
+        self._send('xlim',self._to_x(xmin),self._to_x(xmax))
+
+    def home_zoom(self):
+        '''
+        Zoom to show all the data.
+        '''
+        self._send('home_zoom')
+
+    def define_tag(self,name,expr):
+        '''
+        Define a derived tag in the viewer, see proc_plot.define_tag.
+        '''
+        self._send('define_tag',name,expr)
+
+    def add_grouping_rule(self,expr,color=None,sub=r'\1',top=True):
+        '''
+        Add a grouping rule in the viewer, see proc_plot.add_grouping_rule.
+        The tags are grouped again and plotted tags stay plotted.
+        '''
+        self._send('add_grouping_rule',expr,color,sub,top)
+
+    def remove_grouping_rules(self,index=None):
+        '''
+        Remove grouping rules in the viewer, see
+        proc_plot.remove_grouping_rules.
+        '''
+        self._send('remove_grouping_rules',index)
+
+    def state(self,timeout=5.0):
+        '''
+        Ask the viewer what it shows.  This waits for the viewer to do the
+        commands that were sent before.
+
+        Returns:
+        --------
+        dict
+            'plots': list of the tagnames on every axes, 'xlim': (xmin,xmax)
+            or None
+        '''
+        self._send('state')
+        if not self._conn.poll(timeout):
+            raise TimeoutError('The viewer did not answer')
+        return self._conn.recv()
+
+    def close(self):
+        '''
+        Close the viewer and free the shared memory.
+        '''
+        self._finalizer()
+
+
+def show_remote(df,sparse=False):
+    '''
+    Show data in a proc_plot window that runs in a separate process, so the
+    notebook kernel is not blocked.  See proc_plot.remote.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame or dict
+        data, see set_dataframe
+    sparse : bool, optional
+        keep only the samples of each tag that are not NaN
+
+    Returns:
+    --------
+    RemoteViewer
+        send commands to the viewer, e.g. viewer.plot_tags(['FIC101.PV'])
+    '''
+    return RemoteViewer(df,sparse)
+
+
+############################################################################
+# Viewer process
+############################################################################
+
+def _views(meta,blocks):
+    '''
+    tagname: (x,y) read only views of the shared memory.
+    '''
+    arrays = []
+    for key in ('x','y'):
+        name,n = meta[key]
+        shm = _attach(name)
+        blocks.append(shm)
+        a = numpy.ndarray(n,dtype=float,buffer=shm.buf)
+        a.setflags(write=False)
+        arrays.append(a)
+    x_all,y_all = arrays
+
+    # tags that share the time axis share the x array
+    xviews = {}
+    data = {}
+    for tag,xs,ys in zip(meta['tags'],meta['xslices'],meta['yslices']):
+        xs = tuple(xs)
+        if xs not in xviews:
+            xviews[xs] = x_all[xs[0]:xs[1]]
+        data[tag] = (xviews[xs],y_all[ys[0]:ys[1]])
+    return data
+
+def _load(data,meta):
+    pm = pp.plot_manager
+    plotted = [ t for pi in pm._plotinfo for t in pi.tagnames ]
+    xlim = pm.backend.get_xlim(pm._plotinfo[0].ax) if plotted else None
+
+    if pp._isInit:
+        pp.tool_panel.remove_tagtools()
+    pm.set_arrays(data,meta['datetime'],meta['tz'])
+    pp.tool_panel.add_tagtools( pm.get_tagtools() )
+    pp._isInit = True
+
+    for tag in plotted:
+        if tag in pm._taginfo:
+            _set_plot(pp,tag,True)
+    if xlim is not None:
+        _set_xlim(pp,*xlim)
+
+def _state(pm):
+    plots = [ list(pi.tagnames) for pi in pm._plotinfo ]
+    xlim = None
+    if plots:
+        xlim = tuple( float(v) for v in pm.backend.get_xlim(pm._plotinfo[0].ax) )
+    return {'plots':plots,'xlim':xlim}
+
+def _handle(conn,cmd,args,data,meta):
+    '''
+    Do a command, returns False to stop the viewer.
+    '''
+    pm = pp.plot_manager
+    if cmd == 'close':
+        return False
+    elif cmd == 'plot_tags':
+        tags,add = args
+        for tag in tags:
+            if tag in pm._taginfo:
+                _set_plot(pp,tag,add)
+            else:
+                sys.stderr.write('Unknown tag {}\n'.format(tag))
+    elif cmd == 'clear':
+        _clear(pp)
+    elif cmd == 'xlim':
+        _set_xlim(pp,*args)
+    elif cmd == 'home_zoom':
+        pm.home_zoom()
+    elif cmd == 'define_tag':
+        pp.define_tag(*args)
+    elif cmd == 'add_grouping_rule':
+        pp.add_grouping_rule(*args)
+        _load(data,meta)
+    elif cmd == 'remove_grouping_rules':
+        index, = args
+        if index is None:
+            pp.TagInfo.taginfo_rules.clear()
+        else:
+            pp.TagInfo.taginfo_rules.pop(index)
+        _load(data,meta)
+    elif cmd == 'state':
+        conn.send(_state(pm))
+    else:
+        sys.stderr.write('Unknown command {}\n'.format(cmd))
+    return True
+
+def _viewer_main(conn,meta):
+    from PyQt5 import QtCore
+
+    pp.TagInfo.taginfo_rules[:] = [ pp.TagInfoRule(*r) for r in meta['rules'] ]
+    for name,expr in meta['definitions'].items():
+        pp.plot_manager._tag_definitions[name] = expr
+
+    blocks = []
+    data = _views(meta,blocks)
+    _load(data,meta)
+
+    def poll():
+        try:
+            while conn.poll():
+                cmd,args = conn.recv()
+                try:
+                    if not _handle(conn,cmd,args,data,meta):
+                        pp.app.quit()
+                        return
+                except Exception as e:
+                    sys.stderr.write('Error in command {}\n'.format(cmd) + str(e) + '\n')
+        except (EOFError,OSError):
+            # the kernel is gone
+            pp.app.quit()
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(poll)
+    timer.start(50)
+
+    pp.main_window.show()
+    pp.app.exec_()
+    timer.stop()
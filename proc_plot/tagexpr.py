@@ -0,0 +1,199 @@
+'''
+Expression engine for derived tags.
+
+A derived tag is defined by an expression that references other tags, e.g.
+'FIC101.SP - FIC101.PV'.  Expressions are evaluated on whole numpy arrays
+(numexpr is used when it is installed and the expression only uses functions
+that numexpr understands).
+'''
+
+import re
+
+import numpy
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+# Tokens in an expression that could be tagnames.  Tagnames that contain
+# characters other than letters, digits, '_', '.' and ':' must be quoted with
+# backticks, e.g. `FIC 101 PV` * 2
+_token_re = re.compile(r'`([^`]+)`|([A-Za-z0-9_][\w.:]*)')
+
+
+def _diff(a):
+    '''
+    First difference of a, same length as a (first element is NaN).
+    '''
+    d = numpy.empty(len(a))
+    d[0] = numpy.nan
+    numpy.subtract(a[1:],a[:-1],out=d[1:])
+    return d
+
+
+# Functions that can be used in an expression.  The names in _numexpr_names
+# are also understood by numexpr.
+_functions = {
+    'abs' : numpy.abs,
+    'sqrt' : numpy.sqrt,
+    'exp' : numpy.exp,
+    'log' : numpy.log,
+    'log10' : numpy.log10,
+    'sin' : numpy.sin,
+    'cos' : numpy.cos,
+    'where' : numpy.where,
+    'minimum' : numpy.minimum,
+    'maximum' : numpy.maximum,
+    'clip' : numpy.clip,
+    'diff' : _diff,
+    'nan' : numpy.nan,
+}
+_numexpr_names = {'abs','sqrt','exp','log','log10','sin','cos','where'}
+
+# Name that refers to time (in seconds) in an expression
+TIME_NAME = 't'
+
+
+class TagExpression():
+    '''
+    A parsed derived tag expression.
+
+    Attributes:
+    -----------
+    expr : str
+        the expression as defined by the user
+    inputs : list
+        tagnames the expression depends on
+    '''
+
+    def __init__(self,expr,tagnames):
+        '''
+        Parameters:
+        -----------
+        expr : str
+            expression, e.g. 'FIC101.SP - FIC101.PV' or 'diff(FIC101.OP)/diff(t)'
+        tagnames : collection
+            tags that can be referenced in the expression
+        '''
+        self.expr = expr
+        self.inputs = []
+        self.uses_time = False
+
+        names = set()
+        pieces = []
+        pos = 0
+        for m in _token_re.finditer(expr):
+            quoted, token = m.group(1), m.group(2)
+            name = quoted if quoted is not None else token
+
+            if name in tagnames:
+                if name not in self.inputs:
+                    self.inputs.append(name)
+                var = '_v{}'.format(self.inputs.index(name))
+            elif quoted is not None:
+                raise ValueError('Unknown tag `{}` in expression'.format(name))
+            else:
+                var = name
+                if token == TIME_NAME:
+                    self.uses_time = True
+                elif token[0].isalpha() or token[0] == '_':
+                    names.add(token)
+
+            pieces.append(expr[pos:m.start()])
+            pieces.append(var)
+            pos = m.end()
+        pieces.append(expr[pos:])
+        self._code = ''.join(pieces)
+
+        unknown = names - set(_functions)
+        if unknown:
+            raise ValueError('Unknown names in expression: {}'.format(
+                ', '.join(sorted(unknown))))
+
+        if len(self.inputs) == 0:
+            raise ValueError('Expression does not reference any tags')
+
+        # numexpr can't do everything numpy can
+        self._numexpr = (numexpr is not None) and names <= _numexpr_names
+
+        try:
+            self._compiled = compile(self._code,'<{}>'.format(expr),'eval')
+        except SyntaxError as e:
+            raise ValueError('Invalid expression {}: {}'.format(expr,e))
+
+    def evaluate(self,values,time=None):
+        '''
+        Evaluate the expression.
+
+        Parameters:
+        -----------
+        values : list
+            numpy arrays for each tag in self.inputs (same length)
+        time : numpy.ndarray, optional
+            time in seconds, required if the expression uses 't'
+
+        Returns:
+        --------
+        numpy.ndarray of float
+        '''
+        local_dict = { '_v{}'.format(i) : v for i,v in enumerate(values) }
+        if self.uses_time:
+            if time is None:
+                raise ValueError('Expression uses time but no time is given')
+            local_dict[TIME_NAME] = time
+
+        result = None
+        if self._numexpr:
+            try:
+                result = numexpr.evaluate(self._code,local_dict=local_dict)
+            except Exception:
+                result = None
+
+        if result is None:
+            with numpy.errstate(all='ignore'):
+                result = eval(self._compiled,
+                              {'__builtins__' : {}},
+                              dict(_functions,**local_dict))
+
+        result = numpy.asarray(result,dtype=float)
+        if result.ndim == 0:
+            result = numpy.full(len(values[0]),float(result))
+        return result
+
+
+def time_seconds(index):
+    '''
+    Time in seconds since the first sample of a dataframe index.  A numeric
+    index is used as is.
+    '''
+    if len(index) == 0:
+        return numpy.empty(0)
+    if hasattr(index,'total_seconds') or hasattr(index,'tz'):
+        return numpy.asarray((index - index[0]).total_seconds(),dtype=float)
+    return numpy.asarray(index,dtype=float)
+
+
+def evaluate(df,expr):
+    '''
+    Evaluate an expression on the columns of a dataframe.  This is the same
+    evaluation that is used for derived tags in proc_plot, e.g.
+
+    df['FIC101.ERR'] = evaluate(df,'FIC101.SP - FIC101.PV')
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        dataframe with columns that are referenced in expr
+    expr : str
+        expression
+
+    Returns:
+    --------
+    numpy.ndarray
+    '''
+    texpr = TagExpression(expr,df.columns)
+    values = [ df[t].to_numpy(dtype=float) for t in texpr.inputs ]
+    time = time_seconds(df.index) if texpr.uses_time else None
+    return texpr.evaluate(values,time)
@@ -0,0 +1,194 @@
+'''
+Record and replay interaction traces.
+
+A trace is the sequence of actions in a proc_plot session (tags added and
+removed, zooming, Home, Clear, filtering the tag list, ...) with the time
+of each action.  Replaying a trace against a dataset repeats the session
+without a user and measures how long every step takes, so a slow session
+can be used as a benchmark.
+
+Record a trace:
+
+    proc_plot.start_trace()
+    ... use proc_plot ...
+    proc_plot.stop_trace('slow_session.json')
+
+Replay it headless, from the command line:
+
+    QT_QPA_PLATFORM=offscreen python -m proc_plot.trace slow_session.json data.pkl
+'''
+
+import argparse
+import json
+import sys
+import time
+
+import numpy
+import pandas
+
+
+class Trace():
+    '''
+    A recorded sequence of actions.
+
+    Attributes:
+    -----------
+    events : list
+        (time, action, args), time in seconds since the start of the trace
+    '''
+
+    version = 1
+
+    def __init__(self,events=None):
+        self.events = list(events) if events is not None else []
+        self._t0 = time.perf_counter()
+
+    def record(self,action,*args):
+        '''
+        Add an action to the trace.  Arguments must be str, bool or numbers.
+        '''
+        args = [ float(a) if isinstance(a,(float,numpy.floating)) else a
+                 for a in args ]
+        self.events.append((time.perf_counter() - self._t0,action,args))
+
+    def __len__(self):
+        return len(self.events)
+
+    def save(self,path):
+        '''
+        Save the trace as a json file.
+        '''
+        with open(path,'w') as f:
+            json.dump({
+                'version' : self.version,
+                'events' : [ {'t':t,'action':action,'args':args}
+                             for t,action,args in self.events ],
+            },f,indent=1)
+
+    @classmethod
+    def load(cls,path):
+        '''
+        Load a trace saved with save.
+        '''
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != cls.version:
+            raise ValueError('Unsupported trace version {}'.format(
+                data.get('version')))
+        return cls([ (e['t'],e['action'],e['args']) for e in data['events'] ])
+
+
+def _set_plot(pp,tag,add):
+    # Use the tag's button if there is one, like the user did
+    if not pp.tool_panel.plot_tag(tag,add):
+        pp.plot_manager.add_remove_plot(tag,add)
+
+def _clear(pp):
+    for tool in pp.tool_panel._tools:
+        tool.reset()
+    pp.plot_manager.clear_all_plots()
+
+def _set_xlim(pp,xmin,xmax):
+    pm = pp.plot_manager
+    if len(pm._plotinfo) == 0:
+        return
+    pm.backend.set_xlim(pm._plotinfo[0].ax,xmin,xmax)
+    pm.backend.draw()
+    # don't wait for zooming to settle
+    pm._xlim_timer.stop()
+    pm._xlim_settled()
+
+# action: function(pp,*args)
+_actions = {
+    'add_remove_plot' : _set_plot,
+    'add_remove_overlay' : lambda pp,*args: pp.plot_manager.add_remove_overlay(*args),
+    'home_zoom' : lambda pp: pp.plot_manager.home_zoom(),
+    'clear_all_plots' : _clear,
+    'refresh' : lambda pp: pp.plot_manager.refresh(),
+    'xlim' : _set_xlim,
+    'filter' : lambda pp,text: pp.tool_panel.filter_textbox.setText(text),
+    'active' : lambda pp,on: pp.tool_panel.active_checkbox.setChecked(on),
+}
+
+
+def replay(trace,df=None,sparse=False):
+    '''
+    Replay a trace and measure the time of every step.  A step includes
+    drawing and processing the Qt events it causes.
+
+    Parameters:
+    -----------
+    trace : Trace or str
+        trace, or path of a saved trace
+    df : pandas.DataFrame, optional
+        data to replay the trace with, the default is the dataframe that is
+        set
+    sparse : bool, optional
+        see proc_plot.set_dataframe
+
+    Returns:
+    --------
+    pandas.DataFrame
+        one row per step with the action, its arguments and the latency in
+        seconds
+    '''
+    from . import pp
+
+    if isinstance(trace,str):
+        trace = Trace.load(trace)
+    if df is not None:
+        pp.set_dataframe(df,sparse)
+    pp.main_window.show()
+    pp.app.processEvents()
+
+    # don't record the replay
+    recording = pp.plot_manager.trace, pp.tool_panel.trace
+    pp.plot_manager.trace = pp.tool_panel.trace = None
+
+    rows = []
+    try:
+        for t,action,args in trace.events:
+            try:
+                func = _actions[action]
+            except KeyError:
+                sys.stderr.write('Unknown action {} in trace\n'.format(action))
+                continue
+            t0 = time.perf_counter()
+            func(pp,*args)
+            pp.app.processEvents()
+            rows.append((t,action,args,time.perf_counter()-t0))
+    finally:
+        pp.plot_manager.trace, pp.tool_panel.trace = recording
+
+    return pandas.DataFrame(rows,columns=['t','action','args','latency'])
+
+
+def _read_data(path):
+    if path.endswith('.csv'):
+        return pandas.read_csv(path,index_col=0,parse_dates=True)
+    if path.endswith('.parquet'):
+        return pandas.read_parquet(path)
+    return pandas.read_pickle(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Replay a proc_plot trace and report the latency of '
+                    'every step.  Set QT_QPA_PLATFORM=offscreen to run '
+                    'without a display.')
+    parser.add_argument('trace',help='trace saved with proc_plot.stop_trace')
+    parser.add_argument('data',help='dataframe (.pkl, .parquet or .csv)')
+    parser.add_argument('--sparse',action='store_true',
+                        help='store the data sparse, see set_dataframe')
+    args = parser.parse_args(argv)
+
+    report = replay(Trace.load(args.trace),_read_data(args.data),args.sparse)
+    with pandas.option_context('display.max_rows',None,
+                               'display.max_colwidth',60):
+        print(report.to_string())
+    print('Total: {:.3f}s, slowest step: {:.3f}s'.format(
+        report['latency'].sum(),report['latency'].max()))
+
+
+if __name__ == '__main__':
+    main()
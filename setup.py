@@ -21,6 +21,7 @@ setup(
   download_url = 'https://github.com/fpieterse/proc_plot/archive/v'+__version__+'.tar.gz',
   keywords = ['Trend','Process Control'],
   install_requires=[
+          'numpy',
           'pandas',
           'matplotlib',
           'pyperclip'
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+
+import time
+import numpy
+import pandas
+from PyQt5 import QtCore
+
+plot_manager = proc_plot.pp.plot_manager
+tool_panel = proc_plot.pp.tool_panel
+
+n = 1000
+index = pandas.date_range('2020-01-01',periods=n,freq='s')
+t = numpy.arange(n)
+numpy.random.seed(0)
+df = pandas.DataFrame({
+    'CONST' : numpy.full(n,3.0),
+    'STEP' : numpy.where(t < 600,1.0,2.0),     # changes after 600
+    'NOISE' : 0.05*numpy.random.rand(n),       # changes less than 0.05
+    'RAMP' : t/10.0,
+},index=index)
+x = proc_plot.pp._index_to_x(index)
+
+############################################################################
+# --- TEST:  tags that change in a range                               --- #
+############################################################################
+for sparse in (False,True):
+    proc_plot.set_dataframe(df,sparse=sparse)
+    for tag in df:
+        plot_manager.get_xy(tag)
+
+    active = plot_manager.active_tags()
+    assert active == {'STEP','NOISE','RAMP'}, \
+        'Constant tags are not active ({})'.format(active)
+    active = plot_manager.active_tags((x[0],x[500]))
+    assert active == {'NOISE','RAMP'}, \
+        'STEP is constant before 600 ({})'.format(active)
+    active = plot_manager.active_tags((x[700],x[900]))
+    assert active == {'NOISE','RAMP'}, \
+        'STEP is constant after 600 ({})'.format(active)
+    active = plot_manager.active_tags((x[500],x[700]))
+    assert active == {'STEP','NOISE','RAMP'}, \
+        'STEP changes in 500-700 ({})'.format(active)
+    active = plot_manager.active_tags((x[-1]+1,x[-1]+2))
+    assert active == set(), 'Nothing is active outside the data'
+
+    # tolerance
+    active = plot_manager.active_tags(tolerance=0.1)
+    assert active == {'STEP','RAMP'}, 'NOISE is within 0.1 ({})'.format(active)
+    active = plot_manager.active_tags((x[0],x[5]),tolerance=0.1)
+    assert active == {'RAMP'}, 'RAMP changes 0.5 in 5 s ({})'.format(active)
+    active = plot_manager.active_tags((x[0],x[1]),tolerance=0.1)
+    assert active == set(), 'RAMP changes 0.1 in 1 s ({})'.format(active)
+    active = plot_manager.active_tags(tolerance=1.0)
+    assert active == {'RAMP'}, 'Only RAMP changes more than 1 ({})'.format(active)
+
+############################################################################
+# --- TEST:  large ranges use the index of the dataframe               --- #
+############################################################################
+nbig = 100000
+steps = numpy.random.randint(0,nbig,48)
+big = pandas.DataFrame(
+    { 'S{:02d}'.format(i) : numpy.where(numpy.arange(nbig) < s,0.0,1.0)
+      for i,s in enumerate(steps) },
+    index=pandas.date_range('2020-01-01',periods=nbig,freq='s'))
+big.iloc[::3,5] = numpy.nan
+proc_plot.set_dataframe(big)
+xb = plot_manager.get_time()
+changed = []
+plot_manager.active_changed.connect(lambda: changed.append(True))
+
+active = plot_manager.active_tags()
+assert active == set(big.columns), 'Columns are active until the index is built'
+while plot_manager._span_builder is not None:
+    QtCore.QCoreApplication.processEvents()
+    time.sleep(0.01)
+assert plot_manager._span_index is not None and changed == [True], \
+    'The index should be built in the background'
+for i0,i1 in [(0,nbig-1),(5,90000),(1000,1010),(40000,99999)] + \
+             [ tuple(sorted(numpy.random.randint(0,nbig,2))) for _ in range(20) ]:
+    expected = { t for t,s in zip(big.columns,steps) if i0 < s <= i1 }
+    active = plot_manager.active_tags((xb[i0],xb[i1]))
+    assert active == expected, 'Wrong active tags in {}-{}'.format(i0,i1)
+proc_plot.set_dataframe(df)
+assert plot_manager._span_index is None, 'The index is of the old data'
+
+############################################################################
+# --- TEST:  "Active only" filter of the tag list                      --- #
+############################################################################
+proc_plot.set_dataframe(df)
+proc_plot.set_active_tolerance(0)
+tools = { tool.name:tool for tool in tool_panel._tools }
+# the plot button plots the tag
+tools['CONST'].plot_button.setChecked(True)
+assert plot_manager._plotinfo[0].tagnames == ['CONST'], 'CONST should be plotted'
+
+tool_panel.active_checkbox.setChecked(True)
+proc_plot.pp._update_active_filter()
+hidden = { name for name,tool in tools.items() if tool.isHidden() }
+assert hidden == set(), 'CONST is plotted and should be shown ({})'.format(hidden)
+
+tools['CONST'].plot_button.setChecked(False)
+tools['RAMP'].plot_button.setChecked(True)
+pi = plot_manager._plotinfo[-1]
+plot_manager.backend.set_xlim(pi.ax,x[0],x[500])
+proc_plot.pp._update_active_filter()
+hidden = { name for name,tool in tools.items() if tool.isHidden() }
+assert hidden == {'CONST','STEP'}, \
+    'Tags that are constant in the range should be hidden ({})'.format(hidden)
+
+proc_plot.set_active_tolerance(0.1)
+hidden = { name for name,tool in tools.items() if tool.isHidden() }
+assert hidden == {'CONST','STEP','NOISE'}, \
+    'Tags within the tolerance should be hidden ({})'.format(hidden)
+
+tool_panel.active_checkbox.setChecked(False)
+proc_plot.pp._update_active_filter()
+hidden = { name for name,tool in tools.items() if tool.isHidden() }
+assert hidden == set(), 'All tags should be shown without the filter'
+proc_plot.set_active_tolerance(0)
+
+print("All tests passed")
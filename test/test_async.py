@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import calc
+
+import asyncio
+import numpy
+import pandas
+from PyQt5 import QtCore
+
+pp = proc_plot.pp
+plot_manager = pp.plot_manager
+
+n = 100000
+df = pandas.DataFrame(index=pandas.date_range('2020-01-01',periods=n,freq='s'))
+df['A'] = numpy.sin(numpy.arange(n)/1000)
+df['B'] = numpy.arange(n,dtype=float)
+
+async def main():
+    ########################################################################
+    # --- TEST:  load without blocking the event loop                  --- #
+    ########################################################################
+    # in the order of the README: the window is shown before the data is set
+    proc_plot.show(block=False)
+    assert pp.main_window.isVisible(), 'Window should be shown without data'
+    assert pp._pump_task is not None, 'Qt events should be processed'
+
+    ticks = []
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.001)
+    task = asyncio.get_running_loop().create_task(ticker())
+
+    await proc_plot.set_dataframe_async(df)
+    assert not plot_manager.is_loading(), 'Should be loaded'
+    assert sorted(plot_manager._taginfo) == ['A','B'], 'Tags should be loaded'
+    assert len(pp.tool_panel._tools) == 2, 'Tag list should be filled'
+    assert ticks, 'Event loop should run while loading'
+    task.cancel()
+
+    ########################################################################
+    # --- TEST:  show(block=False) keeps the window responsive          --- #
+    ########################################################################
+    proc_plot.show(block=False)
+    assert pp.main_window.isVisible(), 'Window should be shown'
+    assert pp._pump_task is not None, 'Qt events should be processed'
+
+    fired = []
+    QtCore.QTimer.singleShot(0,lambda: fired.append(True))
+    await asyncio.sleep(0.1)
+    assert fired, 'Qt events should be processed while awaiting'
+
+    ########################################################################
+    # --- TEST:  awaitable search and calculations                     --- #
+    ########################################################################
+    start,end = await proc_plot.find_condition_async('A > 0.5')
+    s,e = plot_manager.find_condition('A > 0.5')
+    assert numpy.array_equal(start,s) and numpy.array_equal(end,e), \
+        'Async search should find the same intervals'
+    assert len(start) > 0
+
+    idx = await proc_plot.run_in_thread(calc.minmax_decimate,df['A'].to_numpy(),100)
+    assert numpy.array_equal(idx,calc.minmax_decimate(df['A'].to_numpy(),100))
+
+    ########################################################################
+    # --- TEST:  closing the window stops processing events            --- #
+    ########################################################################
+    pp.main_window.close()
+    await asyncio.sleep(0.1)
+    assert pp._pump_task is None, 'Pump should stop when the window closes'
+
+asyncio.run(main())
+
+print("All tests passed")
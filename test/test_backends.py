@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+
+import warnings
+import numpy
+import pandas
+import matplotlib
+
+plot_manager = proc_plot.pp.plot_manager
+
+index = pandas.date_range('2020-01-01',periods=1000,freq='s')
+df = pandas.DataFrame({'A.PV':numpy.sin(numpy.arange(1000)/50),
+                       'B.PV':numpy.arange(1000.0)},index=index)
+proc_plot.set_dataframe(df)
+
+############################################################################
+# --- TEST:  the cursor doesn't use deprecated arguments               --- #
+############################################################################
+with warnings.catch_warnings():
+    warnings.simplefilter('error',matplotlib.MatplotlibDeprecationWarning)
+    plot_manager.add_plot('A.PV')
+    plot_manager.add_plot('B.PV')
+assert plot_manager.backend.cur is not None, 'The cursor should be set'
+
+############################################################################
+# --- TEST:  switching to pyqtgraph and back                           --- #
+############################################################################
+try:
+    import pyqtgraph
+except ImportError:
+    print('pyqtgraph is not installed, skipped the pyqtgraph tests')
+    print("All tests passed")
+    sys.exit(0)
+
+layout = proc_plot.pp.plot_layout
+old_widget = plot_manager.plot_window
+proc_plot.set_render_backend('pyqtgraph')
+assert plot_manager.backend.name == 'pyqtgraph', 'Backend should be pyqtgraph'
+assert plot_manager.backend.decimates, 'pyqtgraph decimates the lines itself'
+assert len(plot_manager._plotinfo) == 0, 'Plots should be cleared'
+assert layout.indexOf(plot_manager.plot_window) >= 0, 'New widget should be shown'
+assert layout.indexOf(old_widget) < 0, 'Old widget should be removed'
+
+plot_manager.add_plot('A.PV')
+pi = plot_manager._plotinfo[0]
+assert pi.tagnames == ['A.PV'], 'A.PV should be plotted'
+x = plot_manager.get_time()
+plot_manager.backend.set_xlim(pi.ax,x[100],x[200])
+xlim = plot_manager.backend.get_xlim(pi.ax)
+assert numpy.allclose(xlim,(x[100],x[200]),rtol=0,atol=1e-6), 'Wrong xlim'
+
+proc_plot.set_render_backend('pyqtgraph')
+assert len(plot_manager._plotinfo) == 1, 'Same backend should not clear the plots'
+
+tools = { tool.name:tool for tool in proc_plot.pp.tool_panel._tools }
+tools['B.PV'].plot_button.setChecked(True)
+assert [ pi.tagnames for pi in plot_manager._plotinfo ] == [['A.PV'],['B.PV']], \
+    'B.PV should be plotted from its button'
+
+proc_plot.set_render_backend('matplotlib')
+assert plot_manager.backend.name == 'matplotlib', 'Backend should be matplotlib'
+assert layout.indexOf(plot_manager.plot_window) >= 0, 'New widget should be shown'
+assert not tools['B.PV'].plot_button.isChecked(), 'Buttons should be reset'
+tools['B.PV'].plot_button.setChecked(True)
+assert [ pi.tagnames for pi in plot_manager._plotinfo ] == [['B.PV']], \
+    'One click should plot B.PV'
+
+try:
+    proc_plot.set_render_backend('vispy')
+    assert False, 'Unknown backend should raise'
+except ValueError:
+    pass
+
+print("All tests passed")
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+
+import time
+import numpy
+import pandas
+from PyQt5 import QtCore
+
+plot_manager = proc_plot.pp.plot_manager
+tool_panel = proc_plot.pp.tool_panel
+
+index = pandas.date_range('2020-01-01',periods=1000,freq='s')
+df = pandas.DataFrame(numpy.random.randn(1000,2000),index=index,
+                      columns=[ 'T{}.PV'.format(i) for i in range(2000) ])
+df['TEXT'] = 'not plottable'
+
+def wait(loader):
+    # done can be emitted before a slot is connected to it, but is_loading
+    # is only cleared when done is delivered to this thread
+    while plot_manager.is_loading():
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.01)
+    QtCore.QCoreApplication.processEvents()
+
+############################################################################
+# --- TEST:  background loading fills the tag list                     --- #
+############################################################################
+proc_plot.define_tag('T0.ERR','T0.PV - T1.PV')
+loader = proc_plot.set_dataframe(df,background=True)
+assert plot_manager.is_loading(), 'Should be loading'
+wait(loader)
+assert not plot_manager.is_loading(), 'Should be done'
+assert len(plot_manager._taginfo) == 2001, 'All numeric tags and T0.ERR'
+assert len(tool_panel._tools) == 2001, 'Every tag should have a tool'
+assert 'TEXT' not in plot_manager._taginfo, 'TEXT is not plottable'
+assert numpy.allclose(plot_manager.get_xy('T0.ERR')[1],df['T0.PV']-df['T1.PV']), \
+    'Derived tag is wrong'
+
+############################################################################
+# --- TEST:  cancel keeps the tags that are loaded                     --- #
+############################################################################
+# 20 chunks of 500 tags, cancelled when the first chunk is in the tag list
+df = pandas.DataFrame(numpy.random.randn(500,10000),index=index[:500],
+                      columns=[ 'T{}.PV'.format(i) for i in range(10000) ])
+chunks = []
+def cancel_after_first_chunk(tags):
+    chunks.append(len(tags))
+    tool_panel.cancel_clicked()
+plot_manager.tags_added.connect(cancel_after_first_chunk)
+loader = proc_plot.set_dataframe(df,sparse=True,background=True)
+wait(loader)
+plot_manager.tags_added.disconnect(cancel_after_first_chunk)
+assert not plot_manager.is_loading(), 'Should be done'
+assert chunks and chunks[0] == 500, 'The first chunk should be loaded'
+assert 0 < len(plot_manager._taginfo) < 10001, 'Loading should be cancelled'
+assert len(tool_panel._tools) == len(plot_manager._taginfo), \
+    'Tools of loaded tags only'
+assert not tool_panel.progress_bar.isVisible(), 'Progress should be hidden'
+
+print("All tests passed")
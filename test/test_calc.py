@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+from proc_plot import calc
+
+import numpy
+import pandas
+
+numpy.random.seed(0)
+y = numpy.random.randn(1003)
+y[[5,6,7,100]] = numpy.nan
+y[200:220] = numpy.nan
+s = pandas.Series(y)
+
+############################################################################
+# --- TEST:  rolling statistics are the same as pandas rolling         --- #
+############################################################################
+for n in [1,3,10,17]:
+    r = s.rolling(n,min_periods=1)
+    assert numpy.allclose(calc.rolling_mean(y,n),r.mean(),equal_nan=True), \
+        'rolling_mean({}) is wrong'.format(n)
+    assert numpy.allclose(calc.rolling_min(y,n),r.min(),equal_nan=True), \
+        'rolling_min({}) is wrong'.format(n)
+    assert numpy.allclose(calc.rolling_max(y,n),r.max(),equal_nan=True), \
+        'rolling_max({}) is wrong'.format(n)
+    mean,std = calc.rolling_std(y,n)
+    assert numpy.allclose(std,r.std(ddof=0),equal_nan=True,atol=1e-6), \
+        'rolling_std({}) is wrong'.format(n)
+
+x = numpy.arange(10)*10.0
+assert calc.window_samples('5min',x,1.0) == 30, 'Wrong window for 5min'
+assert calc.window_samples(7,x,1.0) == 7, 'Wrong window for 7 samples'
+
+############################################################################
+# --- TEST:  decimation keeps the envelope                             --- #
+############################################################################
+idx = calc.minmax_decimate(y,50)
+assert len(idx) <= 102, 'Too many points after decimation'
+assert numpy.nanmax(y[idx]) == numpy.nanmax(y), 'Maximum was lost'
+assert numpy.nanmin(y[idx]) == numpy.nanmin(y), 'Minimum was lost'
+assert idx[0] == 0 and idx[-1] == len(y)-1, 'End points were lost'
+
+############################################################################
+# --- TEST:  range index statistics of random ranges                   --- #
+############################################################################
+x = numpy.arange(len(y),dtype=float)
+index = calc.RangeIndex(x,y)
+for _ in range(200):
+    i0 = numpy.random.randint(0,len(y)-1)
+    i1 = numpy.random.randint(i0+1,len(y)+1)
+    seg = y[i0:i1]
+    stats = index.stats(i0,i1)
+    if numpy.isnan(seg).all():
+        assert numpy.isnan(stats['min']), 'min of NaNs should be NaN'
+        continue
+    assert stats['min'] == numpy.nanmin(seg), 'min is wrong'
+    assert stats['max'] == numpy.nanmax(seg), 'max is wrong'
+    assert numpy.isclose(stats['mean'],numpy.nanmean(seg)), 'mean is wrong'
+    assert numpy.isclose(stats['std'],numpy.nanstd(seg),atol=1e-6), \
+        'std is wrong'
+
+assert index.window_stats(10,19)['count'] == 10, 'Wrong window'
+
+# corners of straight lines: the mean and std are weighted by time
+xc = numpy.array([0.0,10.0,40.0,50.0])
+yc = numpy.array([0.0,10.0,10.0,-2.0])
+xf = numpy.linspace(0,50,500001)
+yf = calc.interp(xc,yc,xf)
+assert numpy.isnan(calc.interp(xc,yc,[-1.0])[0]), 'NaN before the first sample'
+assert calc.interp(xc,yc,[60.0])[0] == -2.0, 'Last value after the last sample'
+stats = calc.RangeIndex(xc,yc,linear=True).stats(0,4)
+assert numpy.isclose(stats['mean'],yf.mean(),atol=1e-4), 'Linear mean is wrong'
+assert numpy.isclose(stats['std'],yf.std(),atol=1e-4), 'Linear std is wrong'
+assert stats['max'] == 10 and stats['min'] == -2, 'Linear min/max is wrong'
+
+############################################################################
+# --- TEST:  span index of many columns                                --- #
+############################################################################
+a = numpy.random.randn(5000,7)
+a[numpy.random.rand(*a.shape) < 0.1] = numpy.nan
+a[:,3] = numpy.nan
+spans = calc.SpanIndex(len(a),7,block=64)
+spans.add(0,a[:,:4])
+spans.add(4,a[:,4:])
+spans.finish()
+with numpy.errstate(invalid='ignore'):
+    for _ in range(200):
+        i0 = numpy.random.randint(0,len(a)-1)
+        i1 = numpy.random.randint(i0+1,len(a)+1)
+        expected = numpy.fmax.reduce(a[i0:i1]) - numpy.fmin.reduce(a[i0:i1])
+        assert numpy.array_equal(spans.spans(i0,i1,lambda r0,r1: a[r0:r1]),
+                                 expected,equal_nan=True), 'span is wrong'
+
+############################################################################
+# --- TEST:  cross-correlation is the same as numpy.correlate          --- #
+############################################################################
+a = numpy.random.randn(500)
+b = numpy.roll(a,7) + 0.1*numpy.random.randn(500)
+lags,corr = calc.xcorr(a,b)
+da = a - a.mean()
+db = b - b.mean()
+expected = numpy.correlate(db,da,'full') / numpy.sqrt(da.dot(da)*db.dot(db))
+assert numpy.array_equal(lags,numpy.arange(-499,500)), 'Wrong lags'
+assert numpy.allclose(corr,expected), 'xcorr is wrong'
+assert lags[numpy.argmax(corr)] == 7, 'Peak should be at the delay of b'
+
+lags,corr = calc.xcorr(a,b,maxlag=10)
+assert len(lags) == 21 and numpy.allclose(corr,expected[489:510]), \
+    'xcorr with maxlag is wrong'
+
+############################################################################
+# --- TEST:  runs of True                                              --- #
+############################################################################
+mask = numpy.array([1,1,0,0,1,0,1,1,1],dtype=bool)
+starts,ends = calc.runs(mask)
+assert list(starts) == [0,4,6] and list(ends) == [2,5,9], 'runs is wrong'
+starts,ends = calc.runs(numpy.zeros(5,dtype=bool))
+assert len(starts) == 0 and len(ends) == 0, 'There should be no runs'
+
+############################################################################
+# --- TEST:  column means                                              --- #
+############################################################################
+x = numpy.array([0.0,1,2,3,4,5,6,7,8,9])
+y = numpy.array([1.0,2,numpy.nan,4,5,6,7,8,9,10])
+m = calc.column_means(x,y,numpy.array([-2.0,-1,0.5,3.5,4.5,6.5,20,30]))
+assert numpy.allclose(m,[numpy.nan,1,3,5,6.5,9,10],equal_nan=True), \
+    'Wrong column means'
+
+############################################################################
+# --- TEST:  histogram of a moving window                              --- #
+############################################################################
+v = numpy.random.randn(10000)
+v[::97] = numpy.nan
+edges = numpy.linspace(-5,5,51)
+bins = calc.bin_index(v,-5,5,50)
+assert bins[0] == numpy.searchsorted(edges,v[0],'right') - 1, 'Wrong bin'
+assert (bins[::97] == 50).all(), 'NaNs should not be counted'
+wc = calc.WindowCounts(bins,50)
+for i0,i1 in [(0,3000),(500,3500),(400,3300),(2000,9000),(9500,10000),(0,0)]:
+    expected,_ = numpy.histogram(v[i0:i1],edges)
+    assert numpy.array_equal(wc.set_window(i0,i1),expected), \
+        'Wrong counts for {}:{}'.format(i0,i1)
+
+############################################################################
+# --- TEST:  swinging door and deadband compression                    --- #
+############################################################################
+# an interpolated export of a random walk
+xr = numpy.sort(numpy.random.uniform(0,1e5,200))
+yr = numpy.cumsum(numpy.random.randn(200))
+x = numpy.arange(0,1e5,5.0)
+y = numpy.interp(x,xr,yr)
+for method in ['swinging_door','deadband']:
+    tol = 0.05
+    idx,err = calc.compress(x,y,tol,method)
+    assert idx[0] == 0 and idx[-1] == len(x)-1, 'First and last should be kept'
+    line = numpy.interp(x,x[idx],y[idx])
+    assert numpy.isclose(err,numpy.abs(line - y).max()), 'Wrong max error'
+    bound = tol if method == 'swinging_door' else 2*tol
+    assert err <= bound*(1+1e-9), '{} error is too large'.format(method)
+idx,err = calc.compress(x,y,0.05)
+assert len(x)/len(idx) > 20, 'Interpolated data should compress well'
+
+# a step is kept with the sample before it
+idx = calc.deadband(numpy.array([0,0,0,0,5,5,5.0]),0.5)
+assert list(idx) == [0,3,4,6], 'Wrong deadband samples'
+# noise doesn't compress, all samples are kept
+noise = numpy.random.randn(5000)
+assert len(calc.swinging_door(numpy.arange(5000.0),noise,0.01)) == 5000, \
+    'Noise should not be compressed'
+
+print("All tests passed")
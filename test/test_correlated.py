@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import calc
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+tool_panel = proc_plot.pp.tool_panel
+
+############################################################################
+# --- TEST:  correlation of many columns at many lags                  --- #
+############################################################################
+numpy.random.seed(0)
+n = 1000
+ref = calc.standardize(numpy.cumsum(numpy.random.randn(n))[:,None])[:,0]
+z = numpy.random.randn(n,4)
+z[:,1] = ref
+z[5:,2] = -ref[:-5]
+z = calc.standardize(z)
+corr,lag = calc.lagged_correlation(z,ref,10)
+assert numpy.isclose(corr[1],1) and lag[1] == 0, 'Same as ref'
+assert corr[2] < -0.99 and lag[2] == 5, 'Inverted and 5 samples later'
+assert abs(corr[0]) < 0.2 and abs(corr[3]) < 0.2, 'Noise should not correlate'
+
+v = numpy.random.randn(100,3)
+v[7,0] = numpy.nan
+bounds = numpy.array([0,10,10,50,100])
+m = calc.bin_means(v,bounds)
+assert numpy.isnan(m[1]).all(), 'Empty bin should be NaN'
+assert numpy.allclose(m[0],numpy.nanmean(v[:10],axis=0)), 'Wrong bin means'
+assert numpy.allclose(m[3],v[50:].mean(axis=0)), 'Wrong bin means'
+
+############################################################################
+# --- TEST:  rank tags of a dataframe and of sparse data               --- #
+############################################################################
+index = pandas.date_range('2020-01-01',periods=5000,freq='s')
+base = numpy.cumsum(numpy.random.randn(5000))
+data = { 'N{}'.format(i) : numpy.random.randn(5000) for i in range(200) }
+data['REF'] = base
+data['SAME'] = base*2 + 1
+data['LATER'] = numpy.concatenate((numpy.full(60,base[0]),base[:-60]))
+df = pandas.DataFrame(data,index=index)
+
+for sparse in [False,True]:
+    proc_plot.set_dataframe(df,sparse=sparse)
+    ranking = proc_plot.find_correlated('REF',maxlag='2min',top=5,show=False)
+    assert list(ranking.index[:2]) == ['SAME','LATER'], 'Wrong ranking'
+    assert numpy.isclose(ranking['corr'].iloc[0],1), 'SAME should correlate'
+    assert abs(ranking.loc['LATER','lag'] - 60) < 5, 'LATER is a minute later'
+    assert ranking.loc['SAME','lag'] == 0
+    assert len(ranking) == 5 and ranking['corr'].iloc[2] < 0.2
+
+# the ranked tags are shown first in the tag list
+proc_plot.find_correlated('REF',maxlag=120,top=3)
+shown = tool_panel.shown_tags()
+assert shown[:2] == ['SAME','LATER'] and len(shown) == 3, 'Only ranked tags'
+assert tool_panel.show_all_button.isVisibleTo(tool_panel), 'Show all button'
+tool_panel.set_ranked_tags(None)
+assert tool_panel.shown_tags() == list(plot_manager._taginfo), 'Original order'
+
+print("All tests passed")
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+
+n = 200000
+numpy.random.seed(0)
+df = pandas.DataFrame(index=pandas.date_range('2020-01-01',periods=n,freq='s'))
+df['V.OP'] = numpy.random.uniform(0,100,n)
+df['V.FLOW'] = numpy.sqrt(df['V.OP']) + 0.1*numpy.random.randn(n)
+df.iloc[::1000,1] = numpy.nan
+proc_plot.set_dataframe(df)
+
+############################################################################
+# --- TEST:  histogram follows the visible range                       --- #
+############################################################################
+plot_manager.add_remove_plot('V.OP',True)
+x = plot_manager.get_time()
+plot_manager.backend.set_xlim(plot_manager._plotinfo[0].ax,x[0],x[n//2-1])
+window = proc_plot.show_histogram('V.OP',bins=10)
+heights = window.artist.get_data().values
+expected,_ = numpy.histogram(df['V.OP'].iloc[:n//2],window.edges[0])
+assert numpy.array_equal(heights,expected), 'Wrong histogram of the visible range'
+
+plot_manager.xlim_changed.emit(x[1000],x[n-1])
+heights = window.artist.get_data().values
+expected,_ = numpy.histogram(df['V.OP'].iloc[1000:],window.edges[0])
+assert numpy.array_equal(heights,expected), 'Histogram should follow the xlim'
+
+############################################################################
+# --- TEST:  XY density                                                --- #
+############################################################################
+window = proc_plot.show_density('V.OP','V.FLOW',bins=50)
+plot_manager.xlim_changed.emit(x[1000],x[n-1])
+image = window.artist.get_array()
+ex,ey = window.edges
+expected,_,_ = numpy.histogram2d(df['V.OP'].iloc[1000:],df['V.FLOW'].iloc[1000:],[ex,ey])
+assert numpy.array_equal(image.filled(0),expected.T), 'Wrong density image'
+assert image.sum() == (n - 1000) - (n - 1000)//1000, 'NaNs should not be counted'
+
+plot_manager.xlim_changed.emit(x[0],x[10])
+image = window.artist.get_array()
+assert image.sum() == 10, 'Only the visible samples should be counted'
+assert len(plot_manager._analysis_windows) == 2, 'Windows should be kept'
+
+print("All tests passed")
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot.events import EventIndex
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+
+############################################################################
+# --- TEST:  events in a range                                         --- #
+############################################################################
+numpy.random.seed(0)
+n = 100000
+start = numpy.random.uniform(0,1000,n)
+end = start + numpy.where(numpy.random.rand(n) < 0.1,numpy.random.exponential(5,n),numpy.nan)
+tags = numpy.random.choice(['A','B',None],n)
+events = EventIndex(start,end,numpy.arange(n),tags)
+assert (numpy.diff(events.start) >= 0).all(), 'Events should be sorted'
+e = numpy.where(numpy.isnan(end),start,end)
+for xmin,xmax in [(100,110),(0,1000),(500,500.5),(-10,-5),(999,2000)]:
+    idx = events.query(xmin,xmax)
+    expected = numpy.sort(start[(start <= xmax) & (e >= xmin)])
+    assert numpy.array_equal(events.start[idx],expected), \
+        'Wrong events in {}-{}'.format(xmin,xmax)
+
+idx = events.query(100,200,tags=['A'])
+assert set(events.tag[idx]) == {'A',None}, 'Only A and events without tag'
+idx = events.query(100,200,tags=['A'],untagged=False)
+assert set(events.tag[idx]) == {'A'}, 'Only A'
+
+idx = events.query(100,200)
+x0,x1,count = events.cluster(idx,100,200,50)
+assert count.sum() == len(idx) and len(x0) <= 50, 'All events should be counted'
+
+############################################################################
+# --- TEST:  events on the plots                                       --- #
+############################################################################
+index = pandas.date_range('2020-01-01',periods=3600,freq='s')
+df = pandas.DataFrame({'FIC101.PV':numpy.sin(numpy.arange(3600)/100),
+                       'FIC101.SP':numpy.zeros(3600),
+                       'TI200':numpy.ones(3600)},index=index)
+proc_plot.set_dataframe(df)
+journal = pandas.DataFrame({
+    'time' : index[[10,100,200,300]],
+    'end' : [index[50],pandas.NaT,pandas.NaT,pandas.NaT],
+    'text' : ['PV HI','SP changed','TI bad','Shift change'],
+    'tag' : ['FIC101.PV','FIC101.SP','TI200',None],
+})
+proc_plot.set_events(journal,end='end',tag='tag')
+plot_manager.add_remove_plot('FIC101.PV',True)
+plot_manager.add_remove_plot('TI200',True)
+pi_fic, pi_ti = plot_manager._plotinfo
+x0,x1,labels = pi_fic.event_marks
+# the SP is in the PV's group
+assert len(x0) == 3, 'FIC101 axes should show its events and the untagged one'
+lines,spans = pi_fic.events
+assert len(lines.get_segments()) == 2 and len(spans.get_paths()) == 1, \
+    'One span and two lines'
+assert len(pi_ti.event_marks[0]) == 2, 'TI200 axes shows its event and the untagged one'
+
+label = plot_manager._events.label(labels[0],plot_manager.format_time)
+assert label == '2020-01-01 00:00:10 - 2020-01-01 00:00:50 FIC101.PV: PV HI', label
+
+proc_plot.set_event_filter(groupids=['FIC101'])
+assert len(pi_fic.event_marks[0]) == 2 and len(pi_ti.event_marks[0]) == 0, \
+    'Filter should hide the other events'
+proc_plot.set_event_filter()
+
+# too many events are counted in columns
+many = pandas.DataFrame({'time':index[numpy.arange(0,3600,2)],'text':'x'})
+proc_plot.set_events(many)
+x0,x1,labels = pi_fic.event_marks
+assert len(x0) <= plot_manager.max_events//2 and labels[0].endswith(' events'), \
+    'Events should be clustered'
+x = plot_manager.get_time()
+plot_manager.backend.set_xlim(pi_fic.ax,x[0],x[100])
+plot_manager._xlim_settled()
+assert len(pi_fic.event_marks[0]) == 51, 'Events of the zoomed range'
+
+proc_plot.set_events(None)
+assert pi_fic.event_marks is None, 'Events should be removed'
+assert len(pi_fic.events[0].get_segments()) == 0, 'Lines should be removed'
+
+print("All tests passed")
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+
+import io
+import numpy
+import pandas
+from PyQt5 import QtCore, QtWidgets
+
+plot_manager = proc_plot.pp.plot_manager
+tool_panel = proc_plot.pp.tool_panel
+
+n = 10000
+numpy.random.seed(0)
+data = { 'T{:03d}'.format(i) : numpy.random.randn(n)*(i + 1) for i in range(300) }
+df = pandas.DataFrame(data,index=pandas.date_range('2020-01-01',periods=n,freq='s'))
+# one tag steps halfway
+df['T100'] = numpy.where(numpy.arange(n) < n//2,0.0,1000.0)
+df['EMPTY'] = numpy.nan
+proc_plot.set_dataframe(df)
+
+############################################################################
+# --- TEST:  rows scaled per tag                                       --- #
+############################################################################
+x = plot_manager.get_time()
+edges,image = plot_manager.heatmap(['T100','T005','EMPTY'],(x[0],x[-1]),100)
+assert image.shape == (3,100) and len(edges) == 101, 'Wrong shape'
+assert (image[0,:49] == 0).all() and (image[0,51:] == 1).all(), \
+    'Step should go from 0 to 1'
+assert numpy.nanmin(image[1]) == 0 and numpy.nanmax(image[1]) == 1, \
+    'Rows should be scaled to 0..1'
+assert numpy.isnan(image[2]).all(), 'A tag without values should be NaN'
+
+############################################################################
+# --- TEST:  window shows the tags in the list, clicking plots a row  --- #
+############################################################################
+tool_panel.filter_textbox.setText('T1')
+tags = tool_panel.shown_tags()
+assert len(tags) == 100 and 'T100' in tags, 'Filter should select the tags'
+window = proc_plot.show_heatmap()
+assert window.image.get_array().shape[0] == len(tags), 'A row per tag'
+assert window.tags.index('T100') == 0
+
+class Event():
+    inaxes = window.ax
+    ydata = 0.2
+window._clicked(Event())
+plotted = [ t for pi in plot_manager._plotinfo for t in pi.tagnames ]
+assert plotted == ['T100'], 'Clicking a row should plot the tag'
+
+# the heatmap follows the plots
+plot_manager.xlim_changed.emit(x[0],x[n//4])
+assert numpy.allclose(window.ax.get_xlim(),(x[0],x[n//4])), \
+    'Heatmap should follow the xlim'
+row = numpy.ma.filled(window.image.get_array()[0],numpy.nan)
+assert (row == 0.5).all(), \
+    'T100 is constant in the first quarter'
+
+############################################################################
+# --- TEST:  new data closes the window                                --- #
+############################################################################
+histogram = proc_plot.show_histogram('T100')
+proc_plot.set_dataframe(df[['T005','EMPTY']].rename(columns={'T005':'A'}))
+assert not window.isVisible() and not histogram.isVisible(), \
+    'Windows of the old data should be closed'
+stderr = sys.stderr
+sys.stderr = io.StringIO()
+try:
+    plot_manager.xlim_changed.emit(x[0],x[n//2])
+    errors = sys.stderr.getvalue()
+finally:
+    sys.stderr = stderr
+assert errors == '', 'Closed windows should not be updated: ' + errors
+QtWidgets.QApplication.sendPostedEvents(None,QtCore.QEvent.DeferredDelete)
+assert plot_manager._analysis_windows == [], 'Closed windows should be removed'
+
+print("All tests passed")
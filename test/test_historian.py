@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import historian
+
+import os
+import tempfile
+import threading
+import time
+import numpy
+import pandas
+import matplotlib.dates
+from PyQt5 import QtCore
+
+plot_manager = proc_plot.pp.plot_manager
+
+tmpdir = tempfile.mkdtemp()
+db = os.path.join(tmpdir,'standin.db')
+
+numpy.random.seed(0)
+index = pandas.date_range('2020-01-01',periods=3*24*60,freq='min')
+df = pandas.DataFrame(numpy.random.randn(len(index),30).round(3),index=index,
+                      columns=[ 'T{:02d}.PV'.format(i) for i in range(30) ])
+df.iloc[::7,3] = numpy.nan
+historian.SqliteHistorian.write(db,df)
+
+def x(t):
+    return float(matplotlib.dates.date2num(pandas.Timestamp(t)))
+
+############################################################################
+# --- TEST:  gaps of the loaded ranges                                 --- #
+############################################################################
+assert historian.missing_intervals([],0,10) == [(0,10)], 'All missing'
+assert historian.missing_intervals([(0,10)],2,5) == [], 'Nothing missing'
+assert historian.missing_intervals([(2,4),(6,8)],0,10) == \
+    [(0,2),(4,6),(8,10)], 'Wrong gaps'
+assert historian.missing_intervals([(2,4),(6,8)],3,7) == [(4,6)], 'Wrong gap'
+assert historian.missing_intervals([(0,1),(20,30)],5,10) == [(5,10)], 'Wrong gap'
+assert historian.merge_intervals([(6,8),(0,2),(1,4),(8,9)]) == [(0,4),(6,9)], \
+    'Wrong merged ranges'
+
+############################################################################
+# --- TEST:  ranges are merged in the cache                            --- #
+############################################################################
+cache = historian.RangeCache()
+cache.add([('A',0,10,numpy.arange(0,11.0),numpy.arange(0,11.0))])
+cache.add([('A',20,30,numpy.arange(20,31.0),numpy.arange(20,31.0))])
+assert cache.ranges('A') == [(0,10),(20,30)], 'Ranges should be separate'
+assert cache.missing('A',5,25) == [(10,20)], 'Only the gap is missing'
+cache.add([('A',10,20,numpy.arange(10,21.0),-numpy.arange(10,21.0))])
+assert cache.ranges('A') == [(0,30)], 'Ranges should be merged'
+xa,ya = cache.read('A',5,25)
+assert numpy.array_equal(xa,numpy.arange(5,26.0)), 'Samples should not repeat'
+assert ya[5] == -10 and ya[15] == -20, 'Samples fetched last should be kept'
+assert cache.ranges('B') == [], 'Other tags are not loaded'
+
+############################################################################
+# --- TEST:  pooled and batched fetches                                --- #
+############################################################################
+connector = historian.SqliteHistorian(db,batch_size=8,delay=0.2)
+requests = []
+fetch = connector.fetch
+def counted_fetch(conn,tags,start,end):
+    requests.append((threading.get_ident(),list(tags)))
+    return fetch(conn,tags,start,end)
+connector.fetch = counted_fetch
+
+source = historian.HistorianSource(connector,'2020-01-01 06:00','2020-01-01 12:00',
+                                   pool_size=4)
+assert source.tags == list(df.columns), 'Wrong tags'
+t0 = time.perf_counter()
+changed = source.load(source.tags)
+elapsed = time.perf_counter() - t0
+assert sorted(changed) == source.tags, 'All tags should be read'
+assert [ len(r[1]) for r in requests ] == [8,8,8,6], 'Tags should be fetched in batches'
+assert elapsed < 0.6, 'Batches should be fetched at the same time ({:.2f}s)'.format(elapsed)
+assert source.pool.opened <= 4, 'At most pool_size connections'
+
+xs,ys = source.get('T03.PV')
+expected = df['T03.PV']['2020-01-01 06:00':'2020-01-01 12:00'].dropna()
+assert numpy.allclose(xs,matplotlib.dates.date2num(expected.index)), 'Wrong time'
+assert numpy.allclose(ys,expected), 'Wrong values'
+
+# the loaded range is in the cache, reading it again doesn't fetch
+requests.clear()
+assert source.load(source.tags) == [] and requests == [], 'Nothing should be fetched'
+
+############################################################################
+# --- TEST:  only the gaps are fetched                                 --- #
+############################################################################
+fetched = []
+def range_fetch(conn,tags,start,end):
+    fetched.append((start,end))
+    return fetch(conn,tags,start,end)
+connector.fetch = range_fetch
+changed = source.fetch(['T00.PV','T01.PV'],x('2020-01-01 03:00'),x('2020-01-01 15:00'))
+assert sorted(changed) == ['T00.PV','T01.PV'], 'Both tags got new data'
+assert sorted(fetched) == [
+    (pandas.Timestamp('2020-01-01 03:00'),pandas.Timestamp('2020-01-01 06:00')),
+    (pandas.Timestamp('2020-01-01 12:00'),pandas.Timestamp('2020-01-01 15:00'))], \
+    'Only the gaps should be fetched'
+xs,ys = source.get('T00.PV')
+assert numpy.allclose(ys,df['T00.PV']['2020-01-01 03:00':'2020-01-01 15:00']), \
+    'Wrong values after the gaps were fetched'
+
+# a new source with the same cache file doesn't fetch the cached ranges
+path = os.path.join(tmpdir,'historian.cache')
+source = historian.HistorianSource(connector,'2020-01-01','2020-01-02',cache=path)
+source.load(['T05.PV'])
+fetched.clear()
+source = historian.HistorianSource(connector,'2020-01-01 12:00','2020-01-02 12:00',
+                                   cache=path)
+xs,ys = source.get('T05.PV')
+assert fetched == [(pandas.Timestamp('2020-01-02'),pandas.Timestamp('2020-01-02 12:00'))], \
+    'Only the part that is not cached should be fetched'
+assert len(xs) == 24*60 + 1, 'Wrong number of samples'
+
+# panning far away fetches only the visible range
+fetched.clear()
+source = historian.HistorianSource(connector,'2020-01-01 00:00','2020-01-01 06:00')
+source.get('T07.PV')
+fetched.clear()
+changed = source.fetch(['T07.PV'],x('2020-01-03 10:00'),x('2020-01-03 11:00'))
+assert changed == ['T07.PV'], 'T07.PV got new data'
+assert fetched == [(pandas.Timestamp('2020-01-03 10:00'),pandas.Timestamp('2020-01-03 11:00'))], \
+    'Only the visible hour should be fetched {}'.format(fetched)
+xs,ys = source.get('T07.PV')
+assert len(xs) == (6*60 + 1) + 1 + 61, 'Both ranges with a NaN between them'
+assert numpy.isnan(ys[6*60 + 1]) and numpy.isnan(ys).sum() == 1, \
+    'The gap between the ranges should be NaN'
+assert numpy.all(numpy.diff(xs) > 0), 'Time should increase'
+assert not source.is_loaded('T08.PV'), 'T08.PV has not been read'
+
+# a tag that is read the first time is only fetched for the view, every tag
+# keeps at most max_ranges ranges
+source = historian.HistorianSource(connector,'2020-01-01 00:00','2020-01-01 01:00',
+                                   max_ranges=3)
+for h in range(2,24,2):
+    source.fetch(['T07.PV'],x('2020-01-02 {:02d}:00'.format(h)),
+                 x('2020-01-02 {:02d}:30'.format(h)))
+fetched.clear()
+xs,ys = source.get('T08.PV')
+assert fetched == [(pandas.Timestamp('2020-01-02 22:00'),pandas.Timestamp('2020-01-02 22:30'))], \
+    'A new tag should be fetched for the view only {}'.format(fetched)
+assert len(xs) == 31, 'Only the view should be read'
+ranges = source._data['T07.PV'][0]
+assert len(ranges) == 3 and ranges[-1][0] == x('2020-01-02 22:00'), \
+    'The ranges closest to the view should be kept {}'.format(ranges)
+
+# reading a tag doesn't wait for a fetch of other tags
+worker = threading.Thread(target=source.fetch,
+    args=(['T09.PV'],x('2020-01-02 22:00'),x('2020-01-02 22:30')))
+worker.start()
+time.sleep(0.05)
+t0 = time.perf_counter()
+source.get('T08.PV')
+elapsed = time.perf_counter() - t0
+worker.join()
+assert elapsed < 0.1, 'get waited for the fetch ({:.2f}s)'.format(elapsed)
+
+source = historian.HistorianSource(connector,'2020-01-01 12:00','2020-01-02 12:00',
+                                   cache=path)
+df2 = source.dataframe(['T05.PV','T06.PV'])
+assert numpy.allclose(df2['T06.PV'],df['T06.PV']['2020-01-01 12:00':'2020-01-02 12:00']), \
+    'Wrong dataframe'
+
+############################################################################
+# --- TEST:  panning the plot fetches the data                         --- #
+############################################################################
+connector.fetch = fetch
+connector.delay = 0
+source = proc_plot.open_historian(connector,'2020-01-02','2020-01-02 06:00')
+plot_manager.add_plot('T00.PV')
+pi = plot_manager._plotinfo[0]
+xs,ys = plot_manager.get_xy('T00.PV')
+assert len(xs) == 6*60 + 1, 'Only the first range should be loaded'
+
+plot_manager.get_xy('T01.PV') # read, but not plotted
+
+def wait():
+    while plot_manager.is_fetching():
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.01)
+
+requests.clear()
+connector.fetch = counted_fetch
+plot_manager.backend.set_xlim(pi.ax,x('2020-01-01 22:00'),x('2020-01-02 02:00'))
+plot_manager._xlim_settled()
+assert plot_manager.is_fetching(), 'Data should be fetched on a worker thread'
+wait()
+assert [ r[1] for r in requests ] == [['T00.PV']], \
+    'Only the plotted tag should be fetched {}'.format(requests)
+assert requests[0][0] != threading.get_ident(), 'Fetched on the GUI thread'
+xs,ys = plot_manager.get_xy('T00.PV')
+assert xs[0] == x('2020-01-01 22:00') and len(xs) == 8*60 + 1, \
+    'The data left of the loaded range should be fetched'
+xlim = plot_manager.backend.get_xlim(plot_manager._plotinfo[0].ax)
+assert numpy.allclose(xlim,(x('2020-01-01 22:00'),x('2020-01-02 02:00'))), \
+    'Replotting should keep the zoom'
+assert 'T01.PV' not in plot_manager._tagdata, 'T01.PV should be read again'
+xs,ys = plot_manager.get_xy('T01.PV')
+assert len(xs) == 8*60 + 1, 'T01.PV should be read for the new range'
+
+# new data doesn't wait for a fetch
+connector.delay = 0.5
+plot_manager.backend.set_xlim(pi.ax,x('2020-01-02 04:00'),x('2020-01-02 09:00'))
+plot_manager._xlim_settled()
+assert plot_manager.is_fetching(), 'Data should be fetched'
+t0 = time.perf_counter()
+proc_plot.set_dataframe(df.iloc[:10])
+elapsed = time.perf_counter() - t0
+assert elapsed < 0.3, 'Clearing the data waited for the fetch ({:.2f}s)'.format(elapsed)
+assert not plot_manager.is_fetching(), 'The fetch should be dropped'
+while plot_manager._stopped_fetchers:
+    QtCore.QCoreApplication.processEvents()
+    time.sleep(0.01)
+source.close()
+
+print("All tests passed")
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+from proc_plot import loaders
+
+import os
+import tempfile
+import numpy
+import pandas
+import matplotlib.dates
+
+tmpdir = tempfile.mkdtemp()
+path = os.path.join(tmpdir,'export.csv')
+
+index = pandas.date_range('2020-01-01',periods=1000,freq='s',name='Time')
+df = pandas.DataFrame(numpy.random.randn(1000,3).round(3),index=index,
+                      columns=['A.PV','A.SP','B'])
+df.loc[index[5],'B'] = numpy.nan
+df.to_csv(path)
+
+############################################################################
+# --- TEST:  tags from the header, data read in chunks                 --- #
+############################################################################
+source = loaders.CsvSource(path,chunksize=77)
+assert source.tags == ['A.PV','A.SP','B'], 'Wrong tags'
+assert source.datetime, 'Index should be datetime'
+assert len(source._data) == 0, 'Nothing should be read yet'
+
+x,y = source.get('B')
+assert numpy.allclose(x,matplotlib.dates.date2num(index)), 'Wrong time'
+assert numpy.allclose(y,df['B'],equal_nan=True), 'Wrong values'
+assert list(source._data) == ['B'], 'Only B should be read'
+
+x2,y2 = source.get('A.PV')
+assert x2 is x, 'Tags should share the time axis'
+
+############################################################################
+# --- TEST:  cache                                                     --- #
+############################################################################
+assert os.path.exists(os.path.join(path + '.ppcache','col3.npy')), \
+    'B should be cached'
+source = loaders.CsvSource(path)
+x,y = source.get('B')
+assert isinstance(y,numpy.memmap), 'B should be read from the cache'
+assert numpy.allclose(y,df['B'],equal_nan=True), 'Wrong cached values'
+
+# the cache is not used when the file changes
+df['B'] += 1
+df.to_csv(path)
+os.utime(path,(0,0))
+source = loaders.CsvSource(path)
+x,y = source.get('B')
+assert not isinstance(y,numpy.memmap), 'Cache should be cleared'
+assert numpy.allclose(y,df['B'],equal_nan=True), 'Values should be new'
+
+print("All tests passed")
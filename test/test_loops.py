@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import calc
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+
+n = 20000
+t = numpy.arange(n,dtype=float)
+rng = numpy.random.default_rng(0)
+index = pandas.date_range('2020-01-01',periods=n,freq='s')
+df = pandas.DataFrame(index=index)
+
+# oscillating loop
+df['FIC101.SP'] = 0.0
+df['FIC101.PV'] = numpy.sin(t/100) + 0.2*rng.normal(size=n)
+df['FIC101.OP'] = numpy.sin(t/100 + 1)
+# quiet loop with a saturated OP
+df['TIC201.SP'] = 0.0
+df['TIC201.PV'] = 0.05*rng.normal(size=n)
+df['TIC201.OP'] = numpy.clip(10*rng.normal(size=n),-5,5)
+# sticking valve: the PV moves in steps while the OP ramps
+df['LIC301.SP'] = 0.0
+df['LIC301.PV'] = numpy.round(numpy.cumsum(rng.normal(size=n))/20)
+df['LIC301.OP'] = numpy.cumsum(rng.normal(size=n))
+# not a loop
+df['PI401.PV'] = 1.0
+
+############################################################################
+# --- TEST:  calc.loop_health                                          --- #
+############################################################################
+cols = lambda s: numpy.stack([ df[g+s].to_numpy() for g in ('FIC101','TIC201','LIC301') ])
+health = calc.loop_health(t,cols('.PV'),cols('.SP'),cols('.OP'))
+assert health['oscillation'][0] > 1, 'FIC101 oscillates'
+assert health['oscillation'][1] < 1 and health['oscillation'][2] < 1, \
+    'TIC201 and LIC301 do not oscillate'
+assert health['saturation'][1] > 0.5, 'TIC201 OP is mostly at a limit'
+assert health['stiction'][2] > 0.5 and health['stiction'][0] < 0.5, \
+    'LIC301 valve sticks'
+assert numpy.isclose(health['iae'][1],numpy.abs(df['TIC201.PV'].to_numpy()[:-1]).sum()), \
+    'Wrong IAE'
+
+h = calc.loop_health(t,cols('.PV'))
+assert numpy.isnan(h['stiction']).all() and numpy.isnan(h['iae']).all(), \
+    'Indicators without SP or OP should be NaN'
+
+############################################################################
+# --- TEST:  find loops and scan them                                  --- #
+############################################################################
+proc_plot.set_dataframe(df)
+loops = plot_manager.find_loops()
+assert sorted(loops) == ['FIC101','LIC301','TIC201'], 'Wrong loops {}'.format(loops)
+assert loops['FIC101'] == {'pv':'FIC101.PV','sp':'FIC101.SP','op':'FIC101.OP'}, \
+    'OP should be found by name'
+
+result = proc_plot.loop_health(show=False)
+assert list(result.index) == ['FIC101','LIC301','TIC201'], 'Wrong index'
+for i,gid in enumerate(['FIC101','TIC201','LIC301']):
+    for k in health:
+        assert numpy.isclose(result.loc[gid,k],health[k][i]), \
+            'Wrong {} of {}'.format(k,gid)
+
+# sparse data is held at the union of the sample times
+proc_plot.set_dataframe(df,sparse=True)
+result = plot_manager.loop_health(workers=2)
+assert numpy.isclose(result.loc['FIC101','oscillation'],health['oscillation'][0])
+
+############################################################################
+# --- TEST:  clicking a loop plots it                                  --- #
+############################################################################
+window = proc_plot.pp.LoopHealthWindow(result)
+row = [ window.table.item(i,0).text() for i in range(3) ].index('TIC201')
+window.loop_clicked.connect(proc_plot.pp._open_loop)
+window.cell_clicked(row,0)
+assert [ pi.tagnames for pi in plot_manager._plotinfo ] == \
+    [['TIC201.PV','TIC201.SP'],['TIC201.OP']], 'Loop should be plotted'
+
+############################################################################
+# --- TEST:  KPIs of many windows                                      --- #
+############################################################################
+df['FIC101.MODE'] = numpy.where(t < n/2,1.0,0.0)
+df['CV1.READVALUE'] = numpy.linspace(0,10,n)
+df['CV1.HIGHLIMIT'] = 8.0
+df['CV1.LOWLIMIT'] = 1.0
+proc_plot.add_grouping_rule(r'(.*)\.READVALUE$')
+proc_plot.set_dataframe(df)
+loops = plot_manager.find_loops()
+assert loops['CV1'] == {'pv':'CV1.READVALUE','hi':'CV1.HIGHLIMIT','lo':'CV1.LOWLIMIT'}, \
+    'Wrong ProfCon roles {}'.format(loops['CV1'])
+assert loops['FIC101']['mode'] == 'FIC101.MODE', 'Mode should be found by name'
+
+kpis = proc_plot.loop_kpis('h')
+assert len(kpis) == 4*6, 'Expected 6 hourly windows per loop'
+day = [(index[0],index[-1]+pandas.Timedelta(seconds=1))]
+whole = proc_plot.loop_kpis(day)
+fic = whole.loc['FIC101'].iloc[0]
+assert numpy.isclose(fic['mae'],numpy.abs(df['FIC101.PV'])[:-1].mean()), 'Wrong mae'
+assert numpy.isclose(fic['pct_auto'],50,atol=0.01), 'Wrong % auto'
+cv = whole.loc['CV1'].iloc[0]
+assert numpy.isclose(cv['pct_at_limit'],30,atol=0.01), 'Wrong % at limit'
+assert numpy.isnan(cv['mae']), 'CV1 has no SP'
+
+# hourly windows add up to the whole range
+hourly = kpis.loc['CV1','pct_at_limit']
+w = numpy.array([ (e - s).total_seconds() for s,e in hourly.index ])
+w[-1] -= 2 # the last window ends 1s after the last sample
+assert numpy.isclose((hourly.to_numpy()*w).sum()/w.sum(),cv['pct_at_limit'],atol=0.01)
+
+# cached results are used
+plot_manager._kpi_index.clear()
+again = proc_plot.loop_kpis(day)
+assert again.equals(whole) and not plot_manager._kpi_index, \
+    'Cached KPIs should not build the index again'
+# changed data clears cached KPIs even without an index
+plot_manager._invalidate('FIC101.PV')
+assert not plot_manager._kpi_cache, 'Cached KPIs should be cleared'
+proc_plot.set_kpi_options(auto_modes=[0])
+fic = proc_plot.loop_kpis(day).loc['FIC101'].iloc[0]
+assert numpy.isclose(fic['pct_auto'],50,atol=0.01), 'Wrong % auto with auto_modes'
+
+print("All tests passed")
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import calc
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+strip = proc_plot.pp.overview_strip
+
+############################################################################
+# --- TEST:  envelope from the min/max pyramid                         --- #
+############################################################################
+x = numpy.arange(100000,dtype=float)
+y = numpy.sin(x/1000)
+index = calc.RangeIndex(x,y)
+xo,ymin,ymax = index.overview(max_blocks=1000)
+assert len(xo) <= 1000 and len(xo) == len(ymin) == len(ymax), 'Too many blocks'
+size = int(xo[1] - xo[0])
+assert numpy.allclose(ymin,[ y[i:i+size].min() for i in range(0,len(y),size) ]), \
+    'Wrong min of blocks'
+assert numpy.allclose(ymax,[ y[i:i+size].max() for i in range(0,len(y),size) ]), \
+    'Wrong max of blocks'
+
+############################################################################
+# --- TEST:  the strip shows the plotted tags and sets the xlim        --- #
+############################################################################
+n = 100000
+df = pandas.DataFrame(index=pandas.date_range('2020-01-01',periods=n,freq='min'))
+df['A'] = numpy.sin(numpy.arange(n)/1000)
+df['B'] = numpy.arange(n,dtype=float)
+proc_plot.set_dataframe(df)
+proc_plot.pp.main_window.show()
+
+plot_manager.add_remove_plot('A',True)
+plot_manager.add_remove_plot('B',True)
+plot_manager.home_zoom()
+assert len(strip.ax.collections) == 2, 'Strip should show every plotted tag'
+x = plot_manager.get_time()
+assert numpy.allclose(strip.ax.get_xlim(),(x[0],x[-1])), \
+    'Strip should show all the data'
+
+xmin,xmax = x[1000],x[2000]
+strip.range_selected(xmin,xmax)
+xlim = plot_manager.backend.get_xlim(plot_manager._plotinfo[0].ax)
+assert numpy.allclose(xlim,(xmin,xmax)), 'Selecting a range should zoom'
+plot_manager._xlim_timer.stop()
+plot_manager._xlim_settled()
+assert numpy.allclose(strip.selector.extents,(xmin,xmax)), \
+    'Strip should show the visible range'
+
+line,lx,ly = plot_manager._plotinfo[0].lines[0]
+shown = plot_manager.backend.get_line_data(line)[0] \
+    if hasattr(plot_manager.backend,'get_line_data') else line.get_xdata()
+assert len(shown) <= plot_manager.max_points + 2, 'Lines should be decimated'
+assert ((shown >= xmin) & (shown <= xmax)).sum() == 1001, \
+    'The range should be drawn with all its samples'
+
+plot_manager.clear_all_plots()
+assert len(strip.ax.collections) == 0, 'Strip should be empty'
+
+print("All tests passed")
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import remote
+
+import numpy
+import pandas
+from multiprocessing import shared_memory
+
+if __name__ == '__main__':
+    index = pandas.date_range('2020-01-01',periods=1000,freq='min')
+    df = pandas.DataFrame(index=index)
+    df['FIC101.PV'] = numpy.sin(numpy.arange(1000)/50)
+    df['FIC101.SP'] = 0.5
+    df['FIC101.OP'] = numpy.arange(1000,dtype=float)
+    df['NAME'] = 'text'
+
+    ########################################################################
+    # --- TEST:  commands are done by the viewer                       --- #
+    ########################################################################
+    viewer = proc_plot.show_remote(df)
+    assert viewer.tags == ['FIC101.PV','FIC101.SP','FIC101.OP'], \
+        'Only numeric tags should be shared'
+    viewer.plot_tags(['FIC101.PV','FIC101.SP','FIC101.OP'])
+    viewer.set_xlim('2020-01-01 02:00','2020-01-01 04:00')
+    state = viewer.state(timeout=60)
+    assert state['plots'] == [['FIC101.PV','FIC101.SP'],['FIC101.OP']], \
+        'PV and SP should be grouped: {}'.format(state['plots'])
+    xlim = [ pandas.Timestamp(index[0]) + pandas.Timedelta(hours=h) for h in (2,4) ]
+    assert numpy.allclose(state['xlim'],
+                          proc_plot.pp.matplotlib.dates.date2num(xlim)), \
+        'Wrong xlim {}'.format(state['xlim'])
+
+    ########################################################################
+    # --- TEST:  grouping rules regroup the plotted tags               --- #
+    ########################################################################
+    viewer.add_grouping_rule(r'(.*)\.OP$',color='C2')
+    state = viewer.state()
+    assert state['plots'] == [['FIC101.PV','FIC101.SP','FIC101.OP']], \
+        'OP should be grouped with PV and SP: {}'.format(state['plots'])
+
+    ########################################################################
+    # --- TEST:  shared memory is freed                                --- #
+    ########################################################################
+    names = [ shm.name for shm in viewer._blocks ]
+    viewer.close()
+    assert not viewer.is_alive(), 'Viewer should be closed'
+    for name in names:
+        try:
+            shared_memory.SharedMemory(name)
+            assert False, 'Shared memory should be unlinked'
+        except FileNotFoundError:
+            pass
+
+    print("All tests passed")
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import calc
+
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+
+index = pandas.date_range('2020-01-01',periods=3600,freq='s')
+df = pandas.DataFrame(index=index)
+df['FAST'] = numpy.arange(3600,dtype=float)
+df['SLOW'] = numpy.nan
+df.loc[index[::600],'SLOW'] = numpy.arange(6,dtype=float)
+
+############################################################################
+# --- TEST:  hold                                                      --- #
+############################################################################
+x = numpy.array([1.0,2.0,4.0])
+y = numpy.array([10.0,20.0,40.0])
+h = calc.hold(x,y,[0.5,1.0,3.0,5.0])
+assert numpy.allclose(h,[numpy.nan,10,20,40],equal_nan=True), 'hold is wrong'
+
+############################################################################
+# --- TEST:  wide dataframe stored sparse                              --- #
+############################################################################
+proc_plot.set_dataframe(df,sparse=True)
+x,y = plot_manager.get_xy('SLOW')
+assert len(x) == 6 and len(y) == 6, 'NaNs should be dropped'
+assert numpy.array_equal(y,numpy.arange(6)), 'Wrong values'
+x,y = plot_manager.get_xy('FAST')
+assert len(x) == 3600, 'FAST should keep all samples'
+assert plot_manager._df is None, 'Dataframe should not be kept'
+
+s = plot_manager.get_data('SLOW')
+assert (s.index == index[::600]).all(), 'Wrong index of get_data'
+
+############################################################################
+# --- TEST:  derived tags hold the last value of sparse inputs         --- #
+############################################################################
+proc_plot.define_tag('SUM','FAST + SLOW')
+x,y = plot_manager.get_xy('SUM')
+assert len(x) == 3600, 'SUM should be evaluated at every sample'
+expected = df['FAST'] + df['SLOW'].ffill()
+assert numpy.allclose(y,expected), 'SUM is wrong'
+
+############################################################################
+# --- TEST:  dict of series with different sample times                --- #
+############################################################################
+data = {
+    'A' : pandas.Series([1.0,2.0,3.0],index=index[[0,10,20]]),
+    'B' : pandas.Series([5.0,6.0],index=index[[15,5]]), # not sorted
+}
+proc_plot.set_dataframe(data)
+x,y = plot_manager.get_xy('B')
+assert numpy.array_equal(y,[6.0,5.0]), 'Series should be sorted by time'
+x,y = plot_manager.get_xy('SUM') if 'SUM' in plot_manager._derived else (None,None)
+assert x is None, 'SUM should not be defined without FAST and SLOW'
+
+plot_manager.add_remove_plot('A',True)
+plot_manager.add_remove_plot('B',True)
+plot_manager.home_zoom()
+xlim = plot_manager.backend.get_xlim(plot_manager._plotinfo[0].ax)
+xa = plot_manager.get_xy('A')[0]
+assert numpy.isclose(xlim[0],xa[0]) and numpy.isclose(xlim[1],xa[-1]), \
+    'Home zoom should show all samples'
+values = plot_manager.cursor_values(xa[1])
+assert values == {'A':2.0,'B':6.0}, 'Wrong cursor values'
+
+############################################################################
+# --- TEST:  long format with quality                                  --- #
+############################################################################
+long = pandas.DataFrame({
+    'tag' : ['A','B','A','B','A',None],
+    'time' : index[[20,5,0,15,10,1]], # not sorted
+    'value' : [3.0,6.0,1.0,'Bad',2.0,9.0],
+    'quality' : ['Good','Good','Good','Bad','Bad','Good'],
+})
+proc_plot.set_long_dataframe(long,quality='quality',good='Good')
+assert sorted(plot_manager._taginfo) == ['A','B'], 'Wrong tags'
+x,y = plot_manager.get_xy('A')
+assert numpy.allclose(y,[1.0,numpy.nan,3.0],equal_nan=True), \
+    'A should be sorted by time with bad samples NaN'
+assert list(plot_manager.get_quality('A')) == [True,False,True], 'Wrong quality'
+x,y = plot_manager.get_xy('B')
+assert numpy.array_equal(y,[6.0]), 'Values that are not numbers should be dropped'
+assert plot_manager.get_quality('B') is None, 'All samples of B are good'
+s = plot_manager.get_data('A')
+assert (s.index == index[[0,10,20]]).all(), 'Wrong index of get_data'
+
+############################################################################
+# --- TEST:  compression                                               --- #
+############################################################################
+ramps = pandas.DataFrame(index=index)
+ramps['R.PV'] = numpy.interp(numpy.arange(3600),[0,1000,2000,3600],[0,10,5,5])
+ramps['R.SP'] = numpy.where(numpy.arange(3600) < 1800,2.0,4.0)
+ramps['N'] = numpy.random.RandomState(0).randn(3600)
+# results of the uncompressed data
+proc_plot.set_dataframe(ramps)
+proc_plot.define_tag('E','`R.SP` - `R.PV`')
+x_full = plot_manager.get_time()
+e_full = plot_manager.get_xy('E')[1]
+stats_full = { t:plot_manager.get_range_index(t).window_stats(x_full[0],x_full[-1])
+               for t in ('R.PV','R.SP','E') }
+proc_plot.add_grouping_rule(r'(.*)\.SP$',color='C1',tolerance=0.1)
+try:
+    proc_plot.set_dataframe(ramps,compress=0.01)
+finally:
+    proc_plot.remove_grouping_rules(0)
+report = proc_plot.compression_report()
+assert list(report.index) == ['R.PV','R.SP','N'], 'All tags should be compressed'
+assert report.loc['R.PV','kept'] == 4, 'A ramp needs only its corners'
+assert report.loc['R.SP','tolerance'] == 0.1, 'Tolerance should come from the rule'
+assert report.loc['R.SP','kept'] == 4, 'A step needs the samples on both sides'
+assert report.loc['N','kept'] == 3600, 'Noise should not be compressed'
+assert (report['max_error'] <= 2*report['tolerance']).all(), 'Error is too large'
+x,y = plot_manager.get_xy('R.PV')
+assert len(x) == 4 and numpy.allclose(y,[0,10,5,5]), 'Only the kept samples are stored'
+
+# compressed tags are straight lines between the samples, derived tags and
+# statistics must match the uncompressed data within the tolerance
+tol = report.loc['R.PV','max_error'] + report.loc['R.SP','max_error']
+xe,ye = plot_manager.get_xy('E')
+expected = e_full[x_full.searchsorted(xe)]
+assert numpy.abs(ye - expected).max() <= tol + 1e-9, \
+    'Derived tag of compressed tags is wrong by {}'.format(numpy.abs(ye - expected).max())
+_,values = plot_manager._common_xy(['R.PV','R.SP'])
+for t,v in zip(['R.PV','R.SP'],values):
+    assert numpy.isnan(v).sum() == 0, 'Compressed tags should have values'
+for t in ('R.PV','R.SP'):
+    s = plot_manager.get_range_index(t).window_stats(x_full[0],x_full[-1])
+    assert abs(s['mean'] - stats_full[t]['mean']) <= 2*tol, \
+        'Mean of {} is {} instead of {}'.format(t,s['mean'],stats_full[t]['mean'])
+    assert abs(s['std'] - stats_full[t]['std']) <= 2*tol, \
+        'Std of {} is {} instead of {}'.format(t,s['std'],stats_full[t]['std'])
+    assert s['max'] == stats_full[t]['max'] and s['min'] == stats_full[t]['min'], \
+        'Min and max of {} should be kept'.format(t)
+values = plot_manager.cursor_values(x_full[500],['R.PV','R.SP'])
+assert numpy.isclose(values['R.PV'],5.0) and values['R.SP'] == 2.0, \
+    'Cursor values should be interpolated {}'.format(values)
+
+# rolling windows are in samples, compressed samples are not evenly spaced
+plot_manager.add_remove_plot('R.PV',True)
+try:
+    plot_manager.get_overlay('R.PV','mean','5min')
+    assert False, 'Overlays of compressed tags should raise'
+except ValueError as e:
+    assert 'compressed' in str(e), 'Wrong message {}'.format(e)
+plot_manager.add_remove_overlay('R.PV','mean','5min')
+assert plot_manager._plotinfo[0].overlays == [], 'The overlay should not be added'
+
+proc_plot.set_dataframe(ramps,compress=True)
+assert list(plot_manager.compression_report().index) == [], \
+    'Tags without a tolerance should not be compressed'
+
+print("All tests passed")
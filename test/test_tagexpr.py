@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+from proc_plot.tagexpr import TagExpression, evaluate
+
+import numpy
+import pandas
+
+index = pandas.date_range('2021-01-01',periods=5,freq='10s')
+df = pandas.DataFrame({
+    'FIC101.PV' : [1.,2.,3.,4.,5.],
+    'FIC101.SP' : [2.,2.,2.,2.,2.],
+    'FIC 102' : [0.,10.,20.,30.,40.],
+    }, index=index)
+
+############################################################################
+# --- TEST:  tagnames are found in expressions                         --- #
+############################################################################
+texpr = TagExpression('FIC101.SP - FIC101.PV + `FIC 102`*2',df.columns)
+assert texpr.inputs == ['FIC101.SP','FIC101.PV','FIC 102'], \
+    'Wrong inputs {}'.format(texpr.inputs)
+
+assert numpy.allclose(evaluate(df,'FIC101.SP - FIC101.PV'),[1,0,-1,-2,-3]), \
+    'Difference is wrong'
+
+############################################################################
+# --- TEST:  functions and time                                        --- #
+############################################################################
+roc = evaluate(df,'diff(`FIC 102`)/diff(t)')
+assert numpy.isnan(roc[0]), 'First rate of change should be NaN'
+assert numpy.allclose(roc[1:],1.0), 'Rate of change is wrong'
+
+assert numpy.allclose(evaluate(df,'maximum(FIC101.PV,3)'),[3,3,3,4,5]), \
+    'maximum is wrong'
+
+############################################################################
+# --- TEST:  bad expressions                                           --- #
+############################################################################
+for expr in ['FIC101.PV + FOO','`FOO` * 2','FIC101.PV +','1 + 2',
+             '__import__("os")']:
+    try:
+        TagExpression(expr,df.columns)
+    except ValueError as e:
+        continue
+    assert False, 'Expression {} should fail'.format(expr)
+
+print("All tests passed")
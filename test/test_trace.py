@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+
+import sys
+sys.path.insert(0,'..')
+import proc_plot
+from proc_plot import trace
+
+import os
+import tempfile
+import numpy
+import pandas
+
+plot_manager = proc_plot.pp.plot_manager
+tool_panel = proc_plot.pp.tool_panel
+
+index = pandas.date_range('2020-01-01',periods=1000,freq='s')
+df = pandas.DataFrame(numpy.random.randn(1000,4),index=index,
+                      columns=['A.PV','A.SP','B.PV','C.PV'])
+proc_plot.set_dataframe(df)
+x = plot_manager.get_time()
+
+def state():
+    plots = [ list(pi.tagnames) for pi in plot_manager._plotinfo ]
+    xlim = tuple(plot_manager.backend.get_xlim(plot_manager._plotinfo[0].ax))
+    return plots, xlim, tool_panel.filter_textbox.text()
+
+############################################################################
+# --- TEST:  record a session                                          --- #
+############################################################################
+proc_plot.start_trace()
+tool_panel.plot_tag('A.PV',True)
+tool_panel.plot_tag('B.PV',True)
+tool_panel.plot_tag('C.PV',True)
+tool_panel.plot_tag('C.PV',False)
+tool_panel.filter_textbox.setText('pv')
+trace._set_xlim(proc_plot.pp,x[100],x[300])
+
+path = os.path.join(tempfile.mkdtemp(),'session.json')
+recorded = proc_plot.stop_trace(path)
+assert plot_manager.trace is None and tool_panel.trace is None, \
+    'Recording should stop'
+
+actions = [ (action,args) for t,action,args in recorded.events ]
+assert actions[:4] == [('add_remove_plot',['A.PV',True]),
+                       ('add_remove_plot',['B.PV',True]),
+                       ('add_remove_plot',['C.PV',True]),
+                       ('add_remove_plot',['C.PV',False])], \
+    'Wrong plot actions {}'.format(actions[:4])
+assert ('filter',['pv']) in actions, 'Filter should be recorded'
+assert actions[-1][0] == 'xlim' and numpy.allclose(actions[-1][1],[x[100],x[300]]), \
+    'Zoom should be recorded'
+times = [ t for t,action,args in recorded.events ]
+assert times == sorted(times), 'Times should increase'
+expected = state()
+
+############################################################################
+# --- TEST:  the saved trace loads unchanged                           --- #
+############################################################################
+loaded = trace.Trace.load(path)
+assert loaded.events == recorded.events, 'Loaded trace should be the same'
+
+############################################################################
+# --- TEST:  replay reproduces the session                             --- #
+############################################################################
+trace._clear(proc_plot.pp)
+tool_panel.filter_textbox.setText('')
+assert len(plot_manager._plotinfo) == 0, 'Plots should be cleared'
+
+report = trace.replay(path)
+assert list(report['action']) == [ action for action,args in actions ], \
+    'Every step should be replayed'
+assert (report['latency'] >= 0).all(), 'Latency should be measured'
+plots,xlim,text = state()
+assert plots == expected[0], 'Wrong plots after replay {}'.format(plots)
+assert numpy.allclose(xlim,expected[1]), 'Wrong xlim after replay'
+assert text == 'pv', 'Filter should be replayed'
+assert plot_manager.trace is None, 'Replay should not be recorded'
+
+print("All tests passed")